@@ -1,12 +0,0 @@
-# 検索機能のAPIエンドポイント
-# 依存: services.search_service
-def dummy_search():
-    pass
-
-
-# 追記された内容:
-# # 検索機能のAPIエンドポイント
-# # 依存: services.search_service
-# def dummy_search():
-#     pass
-# 
\ No newline at end of file
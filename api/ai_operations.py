@@ -1,23 +1,61 @@
 from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Dict, Any
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, AsyncIterator
+import json
+import logging
 from models.ai_request import (
-    AIAnalyzeRequest, AIUpdateRequest, AIRewriteRequest, AIAppendRequest, AIDependenciesRequest,
-    MultiAIAnalyzeRequest, MultiAIUpdateRequest, MultiAIRewriteRequest, MultiAIAppendRequest, MultiAIDependenciesRequest
+    AIAnalyzeRequest, AIUpdateRequest, AIProcessRequest, AIRewriteRequest, AIAppendRequest, AIDependenciesRequest,
+    MultiAIAnalyzeRequest, MultiAIUpdateRequest, MultiAIProcessRequest, MultiAIRewriteRequest, MultiAIAppendRequest, MultiAIDependenciesRequest
 )
 from services.ai_service import (
     ai_analyze, ai_reply, ai_rewrite, ai_append, ai_analyze_dependencies,
+    ai_analyze_stream, ai_reply_stream, ai_rewrite_stream, ai_append_stream,
     multi_ai_analyze, multi_ai_reply, multi_ai_rewrite, multi_ai_append, multi_ai_analyze_dependencies, ai_process, multi_ai_process
 )
 from utils.version_control import version_control
 from utils.file_utils import get_file_path
+from services.llm_cache import llm_cache
+import asyncio
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _sse_response(events: AsyncIterator[Dict[str, Any]], message: str) -> StreamingResponse:
+    """
+    サービス層のストリームイベントをServer-Sent Eventsとして返すレスポンスを作成する関数
+
+    - event: delta  data: {"text": ...}  生成中のテキスト差分
+    - event: done   data: {"message": ..., "result": ...}  非ストリーミング版と同じ形の最終結果
+    - event: error  data: {"detail": ...}
+    """
+    async def event_stream():
+        try:
+            async for event in events:
+                if event["type"] == "delta":
+                    yield _sse_event("delta", {"text": event["text"]})
+                else:
+                    yield _sse_event("done", {"message": message, "result": event["result"]})
+        except Exception as e:
+            logger.error(f"ストリーミング中にエラーが発生しました: {str(e)}")
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/ai-analyze", response_model=Dict[str, Any])
 async def analyze_file(request: AIAnalyzeRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_analyze(file_path, request.version_control, request.analysis_depth)
+        if request.stream:
+            return _sse_response(ai_analyze_stream(file_path, request.version_control, request.analysis_depth, use_cache=request.use_cache), "ファイルが正常に分析されました")
+        result = await ai_analyze(file_path, request.version_control, request.analysis_depth, use_cache=request.use_cache)
         return {"message": "ファイルが正常に分析されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -26,7 +64,7 @@ async def analyze_file(request: AIAnalyzeRequest):
 async def multi_analyze_files(request: MultiAIAnalyzeRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_analyze(file_paths, request.version_control, request.analysis_depth, request.execution_mode)
+        result = await multi_ai_analyze(file_paths, request.version_control, request.analysis_depth, request.execution_mode, use_cache=request.use_cache, max_in_flight=request.max_in_flight)
         return {"message": "ファイルが正常に分析されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -35,7 +73,9 @@ async def multi_analyze_files(request: MultiAIAnalyzeRequest):
 async def update_file(request: AIUpdateRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_reply(file_path, request.version_control, request.change_type, request.feature_request)
+        if request.stream:
+            return _sse_response(ai_reply_stream(file_path, request.version_control, request.change_type, request.feature_request, use_cache=request.use_cache), "ファイルが正常に更新されました")
+        result = await ai_reply(file_path, request.version_control, request.change_type, request.feature_request, use_cache=request.use_cache)
         return {"message": "ファイルが正常に更新されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -44,25 +84,25 @@ async def update_file(request: AIUpdateRequest):
 async def multi_update_files(request: MultiAIUpdateRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_reply(file_paths, request.version_control, request.change_type, request.execution_mode, request.feature_request)
+        result = await multi_ai_reply(file_paths, request.version_control, request.change_type, request.execution_mode, request.feature_request, use_cache=request.use_cache, max_in_flight=request.max_in_flight)
         return {"message": "複数のファイルが正常に更新されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/ai-process", response_model=Dict[str, Any])
-async def update_file(request: AIUpdateRequest):
+async def update_file(request: AIProcessRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_process(file_path, request.version_control, request.change_type, request.feature_request)
+        result = await ai_process(file_path, request.version_control, request.change_type, request.feature_request, use_cache=request.use_cache)
         return {"message": "ファイルが正常に更新されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/multi-ai-process", response_model=Dict[str, Any])
-async def multi_update_files(request: MultiAIUpdateRequest):
+async def multi_update_files(request: MultiAIProcessRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_process(file_paths, request.version_control, request.change_type, request.execution_mode, request.feature_request)
+        result = await multi_ai_process(file_paths, request.version_control, request.change_type, request.execution_mode, request.feature_request, use_cache=request.use_cache, max_in_flight=request.max_in_flight)
         return {"message": "複数のファイルが正常に更新されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -71,7 +111,9 @@ async def multi_update_files(request: MultiAIUpdateRequest):
 async def rewrite_file(request: AIRewriteRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_rewrite(file_path, request.version_control, request.rewrite_style)
+        if request.stream:
+            return _sse_response(ai_rewrite_stream(file_path, request.version_control, request.rewrite_style, use_cache=request.use_cache), "ファイルが正常に書き直されました")
+        result = await ai_rewrite(file_path, request.version_control, request.rewrite_style, use_cache=request.use_cache)
         return {"message": "ファイルが正常に書き直されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -80,7 +122,7 @@ async def rewrite_file(request: AIRewriteRequest):
 async def multi_rewrite_files(request: MultiAIRewriteRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_rewrite(file_paths, request.version_control, request.rewrite_style, request.execution_mode)
+        result = await multi_ai_rewrite(file_paths, request.version_control, request.rewrite_style, request.execution_mode, use_cache=request.use_cache, max_in_flight=request.max_in_flight)
         return {"message": "複数のファイルが正常に書き直されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -89,7 +131,9 @@ async def multi_rewrite_files(request: MultiAIRewriteRequest):
 async def append_to_file(request: AIAppendRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_append(file_path, request.version_control, request.append_location)
+        if request.stream:
+            return _sse_response(ai_append_stream(file_path, request.version_control, request.append_location, use_cache=request.use_cache), "コンテンツが正常に追加されました")
+        result = await ai_append(file_path, request.version_control, request.append_location, use_cache=request.use_cache)
         return {"message": "コンテンツが正常に追加されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -98,7 +142,7 @@ async def append_to_file(request: AIAppendRequest):
 async def multi_append_to_files(request: MultiAIAppendRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_append(file_paths, request.version_control, request.append_location, request.execution_mode)
+        result = await multi_ai_append(file_paths, request.version_control, request.append_location, request.execution_mode, use_cache=request.use_cache, max_in_flight=request.max_in_flight)
         return {"message": "複数のファイルにコンテンツが正常に追加されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -107,7 +151,7 @@ async def multi_append_to_files(request: MultiAIAppendRequest):
 async def analyze_dependencies(request: AIDependenciesRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await ai_analyze_dependencies(file_paths, request.version_control, request.analysis_scope)
+        result = await ai_analyze_dependencies(file_paths, request.version_control, request.analysis_scope, use_cache=request.use_cache, static_only=request.static_only)
         return {"message": "依存関係が正常に分析されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -116,7 +160,16 @@ async def analyze_dependencies(request: AIDependenciesRequest):
 async def multi_analyze_dependencies(request: MultiAIDependenciesRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_analyze_dependencies(file_paths, request.version_control, request.analysis_scope, request.execution_mode)
+        result = await multi_ai_analyze_dependencies(file_paths, request.version_control, request.analysis_scope, request.execution_mode, use_cache=request.use_cache, static_only=request.static_only)
         return {"message": "複数のファイルの依存関係が正常に分析されました", "result": result}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cache/stats", response_model=Dict[str, Any])
+async def get_cache_stats():
+    return await asyncio.to_thread(llm_cache.stats)
+
+@router.delete("/cache", response_model=Dict[str, Any])
+async def clear_cache():
+    await asyncio.to_thread(llm_cache.clear)
+    return {"message": "キャッシュが正常に削除されました"}
@@ -0,0 +1,40 @@
+# インポートグラフ（静的に解析したファイル間の依存関係）のAPIエンドポイント
+import logging
+from typing import Any, Dict
+from fastapi import APIRouter, HTTPException, Query
+from services.import_graph import get_import_graph
+from utils.file_operations import run_io
+from utils.file_utils import project_root
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/dependencies", tags=["Dependencies"])
+
+async def _graph(project_id: str):
+    try:
+        # 初回のみプロジェクト全体を走査する（以降はファイル監視で更新されたグラフを返す）
+        return await run_io(get_import_graph, project_root(project_id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/{project_id}", response_model=Dict[str, Any])
+async def dependency_graph(
+    project_id: str,
+    prefix: str = Query("", description="このディレクトリ配下のファイルだけを返す（プロジェクト内の相対パス）"),
+):
+    graph = await _graph(project_id)
+    return graph.graph(prefix)
+
+@router.get("/{project_id}/file", response_model=Dict[str, Any])
+async def file_dependencies(
+    project_id: str,
+    path: str = Query(..., description="プロジェクト内の相対パス"),
+    depth: int = Query(1, ge=1, le=20, description="間接的な依存関係をたどる段数"),
+):
+    graph = await _graph(project_id)
+    try:
+        return graph.file(path, depth)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -0,0 +1,64 @@
+# Git操作のAPIエンドポイント
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from models.git import GitCommitRequest, GitCommitInfo, GitStatus, GitDiffEntry
+from services.git_service import (
+    GitRepositoryNotFound, git_add, git_commit, git_has_staged_changes, git_status, git_diff, git_log
+)
+from utils.file_utils import project_root
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/git", tags=["Git"])
+
+@router.get("/status", response_model=GitStatus)
+async def status(project_id: str):
+    try:
+        return await git_status(project_root(project_id))
+    except (GitRepositoryNotFound, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/diff", response_model=List[GitDiffEntry])
+async def diff(
+    project_id: str,
+    path: Optional[str] = Query(None, description="プロジェクト内の相対パス"),
+    staged: bool = Query(False, description="Trueの場合はHEADとインデックスの差分"),
+    commit: Optional[str] = Query(None, description="指定したコミットで入った変更を返す"),
+):
+    try:
+        return await git_diff(project_root(project_id), path, staged, commit)
+    except (GitRepositoryNotFound, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/log", response_model=List[GitCommitInfo])
+async def log(
+    project_id: str,
+    path: Optional[str] = Query(None, description="プロジェクト内の相対パス"),
+    limit: int = Query(20, ge=1, le=500),
+    skip: int = Query(0, ge=0),
+):
+    try:
+        return await git_log(project_root(project_id), path, limit, skip)
+    except (GitRepositoryNotFound, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/commit", response_model=GitCommitInfo)
+async def commit(request: GitCommitRequest):
+    try:
+        repo_path = project_root(request.project_id)
+        if request.file_paths:
+            await git_add(repo_path, request.file_paths)
+        if not await git_has_staged_changes(repo_path):
+            raise HTTPException(status_code=400, detail="コミットする変更がありません")
+        return await git_commit(repo_path, request.message)
+    except (GitRepositoryNotFound, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
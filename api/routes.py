@@ -5,8 +5,11 @@ from models.code_execution import CodeExecution
 from services.anthropic_service import generate_text_anthropic
 from services.gemini_service import generate_text_gemini
 from services.openai_service import generate_text_gpt4o
-from services.file_service import save_file, load_file, get_directory_structure, get_generated_dirs
-from utils.file_operations import execute_python
+from services.llm_provider import llm_router, LLMRouterError
+from models.ai_request import GenerateRequest
+from services.file_service import save_file, load_file, get_directory_structure, get_generated_dirs, stream_directory_structure
+from utils.file_operations import iter_file_chunks, RangeNotSatisfiable
+from services.code_execution import execute_python, sandbox_pool
 import shutil
 import subprocess
 
@@ -16,9 +19,13 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse
+from urllib.parse import quote
+import mimetypes
+from typing import Optional
 from services.file_service import FileService
-from models.file import FileModel, FileEdit
+from models.file import FileModel, FileEdit, FilePatch
 
 router = APIRouter(prefix="/api/files", tags=["files"])
 file_service = FileService(upload_dir="../")  # ベースディレクトリを設定
@@ -46,6 +53,26 @@ async def get_file_content(project_id: str, file_path: str):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/download/{project_id}/{file_path:path}")
+async def download_file(project_id: str, file_path: str, range_header: Optional[str] = Header(None, alias="Range")):
+    try:
+        full_path, file_size, start, end, partial = await file_service.open_file_range(project_id, file_path, range_header)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    except RangeNotSatisfiable as e:
+        raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{e.file_size}"})
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1 if file_size else 0),
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(os.path.basename(file_path))}",
+    }
+    if partial:
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    body = iter_file_chunks(full_path, start, end) if file_size else iter(())
+    return StreamingResponse(body, status_code=206 if partial else 200, media_type=media_type, headers=headers)
+
 @router.put("/edit/{filename}")
 async def edit_file(filename: str, edit: FileEdit):
     try:
@@ -56,6 +83,16 @@ async def edit_file(filename: str, edit: FileEdit):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.patch("/patch/{filename}")
+async def patch_file(filename: str, patch: FilePatch):
+    try:
+        await file_service.patch_file(filename, patch.edits)
+        return {"message": f"File {filename} patched successfully", "edits": len(patch.edits)}
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/append/{filename}")
 async def append_to_file(filename: str, content: str = Query(...)):
     try:
@@ -85,43 +122,91 @@ async def hello():
     return {"message": "hello"}
 
 @router.post("/generate_claude")
-async def generate_text(prompt: str):
-    return await generate_text_anthropic(prompt)
+async def generate_text(prompt: str, use_cache: bool = True):
+    return await generate_text_anthropic(prompt, use_cache=use_cache)
 
 @router.post("/generate_gemini")
-async def generate_text_gemini_route(prompt: str):
-    return await generate_text_gemini(prompt)
+async def generate_text_gemini_route(prompt: str, use_cache: bool = True):
+    return await generate_text_gemini(prompt, use_cache=use_cache)
 
 @router.post("/generate_gpt4o")
-async def generate_text_gpt4o_route(prompt: str):
-    return await generate_text_gpt4o(prompt)
+async def generate_text_gpt4o_route(prompt: str, use_cache: bool = True):
+    return await generate_text_gpt4o(prompt, use_cache=use_cache)
+
+@router.post("/generate")
+async def generate_text_route(request: GenerateRequest):
+    """
+    設定された選択方針でプロバイダを選んで生成する（失敗時は別のプロバイダで再試行する）
+    """
+    try:
+        return await llm_router.generate(
+            request.prompt, policy=request.policy, providers=request.providers,
+            use_cache=request.use_cache, hedge_after=request.hedge_after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LLMRouterError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+@router.get("/generate/providers")
+async def generate_providers_route():
+    """
+    プロバイダごとのレイテンシ・失敗数と、ルーターの設定を返す
+    """
+    return llm_router.stats()
 
 @router.post("/execute")
 async def execute_python_route(code_execution: CodeExecution):
     return await execute_python(code_execution.code)
 
+@router.post("/execute/stream")
+async def execute_python_stream_route(code_execution: CodeExecution):
+    """
+    コードを実行し、出力をNDJSON（1行1イベント）で逐次返す
+    """
+    async def events():
+        async for event in sandbox_pool.run_stream(code_execution.code):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @router.get("/load_file")
 async def load_file_route(filename: str):
     return await load_file(filename)
 
 @router.get("/directory_structure")
-async def get_directory_structure_route(path_type: str):
-    logger.info(f"ディレクトリ構造の取得リクエストを受信: path_type={path_type}")
+async def get_directory_structure_route(
+    path_type: str,
+    path: Optional[str] = None,
+    depth: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=5000),
+):
+    logger.info(f"ディレクトリ構造の取得リクエストを受信: path_type={path_type}, path={path}, depth={depth}")
     try:
-        result = await get_directory_structure(path_type)
+        result = await get_directory_structure(path_type, path, depth, cursor, limit)
         logger.info(f"ディレクトリ構造の取得に成功: path_type={path_type}")
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"ディレクトリ構造の取得中にエラーが発生: path_type={path_type}, エラー={str(e)}")
         raise HTTPException(status_code=500, detail="ディレクトリ構造の取得に失敗しました")
 
+@router.get("/directory_structure/stream")
+async def stream_directory_structure_route(path_type: str, path: Optional[str] = None, depth: Optional[int] = Query(None, ge=1)):
+    logger.info(f"ディレクトリ構造のストリーミングリクエストを受信: path_type={path_type}, path={path}, depth={depth}")
+    lines = stream_directory_structure(path_type, path, depth)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
 @router.get("/generated-dirs")
-async def get_generated_dirs_route():
+async def get_generated_dirs_route(cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=5000)):
     logger.info("生成されたディレクトリの取得を開始します")
     try:
-        result = await get_generated_dirs()
+        result = await get_generated_dirs(cursor, limit)
         logger.info(f"生成されたディレクトリの取得に成功しました: {result}")
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"生成されたディレクトリの取得中にエラーが発生しました: {str(e)}")
         raise HTTPException(status_code=500, detail="ディレクトリの取得に失敗しました")
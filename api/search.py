@@ -0,0 +1,35 @@
+# 全文検索のAPIエンドポイント
+import logging
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from services.search_service import search_index
+from utils.file_operations import run_io
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/search", tags=["Search"])
+
+@router.get("", response_model=Dict[str, Any])
+async def search(
+    q: str = Query(..., min_length=1, description="検索する文字列（regex=true の場合は正規表現）"),
+    project: Optional[str] = Query(None, description="検索するプロジェクトID（babel または ~/babel_generated 配下のディレクトリ名）"),
+    regex: bool = Query(False, description="q を正規表現として扱う"),
+    case_sensitive: bool = Query(False, description="大文字と小文字を区別する"),
+    path: Optional[List[str]] = Query(None, description="対象に含めるパスのglob（複数指定可。* は / にも一致する）"),
+    exclude: Optional[List[str]] = Query(None, description="対象から除外するパスのglob（複数指定可）"),
+    limit: int = Query(50, ge=1, le=500, description="返すファイル数の上限"),
+    max_matches: int = Query(5, ge=1, le=100, description="1ファイルあたりに返す一致行数の上限"),
+):
+    # 初回のみ監視とバックグラウンドでの走査を開始する（走査が終わるまでは結果が欠ける場合がある）
+    search_index.start()
+    try:
+        return await run_io(
+            search_index.search, q, project=project, regex=regex, case_sensitive=case_sensitive,
+            paths=path, exclude=exclude, limit=limit, max_matches=max_matches
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/stats", response_model=Dict[str, Any])
+async def search_stats():
+    return await run_io(search_index.stats)
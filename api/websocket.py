@@ -1,5 +1,8 @@
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
+import json
 import logging
+from typing import Optional
+from utils.ws_clients import ConnectionManager
 
 # ロガーの設定を変更して、全てのログレベルを出力するようにします
 logger = logging.getLogger(__name__)
@@ -12,33 +15,66 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
 
-active_connections = []
+# 接続中のクライアント（クライアントごとに送信キューと購読条件を持つ）
+connection_manager = ConnectionManager()
 
 async def websocket_endpoint(websocket: WebSocket):
     logger.info("WebSocket接続を受け入れます")
-    await websocket.accept()
-    active_connections.append(websocket)
-    logger.info(f"アクティブな接続数: {len(active_connections)}")
+    connection = await connection_manager.connect(websocket)
+    logger.info(f"アクティブな接続数: {len(connection_manager)}")
     try:
         while True:
             message = await websocket.receive_text()
             logger.debug(f"受信したメッセージ: {message}")
+            if not connection_manager.handle_message(connection, message):
+                relay_progress(connection, message)
+    except WebSocketDisconnect:
+        logger.info("WebSocket接続が切断されました")
     except Exception as e:
         logger.error(f"WebSocket接続中にエラーが発生: {str(e)}", exc_info=True)
     finally:
-        active_connections.remove(websocket)
-        logger.info(f"WebSocket接続が閉じられました。残りの接続数: {len(active_connections)}")
+        await connection_manager.disconnect(connection)
+        logger.info(f"WebSocket接続が閉じられました。残りの接続数: {len(connection_manager)}")
 
-async def send_to_frontend(message: str):
+def _merge_output(queued: dict, message: dict):
+    # 送信キューが満杯の場合は、同じプロジェクト宛ての出力を1つのメッセージにつなげる
+    if queued.get("type") != "zoltraak_output" or queued.get("project") != message.get("project"):
+        return None
+    return {**queued, "content": queued["content"] + "\n" + message["content"]}
+
+def _merge_progress(queued: dict, message: dict):
+    # 送信キューが満杯の場合は、同じファイルの進捗を最新のものに置き換える
+    if queued.get("type") != "grimoire_progress":
+        return None
+    if (queued.get("project"), queued.get("file")) != (message.get("project"), message.get("file")):
+        return None
+    return message
+
+def relay_progress(connection, text: str) -> bool:
+    """
+    グリモア生成スクリプト（grimoires/meta/domain_exe.py）から届いた grimoire_progress を他の接続に中継する関数
+
+    送信元には送り返さない。project を購読している接続（または何も購読していない接続）にだけ送る。
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return False
+    if not isinstance(data, dict) or data.get("type") != "grimoire_progress":
+        return False
+    connection_manager.broadcast(data, project=data.get("project"), merge=_merge_progress, exclude=connection)
+    return True
+
+async def send_to_frontend(message: str, project: Optional[str] = None):
+    """
+    zoltraak_output をフロントエンドに送信する関数
+
+    project を指定した場合は、そのプロジェクトを購読している（または何も購読していない）接続にだけ送る。
+    送信は接続ごとのキューに積むだけで、遅いクライアントの送信完了は待たない。
+    """
     logger.info(f"フロントエンドへの送信を開始: {message}")
-    for connection in active_connections:
-        try:
-            await connection.send_json({
-                "type": "zoltraak_output",
-                "content": message
-            })
-            logger.debug(f"フロントエンドに送信成功: {message}")
-        except Exception as e:
-            logger.error(f"フロントエンドへの送信中にエラーが発生: {str(e)}", exc_info=True)
-    
-    logger.info(f"フロントエンドへの送信完了。送信先の接続数: {len(active_connections)}")
\ No newline at end of file
+    payload = {"type": "zoltraak_output", "content": message}
+    if project is not None:
+        payload["project"] = project
+    count = connection_manager.broadcast(payload, project=project, merge=_merge_output)
+    logger.info(f"フロントエンドへの送信完了。送信先の接続数: {count}")
@@ -5,4 +5,105 @@ load_dotenv()
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
\ No newline at end of file
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# プロバイダごとの生成モデル
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-5-sonnet-20240620")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+
+# Anthropic HTTPクライアントのコネクションプール設定
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "100"))
+ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS", "20"))
+ANTHROPIC_KEEPALIVE_EXPIRY = float(os.getenv("ANTHROPIC_KEEPALIVE_EXPIRY", "30"))
+ANTHROPIC_TIMEOUT = float(os.getenv("ANTHROPIC_TIMEOUT", "600"))
+
+# プロバイダごとの同時リクエスト数の上限
+LLM_MAX_CONCURRENCY = {
+    "anthropic": int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "16")),
+    "gemini": int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+}
+
+# AI生成結果のキャッシュ設定
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(os.path.expanduser("~"), "babel_generated", ".cache"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 60 * 60)))
+
+# execution_mode="bounded" の同時実行数とプロバイダごとのレート制限（リクエスト/分、0以下で無制限）
+MULTI_AI_MAX_IN_FLIGHT = int(os.getenv("MULTI_AI_MAX_IN_FLIGHT", "8"))
+LLM_RATE_LIMIT_RPM = {
+    "anthropic": float(os.getenv("ANTHROPIC_RATE_LIMIT_RPM", "50")),
+    "gemini": float(os.getenv("GEMINI_RATE_LIMIT_RPM", "60")),
+    "openai": float(os.getenv("OPENAI_RATE_LIMIT_RPM", "500")),
+}
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "5"))
+
+# /generate のプロバイダ選択
+# 選択方針（cheapest / p95_latency / first_token）、候補にするプロバイダ（同じ評価の場合はこの順）、
+# 1回の呼び出しのタイムアウト（秒）、ヘッジリクエストを送るまでの時間（秒、0で無効）、
+# 失敗したプロバイダを候補の後ろに回す時間（秒）、料金の見積もりに使う出力トークン数
+LLM_ROUTER_POLICY = os.getenv("LLM_ROUTER_POLICY", "cheapest")
+LLM_ROUTER_PROVIDERS = [p.strip() for p in os.getenv("LLM_ROUTER_PROVIDERS", "anthropic,openai,gemini").split(",") if p.strip()]
+LLM_ROUTER_TIMEOUT = float(os.getenv("LLM_ROUTER_TIMEOUT", "120"))
+LLM_ROUTER_HEDGE_AFTER = float(os.getenv("LLM_ROUTER_HEDGE_AFTER", "0"))
+LLM_ROUTER_COOLDOWN = float(os.getenv("LLM_ROUTER_COOLDOWN", "30"))
+LLM_ROUTER_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_ROUTER_EXPECTED_OUTPUT_TOKENS", "1000"))
+# プロバイダごとの100万トークンあたりの料金（USD、入力, 出力）
+LLM_PRICES = {
+    "anthropic": (float(os.getenv("ANTHROPIC_PRICE_INPUT", "3")), float(os.getenv("ANTHROPIC_PRICE_OUTPUT", "15"))),
+    "gemini": (float(os.getenv("GEMINI_PRICE_INPUT", "3.5")), float(os.getenv("GEMINI_PRICE_OUTPUT", "10.5"))),
+    "openai": (float(os.getenv("OPENAI_PRICE_INPUT", "5")), float(os.getenv("OPENAI_PRICE_OUTPUT", "15"))),
+}
+
+# AIに渡すコンテキストのトークン予算と、これより長い文字列リテラルを省略する長さ（文字）
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "100000"))
+CONTEXT_MAX_STRING_LITERAL = int(os.getenv("CONTEXT_MAX_STRING_LITERAL", "200"))
+
+# ファイルI/O専用スレッドプールのワーカー数と、大きなファイルを読み書きする際のチャンクサイズ
+FILE_IO_WORKERS = int(os.getenv("FILE_IO_WORKERS", "8"))
+FILE_IO_CHUNK_SIZE = int(os.getenv("FILE_IO_CHUNK_SIZE", str(1024 * 1024)))
+
+# ファイル変更通知のデバウンス時間（秒）、最大待ち時間（秒）、クライアントごとの送信タイムアウト（秒）
+FILE_WATCH_DEBOUNCE = float(os.getenv("FILE_WATCH_DEBOUNCE", "0.2"))
+FILE_WATCH_MAX_DELAY = float(os.getenv("FILE_WATCH_MAX_DELAY", "1.0"))
+FILE_WATCH_SEND_TIMEOUT = float(os.getenv("FILE_WATCH_SEND_TIMEOUT", "2.0"))
+
+# WebSocketクライアントごとの送信キューの上限（件）と送信タイムアウト（秒）
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "100"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+# コード実行サンドボックスの設定
+# ワーカー数、ワーカーを作り直すまでの実行回数、CPU時間（秒）、メモリ上限（MB）、実行時間の上限（秒）、出力の上限（文字）
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", "2"))
+SANDBOX_MAX_RUNS_PER_WORKER = int(os.getenv("SANDBOX_MAX_RUNS_PER_WORKER", "50"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "30"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "1024"))
+SANDBOX_WALL_TIMEOUT = float(os.getenv("SANDBOX_WALL_TIMEOUT", "60"))
+SANDBOX_MAX_OUTPUT = int(os.getenv("SANDBOX_MAX_OUTPUT", str(1024 * 1024)))
+
+# バージョン管理のコミットをまとめる時間（秒）。この間に記録された変更は1つのコミットになる
+VERSION_CONTROL_BATCH_WINDOW = float(os.getenv("VERSION_CONTROL_BATCH_WINDOW", "0.5"))
+
+# 全文検索インデックスの保存先と、インデックスに含めるファイルサイズの上限（バイト）
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(os.path.expanduser("~"), "babel_generated", ".cache", "search_index.sqlite3"))
+SEARCH_MAX_FILE_SIZE = int(os.getenv("SEARCH_MAX_FILE_SIZE", str(1024 * 1024)))
+
+# ai_reply / ai_process のプロンプトに添える関連コードの検索設定
+# 1チャンクの行数、特徴量をハッシュする次元数、取り出すチャンク数、これより類似度の低いチャンクは使わない下限、
+# トークン予算（0で無効）、索引に含めるファイルサイズの上限（バイト）
+RETRIEVAL_CHUNK_LINES = int(os.getenv("RETRIEVAL_CHUNK_LINES", "40"))
+RETRIEVAL_DIMENSIONS = int(os.getenv("RETRIEVAL_DIMENSIONS", str(2 ** 20)))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "12"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.05"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "8000"))
+RETRIEVAL_MAX_FILE_SIZE = int(os.getenv("RETRIEVAL_MAX_FILE_SIZE", str(256 * 1024)))
+
+# ディレクトリのツリー表示の上限
+# 表示する階層の深さ、全体の行数、1フォルダあたりの件数、折りたたんだフォルダのファイル数を数える上限
+TREE_MAX_DEPTH = int(os.getenv("TREE_MAX_DEPTH", "8"))
+TREE_MAX_ENTRIES = int(os.getenv("TREE_MAX_ENTRIES", "1000"))
+TREE_MAX_CHILDREN = int(os.getenv("TREE_MAX_CHILDREN", "100"))
+TREE_COUNT_LIMIT = int(os.getenv("TREE_COUNT_LIMIT", "10000"))
@@ -7,6 +7,9 @@ from fastapi import FastAPI, WebSocket, HTTPException, Body
 from fastapi.websockets import WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from config.settings import FILE_WATCH_DEBOUNCE, FILE_WATCH_MAX_DELAY, FILE_WATCH_SEND_TIMEOUT
+from utils.file_changes import ChangeCoalescer, merge_change_messages
+from utils.ws_clients import ConnectionManager
 
 app = FastAPI()
 
@@ -22,32 +25,42 @@ app.add_middleware(
 # ロギングの設定
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
-# グローバル変数としてconnected_clientsを定義
-connected_clients = set()
+# 接続中のクライアント（クライアントごとに送信キューと購読条件を持つ）
+connection_manager = ConnectionManager(send_timeout=FILE_WATCH_SEND_TIMEOUT)
 file_handler = None
+coalescer = None
+babel_generated_dir = os.path.join(os.path.expanduser("~"), "babel_generated")
 
 class FileChangeHandler(FileSystemEventHandler):
-    def __init__(self, watched_dirs):
+    """
+    watchdogのイベントをイベントループに渡すハンドラ
+
+    watchdogのスレッドでは共有状態を触らず、call_soon_threadsafe でループ側の ChangeCoalescer に渡す。
+    """
+
+    def __init__(self, watched_dirs, coalescer: ChangeCoalescer):
         logging.info("FileChangeHandlerが初期化されました")
-        self.changes = set()
         self.watched_dirs = watched_dirs
+        self.coalescer = coalescer
 
     def on_any_event(self, event):
         logging.debug(f"イベント検知: {event.event_type} - {event.src_path}")
-        if any(event.src_path.startswith(dir) for dir in self.watched_dirs):
-            self.changes.add((event.event_type, event.src_path))
-            logging.info(f"変更検知: {event.event_type} - {event.src_path}")
-        else:
+        if not any(event.src_path.startswith(dir) for dir in self.watched_dirs):
             logging.debug(f"監視対象外のパス: {event.src_path}")
+            return
+        if event.event_type == "moved":
+            # 移動は移動元の削除と移動先の作成として扱う
+            self.coalescer.add_threadsafe("deleted", event.src_path, event.is_directory)
+            self.coalescer.add_threadsafe("created", event.dest_path, event.is_directory)
+        else:
+            self.coalescer.add_threadsafe(event.event_type, event.src_path, event.is_directory)
 
-def setup_file_watcher():
-    global file_handler
-    home_dir = os.path.expanduser("~")
-    babel_generated_dir = os.path.join(home_dir, "babel_generated")
-
+def setup_file_watcher(loop: asyncio.AbstractEventLoop):
+    global file_handler, coalescer
     watched_dirs = [babel_generated_dir]
     logging.info(f"監視対象ディレクトリ: {watched_dirs}")
-    file_handler = FileChangeHandler(watched_dirs)
+    coalescer = ChangeCoalescer(broadcast_changes, FILE_WATCH_DEBOUNCE, FILE_WATCH_MAX_DELAY, loop)
+    file_handler = FileChangeHandler(watched_dirs, coalescer)
     observer = Observer()
 
     for dir in watched_dirs:
@@ -58,35 +71,49 @@ def setup_file_watcher():
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    global connected_clients
-    await websocket.accept()
-    connected_clients.add(websocket)
+    connection = await connection_manager.connect(websocket)
     logging.info(f"新しいWebSocket接続: {websocket.client}")
     try:
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive_text()
+            connection_manager.handle_message(connection, message)
     except WebSocketDisconnect:
-        connected_clients.remove(websocket)
         logging.info(f"WebSocket接続が切断されました: {websocket.client}")
+    finally:
+        await connection_manager.disconnect(connection)
 
-async def broadcast_changes():
-    logging.info("変更ブロードキャストタスクを開始しました")
-    while True:
-        if file_handler.changes:
-            changes = list(file_handler.changes)
-            message = {"changes": [{"type": change[0], "path": change[1]} for change in changes]}
-            logging.info(f"変更をブロードキャスト: {message}")
-            file_handler.changes.clear()
-            for client in connected_clients:
-                await client.send_json(message)
-                logging.debug(f"クライアントに変更を送信: {client.client}")
-        await asyncio.sleep(1)  # 1秒間隔で変更をチェック
+def split_project_path(path: str):
+    """
+    監視対象のパスを (プロジェクト名, プロジェクト内の相対パス) に分ける関数
+    """
+    rel_path = os.path.relpath(path, babel_generated_dir).replace(os.sep, '/')
+    project, _, project_path = rel_path.partition('/')
+    return project, project_path
+
+def broadcast_changes(changes):
+    """
+    まとめた変更を購読条件に合うクライアントの送信キューに積む関数
+
+    送信は接続ごとの書き込みタスクが行うため、遅いクライアントが他のクライアントを待たせることはない。
+    キューが満杯の場合は送信待ちの変更通知にまとめる。
+    """
+    logging.info(f"変更をブロードキャスト: {len(changes)}件")
+    for connection in list(connection_manager.connections):
+        if connection.closed:
+            connection_manager.connections.discard(connection)
+            continue
+        filtered = [
+            {"type": change["type"], "path": change["path"]}
+            for change in changes
+            if connection.wants(*split_project_path(change["path"]))
+        ]
+        if filtered:
+            connection.enqueue({"changes": filtered}, merge_change_messages)
 
 @app.on_event("startup")
 async def startup_event():
     logging.info("アプリケーションが起動しました")
-    setup_file_watcher()
-    asyncio.create_task(broadcast_changes())
+    setup_file_watcher(asyncio.get_running_loop())
 
 @app.post("/api/save-file")
 async def save_file(project_id: str = Body(...), file_path: str = Body(...), content: str = Body(...)):
@@ -1,15 +1,24 @@
 import os
 import logging
+import tempfile
 import argparse
 from tqdm import tqdm
 import concurrent.futures
 import importlib
 
-from utils.utils import generate_response, normal
+from utils.utils import stream_response, CodeBlockExtractor, worker_count
+from utils.file_operations import set_replacement_mode
+from utils.manifest import BuildManifest
+from utils.progress import ProgressPublisher
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 生成に使うモデルとパラメータ（変更するとすべてのファイルが生成し直しの対象になる）
+MODEL = "claude-3-5-sonnet-20240620"
+MAX_TOKENS = 8192
+TEMPERATURE = 0.5
+
 def import_modules(saas_name):
     concept = importlib.import_module(f"{saas_name}.def_concept").concept
     dir_frontend = importlib.import_module(f"{saas_name}.def_concept").dir_frontend
@@ -18,45 +27,122 @@ def import_modules(saas_name):
     constraints = importlib.import_module(f"{saas_name}.def_constraints").constraints
     return concept, dir_frontend, files, root_dir, constraints
 
-def create_file(directory, filename, prompt, file_number, concept, dir_frontend, constraints, root_dir, progress_bar, total_files):
-    file_path = os.path.join(root_dir, directory)
-    os.makedirs(file_path, exist_ok=True)  # ディレクトリが存在しない場合は作成
-    file_path = os.path.join(file_path, filename)
-    with open(file_path, "w", encoding="utf-8") as f:
-        model = "claude-3-5-sonnet-20240620"
-        full_prompt = f'''
-        {concept}\n{dir_frontend}\n{constraints}\n上記の内容をもとにして{prompt}
-        '''
-        max_tokens = 8192
-        temperature = 0.5
-        
-        response = generate_response(model, full_prompt, max_tokens, temperature)
-        formatted_response = normal(response)
-        f.write(formatted_response)
+def build_system_prompt(concept, dir_frontend, constraints):
+    """
+    全ファイルで共通の前提（要件定義書・ディレクトリ構成・制約）をまとめる関数
+
+    この部分はプロンプトキャッシュの対象になるため、ファイルごとに変わる内容を含めないこと。
+    """
+    return f"{concept}\n{dir_frontend}\n{constraints}"
+
+def strip_shared_prefix(prompt, concept, dir_frontend):
+    """
+    def_domain.py の各プロンプトの先頭に埋め込まれている concept + dir_frontend を取り除く関数
+
+    同じ内容はシステムプロンプトで送るため、ユーザープロンプトでは重複させない。
+    """
+    for prefix in (concept + dir_frontend, concept):
+        if prefix and prompt.startswith(prefix):
+            return prompt[len(prefix):]
+    return prompt
+
+def create_file(directory, filename, prompt, file_number, system_prompt, root_dir, progress_bar, total_files, manifest, input_hash, progress):
+    output_dir = os.path.join(root_dir, directory)
+    os.makedirs(output_dir, exist_ok=True)  # ディレクトリが存在しない場合は作成
+    file_path = os.path.join(output_dir, filename)
+    key = manifest.key(directory, filename)
+    full_prompt = f"上記の内容をもとにして{prompt}"
+    progress.publish(key, "started")
+
+    # 生成中は一時ファイルに書き込み、完了してから置き換える（失敗しても空や書きかけのファイルを残さない）
+    fd, temp_path = tempfile.mkstemp(dir=output_dir, prefix=f".{filename}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            extractor = CodeBlockExtractor()
+            received = 0
+            for text in stream_response(MODEL, full_prompt, MAX_TOKENS, TEMPERATURE, system=system_prompt):
+                received += len(text)
+                f.write(extractor.feed(text))
+                progress.publish(key, "streaming", chars=received)
+            f.write(extractor.finish())
+        set_replacement_mode(temp_path, file_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    manifest.mark_done(directory, filename, input_hash)
+    progress.publish(key, "done", chars=received)
     
     progress_bar.update(1)
     print(f"{file_number}枚目/{total_files}が完了しました。")
 
-def main(saas_name):
+def main(saas_name, force=False, dry_run=False):
     concept, dir_frontend, files, root_dir, constraints = import_modules(saas_name)
-    
+    system_prompt = build_system_prompt(concept, dir_frontend, constraints)
+    tasks = []
+    for i, (directory, filename, prompt) in enumerate(files):
+        prompt = strip_shared_prefix(prompt, concept, dir_frontend)
+        input_hash = BuildManifest.input_hash(
+            model=MODEL, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, system=system_prompt, prompt=prompt
+        )
+        tasks.append((directory, filename, prompt, i + 1, input_hash))
+
+    # 入力が変わっていない生成済みのファイルは生成しない（--force の場合はすべて生成する）
+    manifest = BuildManifest(root_dir)
+    pending = []
+    for task in tasks:
+        reason = "--force" if force else manifest.rebuild_reason(task[0], task[1], task[4])
+        if reason:
+            pending.append(task)
+            if dry_run:
+                print(f"{os.path.join(task[0], task[1])}: {reason}")
+
+    if dry_run:
+        print(f"生成対象: {len(pending)}/{len(tasks)}ファイル")
+        return
+    if len(pending) < len(tasks):
+        print(f"{len(tasks) - len(pending)}ファイルは入力が変わっていないためスキップします。")
+
     os.makedirs(root_dir, exist_ok=True)
 
     # プログレスバーの初期化
-    progress_bar = tqdm(total=len(files), unit="files")
+    progress_bar = tqdm(total=len(files), initial=len(tasks) - len(pending), unit="files")
+    # ファイルごとの進捗を babel の /ws に送る（フロントエンドで生成状況を表示できるようにする）
+    progress = ProgressPublisher(os.path.basename(os.path.normpath(root_dir)), len(files), completed=len(tasks) - len(pending))
+    failed = []
+
+    def run(task):
+        directory, filename, prompt, file_number, input_hash = task
+        try:
+            create_file(directory, filename, prompt, file_number, system_prompt, root_dir, progress_bar, len(files), manifest, input_hash, progress)
+        except Exception as e:
+            logger.error(f"{directory}/{filename}の生成に失敗しました: {str(e)}")
+            failed.append(f"{directory}/{filename}")
+            progress.publish(manifest.key(directory, filename), "failed", error=str(e))
+
+    # 最初の1ファイルでプロンプトキャッシュを作成してから残りを並列実行する
+    # （同時に送ると全リクエストがキャッシュミスになり、共通部分がファイル数分送られるため）
+    if pending:
+        run(pending[0])
 
-    # 並列実行のためのスレッドプールを作成
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(create_file, directory, filename, prompt, i+1, concept, dir_frontend, constraints, root_dir, progress_bar, len(files)) 
-                   for i, (directory, filename, prompt) in enumerate(files)]
-        for future in concurrent.futures.as_completed(futures):
-            future.result()
+    # レート制限から決めたワーカー数で並列実行する（リクエスト間隔とリトライは stream_response 側で制御）
+    if len(pending) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=worker_count(len(pending) - 1)) as executor:
+            list(executor.map(run, pending[1:]))
 
     progress_bar.close()
+    progress.close()
+    if failed:
+        print(f"{len(failed)}ファイルの生成に失敗しました: {', '.join(failed)}")
+        print("もう一度実行すると、完了していないファイルと入力が変わったファイルだけを生成します。")
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="SaaSアプリケーション生成スクリプト")
     parser.add_argument("-s", "--saas_name", required=True, help="SaaS名を指定してください")
+    parser.add_argument("--force", action="store_true", help="入力が変わっていないファイルも含めてすべて生成し直す")
+    parser.add_argument("--dry-run", action="store_true", help="生成し直す対象と理由を表示するだけで生成しない")
     args = parser.parse_args()
     
-    main(args.saas_name)
+    main(args.saas_name, force=args.force, dry_run=args.dry_run)
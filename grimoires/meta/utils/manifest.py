@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+import time
+import threading
+import tempfile
+
+
+class BuildManifest:
+    """
+    生成済みファイルを記録するマニフェスト（root_dir/.grimoire_manifest.json）
+
+    ファイルごとに生成時の入力（共通の前提・プロンプト・モデルなど）のハッシュを記録し、
+    再実行時は入力が変わったファイルと完了していないファイルだけを生成し直せるようにする。
+    書き込みは一時ファイルへの書き込みとリネームで行い、書きかけのマニフェストが残らないようにする。
+    """
+
+    FILENAME = ".grimoire_manifest.json"
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.path = os.path.join(root_dir, self.FILENAME)
+        self._lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(directory, filename):
+        return f"{directory}/{filename}".strip("/")
+
+    @staticmethod
+    def input_hash(**inputs):
+        """
+        生成結果に影響する入力からハッシュを計算する関数
+        """
+        payload = json.dumps(inputs, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def rebuild_reason(self, directory, filename, input_hash):
+        """
+        生成し直す必要がある場合はその理由を、不要な場合は None を返す関数
+        """
+        entry = self.entries.get(self.key(directory, filename))
+        if not entry or entry.get("status") != "done":
+            return "未生成"
+        if not os.path.exists(os.path.join(self.root_dir, directory, filename)):
+            return "出力ファイルがありません"
+        if entry.get("input_hash") != input_hash:
+            return "入力が変更されました"
+        return None
+
+    def mark_done(self, directory, filename, input_hash, **info):
+        with self._lock:
+            self.entries[self.key(directory, filename)] = {
+                "status": "done", "input_hash": input_hash, "completed_at": time.time(), **info
+            }
+            self._save()
+
+    def _save(self):
+        os.makedirs(self.root_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root_dir, prefix=".grimoire_manifest.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"files": self.entries}, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
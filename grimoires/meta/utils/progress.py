@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+try:
+    from websockets.sync.client import connect
+except ImportError:
+    connect = None
+
+logger = logging.getLogger(__name__)
+
+# 進捗の送信先（babel の /ws）。空にすると送信しない
+GRIMOIRE_PROGRESS_URL = os.environ.get("GRIMOIRE_PROGRESS_URL", "ws://localhost:8000/ws")
+# 生成中の進捗をファイルごとに送る最短間隔（秒）
+GRIMOIRE_PROGRESS_INTERVAL = float(os.environ.get("GRIMOIRE_PROGRESS_INTERVAL", "0.5"))
+
+
+class ProgressPublisher:
+    """
+    ファイルごとの生成状況を babel の /ws に grimoire_progress として送るクラス
+
+    送信は専用のスレッドで行い、生成処理は送信を待たない。websockets がインストールされていない場合や
+    サーバーに接続できない場合は何もしない（tqdm と print の表示だけになる）。
+
+    送るメッセージ:
+        {"type": "grimoire_progress", "project": "0725_babel", "file": "components/App.tsx",
+         "status": "started" | "streaming" | "done" | "failed", "completed": 3, "total": 10, ...}
+    """
+
+    def __init__(self, project, total, completed=0, url=GRIMOIRE_PROGRESS_URL, interval=GRIMOIRE_PROGRESS_INTERVAL):
+        self.project = project
+        self.total = total
+        self.url = url
+        self.interval = interval
+        self.completed = completed
+        self._last_sent = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=1000)
+        self._thread = None
+        self.enabled = bool(url)
+        if self.enabled and connect is None:
+            logger.info("websockets がインストールされていないため、進捗は送信しません")
+            self.enabled = False
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name="grimoire-progress", daemon=True)
+            self._thread.start()
+
+    def publish(self, file, status, **info):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            # 生成中の進捗は間引く（開始・完了・失敗は必ず送る）
+            if status == "streaming" and now - self._last_sent.get(file, 0) < self.interval:
+                return
+            self._last_sent[file] = now
+            if status == "done":
+                self.completed += 1
+            message = {
+                "type": "grimoire_progress",
+                "project": self.project,
+                "file": file,
+                "status": status,
+                "completed": self.completed,
+                "total": self.total,
+                **info,
+            }
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        try:
+            websocket = connect(self.url, open_timeout=3)
+        except Exception as e:
+            logger.warning(f"進捗の送信先に接続できないため、進捗は送信しません: {self.url} - {str(e)}")
+            self.enabled = False
+            return
+        with websocket:
+            while True:
+                try:
+                    message = self._queue.get(timeout=self.interval)
+                except queue.Empty:
+                    message = False
+                # サーバーから届くメッセージは使わないが、読まずにいると送信が詰まるため読み捨てる
+                self._discard_incoming(websocket)
+                if message is None:
+                    return
+                if message is False:
+                    continue
+                try:
+                    websocket.send(json.dumps(message, ensure_ascii=False))
+                except Exception as e:
+                    logger.warning(f"進捗の送信に失敗したため、以降は送信しません: {str(e)}")
+                    self.enabled = False
+                    return
+
+    @staticmethod
+    def _discard_incoming(websocket):
+        try:
+            while True:
+                websocket.recv(timeout=0)
+        except Exception:
+            # 届いているメッセージがなくなると TimeoutError になる
+            pass
+
+    def close(self):
+        """
+        送信待ちの進捗を送り終えてから接続を閉じる
+        """
+        if self._thread is None:
+            return
+        if self.enabled:
+            try:
+                self._queue.put(None, timeout=5)
+            except queue.Full:
+                pass
+        self._thread.join(timeout=5)
@@ -1,8 +1,107 @@
 import os
+import math
+import random
+import threading
+import time
+import logging
 import anthropic
 
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+# プロンプトキャッシュを有効にするためのベータヘッダ
+ANTHROPIC_BETA_HEADERS = "max-tokens-3-5-sonnet-2024-07-15,prompt-caching-2024-07-31"
+
+# レート制限（リクエスト/分）、同時実行数の上限、リトライ回数、1リクエストにかかる平均時間（秒）
+ANTHROPIC_RATE_LIMIT_RPM = float(os.environ.get("ANTHROPIC_RATE_LIMIT_RPM", "50"))
+GRIMOIRE_MAX_WORKERS = int(os.environ.get("GRIMOIRE_MAX_WORKERS", "16"))
+GRIMOIRE_MAX_RETRIES = int(os.environ.get("GRIMOIRE_MAX_RETRIES", "6"))
+GRIMOIRE_AVG_LATENCY = float(os.environ.get("GRIMOIRE_AVG_LATENCY", "60"))
+
+# リトライするHTTPステータス（429: レート制限、529: 過負荷）
+RETRYABLE_STATUS = {429, 529}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    共有のAnthropicクライアントを取得する関数（コネクションプールとTLSセッションを使い回す）
+
+    リトライは generate_response で行うため、SDK側のリトライは無効にする。
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = anthropic.Anthropic(
+                api_key=os.environ.get("ANTHROPIC_API_KEY"),  # 環境変数からAPI keyを取得
+                max_retries=0,
+            )
+        return _client
+
+class RateLimiter:
+    """
+    スレッドセーフなレートリミッタ（リクエストの送信間隔を 60 / rpm 秒以上あける）
+    """
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+rate_limiter = RateLimiter(ANTHROPIC_RATE_LIMIT_RPM)
+
+def worker_count(total_files):
+    """
+    レート制限から並列実行するワーカー数を決める関数
+
+    1リクエストに平均 GRIMOIRE_AVG_LATENCY 秒かかる場合、レート上限を使い切るのに必要な同時実行数は
+    rpm / 60 * 平均時間。それ以上増やしてもレートリミッタで待つだけになる。
+    """
+    needed = math.ceil(ANTHROPIC_RATE_LIMIT_RPM / 60.0 * GRIMOIRE_AVG_LATENCY)
+    return max(1, min(GRIMOIRE_MAX_WORKERS, needed, total_files))
+
+def _retry_delay(attempt, error):
+    # サーバーが retry-after を返した場合はそれに従い、それ以外は指数バックオフ（フルジッター）
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, 1)
+        except ValueError:
+            pass
+    return random.uniform(0, min(60.0, 2.0 ** attempt))
+
+def _is_retryable(error):
+    if isinstance(error, (anthropic.APIConnectionError, anthropic.APITimeoutError)):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+def _create_with_retry(client, **kwargs):
+    """
+    レート制限を守ってリクエストを送り、429/529 の場合は指数バックオフで再試行する関数
+    """
+    for attempt in range(GRIMOIRE_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            return client.messages.create(**kwargs)
+        except Exception as e:
+            if attempt >= GRIMOIRE_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(attempt, e)
+            logger.warning(f"APIエラーのため{delay:.1f}秒後に再試行します（{attempt + 1}/{GRIMOIRE_MAX_RETRIES}）: {str(e)}")
+            time.sleep(delay)
 
-def generate_response(model, prompt, max_tokens, temperature):
+def generate_response(model, prompt, max_tokens, temperature, system=None):
     """
     Anthropic APIを使用してプロンプトに対する応答を生成する関数。
 
@@ -11,22 +110,31 @@ def generate_response(model, prompt, max_tokens, temperature):
         prompt (str): 応答を生成するためのプロンプト
         max_tokens (int): 生成する最大トークン数
         temperature (float): 生成の温度パラメータ
+        system (str, optional): 全ファイルで共通の前提（要件定義書など）。
+            プロンプトキャッシュの対象になり、キャッシュの有効期間内は共通部分を読み込み済みのキャッシュから使う。
 
     戻り値:
         str: 生成された応答テキスト
     """
-    client = anthropic.Anthropic(
-        api_key=os.environ.get("ANTHROPIC_API_KEY")  # 環境変数からAPI keyを取得
-    )
+    client = get_client()
     # print(prompt)
 
-    response = client.messages.create(
+    params = {}
+    if system:
+        params["system"] = [
+            {
+                "type": "text",
+                "text": system,
+                "cache_control": {"type": "ephemeral"}
+            }
+        ]
+
+    response = _create_with_retry(
+        client,
         model=model,
         max_tokens=max_tokens,
         temperature=temperature,
-        extra_headers={"anthropic-beta": 
-            "max-tokens-3-5-sonnet-2024-07-15"
-        },
+        extra_headers={"anthropic-beta": ANTHROPIC_BETA_HEADERS},
         messages=[
             {
                 "role": "user",
@@ -37,18 +145,99 @@ def generate_response(model, prompt, max_tokens, temperature):
                     }
                 ]
             }
-        ]
+        ],
+        **params
     )
 
     # print(response)
+    _log_usage(response.usage)
     
     return response.content[0].text.strip()
 
+def _log_usage(usage):
+    logger.info(
+        f"トークン使用量: 入力 {usage.input_tokens}, 出力 {usage.output_tokens}, "
+        f"キャッシュ作成 {getattr(usage, 'cache_creation_input_tokens', 0)}, "
+        f"キャッシュ読み込み {getattr(usage, 'cache_read_input_tokens', 0)}"
+    )
 
-import logging
+def stream_response(model, prompt, max_tokens, temperature, system=None):
+    """
+    generate_response のストリーミング版。生成されたテキストを届いた順に返すジェネレータ。
+
+    レート制限と 429/529 の再試行は generate_response と同じ。ただし再試行するのは
+    最初のテキストを受け取る前に失敗した場合だけで、途中で失敗した場合は例外を送出する。
+    """
+    client = get_client()
+    params = {}
+    if system:
+        params["system"] = [
+            {
+                "type": "text",
+                "text": system,
+                "cache_control": {"type": "ephemeral"}
+            }
+        ]
+
+    for attempt in range(GRIMOIRE_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        received = False
+        try:
+            with client.messages.stream(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                extra_headers={"anthropic-beta": ANTHROPIC_BETA_HEADERS},
+                messages=[{"role": "user", "content": [{"type": "text", "text": prompt}]}],
+                **params
+            ) as stream:
+                for text in stream.text_stream:
+                    received = True
+                    yield text
+                _log_usage(stream.get_final_message().usage)
+            return
+        except Exception as e:
+            if received or attempt >= GRIMOIRE_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(attempt, e)
+            logger.warning(f"APIエラーのため{delay:.1f}秒後に再試行します（{attempt + 1}/{GRIMOIRE_MAX_RETRIES}）: {str(e)}")
+            time.sleep(delay)
+
+class CodeBlockExtractor:
+    """
+    normal 関数と同じ規則で、ストリーミング中のテキストからコードブロックを逐次取り出すクラス
+
+    feed に届いたテキストを渡すと、確定したコードブロック内の行を返す。最後に finish を呼ぶこと。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside_code_block = False
+        self._emitted = False
+
+    def feed(self, text):
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        return "".join(self._process_line(line) for line in lines)
+
+    def finish(self):
+        line, self._buffer = self._buffer, ""
+        result = self._process_line(line.rstrip())
+        if self._inside_code_block:
+            logger.warning("コードブロックが閉じられていません。残りのコードを結果に追加します。")
+        return result
+
+    def _process_line(self, line):
+        if line.strip().startswith('```'):
+            self._inside_code_block = not self._inside_code_block
+            return ""
+        if not self._inside_code_block:
+            return ""
+        # normal 関数と同様に、行は改行でつなぎ最後の行の後には改行を付けない
+        result = "\n" + line if self._emitted else line
+        self._emitted = True
+        return result
 
-logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def normal(text: str) -> str:
     """
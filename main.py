@@ -3,7 +3,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from api.routes import router
 from api.websocket import websocket_endpoint
 from utils.logging_config import setup_logging
-from api import ai_operations
+from api import ai_operations, git_operations, dependencies, search
+from services.anthropic_service import close_anthropic_client
+from services.code_execution import sandbox_pool
+from services.search_service import search_index
 
 app = FastAPI(
     title="AI File Operations API",
@@ -26,6 +29,9 @@ app.add_middleware(
 # ルーターの追加
 app.include_router(router)
 app.include_router(ai_operations.router, prefix="/v1/ai-file-ops", tags=["AI Operations"])
+app.include_router(git_operations.router)
+app.include_router(dependencies.router)
+app.include_router(search.router)
 
 # WebSocketの追加
 app.add_websocket_route("/ws", websocket_endpoint)
@@ -35,6 +41,18 @@ app.add_websocket_route("/ws", websocket_endpoint)
 async def root():
     return {"message": "Welcome to AI File Operations API"}
 
+# 起動時にコード実行用のワーカーを温め、全文検索インデックスの作成をバックグラウンドで始める
+@app.on_event("startup")
+async def startup_event():
+    await sandbox_pool.start()
+    search_index.start()
+
+# 終了時に共有クライアントのコネクションプールとコード実行用のワーカーを閉じる
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_anthropic_client()
+    await sandbox_pool.close()
+
 # ロギングの設定
 setup_logging()
 
@@ -1,38 +1,55 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 class AIBaseRequest(BaseModel):
     version_control: bool = False
+    use_cache: bool = True  # Falseの場合は生成結果のキャッシュを使わない
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    policy: Optional[str] = None  # "cheapest" | "p95_latency" | "first_token"（未指定の場合は設定値）
+    providers: Optional[List[str]] = None  # 候補にするプロバイダ（未指定の場合は設定されたすべて）
+    use_cache: bool = True
+    hedge_after: Optional[float] = None  # この秒数以内に応答がなければ次のプロバイダにも送る（0で無効）
 
 class AIAnalyzeRequest(AIBaseRequest):
     project_id: str
     file_path: str
     analysis_depth: str = "standard"
+    stream: bool = False  # Trueの場合はServer-Sent Eventsで生成中の差分を返す
 
 class AIUpdateRequest(AIBaseRequest):
     project_id: str
     file_path: str
     change_type: str = "smart"
     feature_request: str  # 機能追加要望を格納するフィールドを追加
+    stream: bool = False  # Trueの場合はServer-Sent Eventsで生成中の差分を返す
+
+class AIProcessRequest(AIUpdateRequest):
+    use_cache: bool = False  # 生成したコードは実行されるため、既定ではキャッシュを使わない
 
 class AIRewriteRequest(AIBaseRequest):
     project_id: str
     file_path: str
     rewrite_style: str = "balanced"
+    stream: bool = False  # Trueの場合はServer-Sent Eventsで生成中の差分を返す
 
 class AIAppendRequest(AIBaseRequest):
     project_id: str
     file_path: str
     append_location: str = "end"
+    stream: bool = False  # Trueの場合はServer-Sent Eventsで生成中の差分を返す
 
 class AIDependenciesRequest(AIBaseRequest):
     project_id: str
     file_paths: List[str]
     analysis_scope: str = "direct"
+    static_only: bool = False  # Trueの場合はAIを使わず、静的解析で求めた依存関係だけを返す
 
 class MultiAIBaseRequest(AIBaseRequest):
     file_paths: List[str]
-    execution_mode: str = "parallel"
+    execution_mode: str = "parallel"  # "parallel" | "bounded" | "sequential"
+    max_in_flight: Optional[int] = None  # boundedモードの同時実行数（未指定の場合は設定値）
 
 class MultiAIAnalyzeRequest(MultiAIBaseRequest):
     project_id: str
@@ -43,6 +60,9 @@ class MultiAIUpdateRequest(MultiAIBaseRequest):
     change_type: str = "smart"
     feature_request: str  # 機能追加要望を格納するフィールドを追加
 
+class MultiAIProcessRequest(MultiAIUpdateRequest):
+    use_cache: bool = False  # 生成したコードは実行されるため、既定ではキャッシュを使わない
+
 class MultiAIRewriteRequest(MultiAIBaseRequest):
     project_id: str
     rewrite_style: str = "balanced"
@@ -53,4 +73,5 @@ class MultiAIAppendRequest(MultiAIBaseRequest):
 
 class MultiAIDependenciesRequest(MultiAIBaseRequest):
     project_id: str
-    analysis_scope: str = "direct"
\ No newline at end of file
+    analysis_scope: str = "direct"
+    static_only: bool = False  # Trueの場合はAIを使わず、静的解析で求めた依存関係だけを返す
\ No newline at end of file
@@ -1,5 +1,6 @@
 # ファイル関連のデータモデル
 from pydantic import BaseModel
+from typing import List, Optional
 
 class FileModel(BaseModel):
     filename: str
@@ -13,3 +14,13 @@ class FileEdit(BaseModel):
     line_number: int
     new_content: str
 
+
+class FileLineEdit(BaseModel):
+    # start_line から end_line までの行（両端を含む、1始まり）を new_lines で置き換える
+    # end_line を省略すると start_line の1行だけが対象。end_line = start_line - 1 で start_line の前に挿入
+    start_line: int
+    end_line: Optional[int] = None
+    new_lines: List[str] = []
+
+class FilePatch(BaseModel):
+    edits: List[FileLineEdit]
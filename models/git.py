@@ -0,0 +1,34 @@
+# Git関連のデータモデル
+from pydantic import BaseModel
+from typing import List, Optional
+
+class GitCommitRequest(BaseModel):
+    project_id: str
+    message: str
+    file_paths: List[str] = []  # 空の場合はステージ済みの変更をそのままコミットする
+
+class GitCommitInfo(BaseModel):
+    hexsha: str
+    summary: str
+    message: str
+    author: str
+    email: str
+    committed_at: str
+
+class GitFileChange(BaseModel):
+    path: str
+    change_type: str  # A: 追加 / D: 削除 / M: 変更 / R: 名前変更
+
+class GitStatus(BaseModel):
+    root: str
+    branch: Optional[str] = None
+    head: Optional[str] = None
+    staged: List[GitFileChange]
+    unstaged: List[GitFileChange]
+    untracked: List[str]
+
+class GitDiffEntry(BaseModel):
+    path: str
+    old_path: Optional[str] = None
+    change_type: str
+    diff: str
@@ -1,41 +1,79 @@
 import os
-from typing import List
-import asyncio
-from services.anthropic_service import generate_text_anthropic
-from utils.version_control import version_control
+from typing import List, Optional, Tuple
+from services.anthropic_service import generate_text_anthropic, stream_text_anthropic
+# 引数名 version_control と衝突しないようモジュールとして読み込む
+from utils import version_control as vcs
 from utils.process import process
-import subprocess
+from services.code_execution import sandbox_pool
 import logging
 from utils.file_utils import get_file_path
+from services.scheduler import run_file_tasks
+from services.context_packer import load_context_files, run_with_context
+from services.import_graph import format_dependencies, static_dependencies
+from services.retrieval import related_context
+from utils.file_operations import read_file, run_io
+from utils.tree import render_tree
 
 logger = logging.getLogger(__name__)
 
 # ベースファイルパスを設定
 BASE_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-async def ai_analyze(file_path: str, version_control: bool, analysis_depth: str):
+def build_analyze_prompt(file_path: str, analysis_depth: str) -> str:
     full_path = get_file_path("", file_path, "")
     with open(full_path, 'r') as file:
         content = file.read()
-    prompt = f"以下のファイル内容を{analysis_depth}の深さで分析してください：\n\n{content}"
-    result = await generate_text_anthropic(prompt)
+    return f"以下のファイル内容を{analysis_depth}の深さで分析してください：\n\n{content}"
+
+async def ai_analyze(file_path: str, version_control: bool, analysis_depth: str, use_cache: bool = True):
+    prompt = build_analyze_prompt(file_path, analysis_depth)
+    result = await generate_text_anthropic(prompt, use_cache=use_cache)
     if version_control:
-        await version_control(file_path, "AI分析")
+        await vcs.version_control(file_path, "AI分析")
     return result
 
-async def ai_reply(file_path: str, version_control: bool, change_type: str, feature_request: str):
-    # 機能追加系
-    logger.info(f"ai_reply関数が呼び出されました。ファイルパス: {file_path}")
-    full_path = get_file_path("", file_path, "")
-    try:
-        # ディレクトリかどうかをチェック
-        if os.path.isdir(full_path):
-            logger.info(f"{file_path}はディレクトリです。ディレクトリ用の処理を実行します。")
-            # ディレクトリの場合、直下のツリー構造を取得
-            tree_structure = get_directory_tree(full_path)
-            
-            # ディレクトリ構造と要望に基づいて返答を生成
-            prompt = f"""
+async def ai_analyze_stream(file_path: str, version_control: bool, analysis_depth: str, use_cache: bool = True):
+    """
+    ai_analyzeのストリーミング版。生成中の差分を逐次返し、最後に通常版と同じ形の結果を返す
+    """
+    prompt = build_analyze_prompt(file_path, analysis_depth)
+    async for event in _stream_generation(prompt, use_cache=use_cache):
+        yield event
+        if event["type"] == "done" and version_control:
+            await vcs.version_control(file_path, "AI分析")
+
+async def _stream_generation(prompt: str, wrap=None, use_cache: bool = True):
+    """
+    Anthropicのストリームを {"type": "delta"} イベントに変換し、最後に {"type": "done"} を返す非同期ジェネレータ
+
+    wrap: 生成結果（{"generated_text": ...}）を最終的なレスポンス形に変換する関数
+    """
+    chunks = []
+    async for text in stream_text_anthropic(prompt, use_cache=use_cache):
+        chunks.append(text)
+        yield {"type": "delta", "text": text}
+    result = {"generated_text": "".join(chunks)}
+    yield {"type": "done", "result": wrap(result) if wrap else result}
+
+def _related_section(related: str) -> str:
+    if not related:
+        return ""
+    return f"\n\n参考: プロジェクト内の関連するコード（要望との類似度が高い部分のみ）\n\n{related}\n"
+
+def build_reply_prompt(full_path: str, feature_request: str) -> Tuple[str, List[dict]]:
+    """
+    ai_reply のプロンプトと、プロンプトに加えた関連コードのチャンクの一覧を返す関数（ブロッキング）
+    """
+    # 要望に関連するコードをプロジェクト内から探してトークン予算に収める
+    related, chunks = related_context(full_path, feature_request)
+
+    # ディレクトリかどうかをチェック
+    if os.path.isdir(full_path):
+        # ディレクトリの場合、ツリー構造を取得（無視対象・深すぎるフォルダはファイル数だけを示す）
+        tree_structure = render_tree(full_path, style="icons")
+
+        # ディレクトリ構造と要望に基づいて返答を生成
+        return f"""
             以下のディレクトリ構造に対して、{feature_request} を実現する方法を提案してください。
             
             ディレクトリ構造:
@@ -45,131 +83,179 @@ async def ai_reply(file_path: str, version_control: bool, change_type: str, feat
             1. 新しいファイルやディレクトリの追加が必要な場合、その構造と目的
             2. 既存のファイルに変更が必要な場合、どのファイルをどのように変更するか
             3. 全体的なアプローチと、それがどのようにして要望を満たすか
-            """
-            
-            result = await generate_text_anthropic(prompt)
-            return {"result": result, "file_path": file_path, "is_directory": True}
-        
-        # ファイルの場合
-        with open(full_path, 'r') as file:
-            content = file.read()
-        logger.debug(f"ファイル {file_path} の内容を読み込みました")
-        
-        prompt = f"\n\n{content} \n\n に対して、{feature_request}"
+            """ + _related_section(related), chunks
+
+    # ファイルの場合
+    with open(full_path, 'r') as file:
+        content = file.read()
+    return f"\n\n{content} \n\n に対して、{feature_request}" + _related_section(related), chunks
+
+async def ai_reply(file_path: str, version_control: bool, change_type: str, feature_request: str, use_cache: bool = True):
+    # 機能追加系
+    logger.info(f"ai_reply関数が呼び出されました。ファイルパス: {file_path}")
+    full_path = get_file_path("", file_path, "")
+    try:
+        is_directory = os.path.isdir(full_path)
+        if is_directory:
+            logger.info(f"{file_path}はディレクトリです。ディレクトリ用の処理を実行します。")
+        prompt, context = await run_io(build_reply_prompt, full_path, feature_request)
         logger.info(f"Anthropicに送信するプロンプトを生成しました: {prompt[:100]}...")
-        
-        result = await generate_text_anthropic(prompt)
+
+        result = await generate_text_anthropic(prompt, use_cache=use_cache)
         logger.info("Anthropicからの応答を受信しました")
-        
-        if version_control:
-            await version_control(file_path, "AI更新")
+
+        if version_control and not is_directory:
+            await vcs.version_control(file_path, "AI更新")
             logger.debug(f"ファイル {file_path} のバージョン管理を実行しました")
-        
-        return {"result": result, "file_path": file_path, "is_directory": False}
+
+        return {"result": result, "file_path": file_path, "is_directory": is_directory, "context": context}
     except Exception as e:
         logger.error(f"ai_reply関数でエラーが発生しました: {str(e)}")
         raise
 
-async def multi_ai_reply(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str):
-    tasks = [ai_reply(file_path, version_control, change_type, feature_request) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
+async def ai_reply_stream(file_path: str, version_control: bool, change_type: str, feature_request: str, use_cache: bool = True):
+    """
+    ai_replyのストリーミング版
+    """
+    logger.info(f"ai_reply_stream関数が呼び出されました。ファイルパス: {file_path}")
+    full_path = get_file_path("", file_path, "")
+    is_directory = os.path.isdir(full_path)
+    prompt, context = await run_io(build_reply_prompt, full_path, feature_request)
+    wrap = lambda result: {"result": result, "file_path": file_path, "is_directory": is_directory, "context": context}
+    async for event in _stream_generation(prompt, wrap, use_cache=use_cache):
+        yield event
+        if event["type"] == "done" and version_control and not is_directory:
+            await vcs.version_control(file_path, "AI更新")
 
-async def ai_rewrite(file_path: str, version_control: bool, rewrite_style: str):
+def build_rewrite_prompt(file_path: str, rewrite_style: str) -> str:
     full_path = get_file_path("", file_path, "")
     with open(full_path, 'r') as file:
         content = file.read()
-    prompt = f"以下のファイル内容を{rewrite_style}のスタイルで書き直してください：\n\n{content}"
-    result = await generate_text_anthropic(prompt)
+    return f"以下のファイル内容を{rewrite_style}のスタイルで書き直してください：\n\n{content}"
+
+async def ai_rewrite(file_path: str, version_control: bool, rewrite_style: str, use_cache: bool = True):
+    prompt = build_rewrite_prompt(file_path, rewrite_style)
+    result = await generate_text_anthropic(prompt, use_cache=use_cache)
     if version_control:
-        await version_control(file_path, "AI書き直し")
+        await vcs.version_control(file_path, "AI書き直し")
     return result
 
-async def ai_append(file_path: str, version_control: bool, append_location: str):
+async def ai_rewrite_stream(file_path: str, version_control: bool, rewrite_style: str, use_cache: bool = True):
+    """
+    ai_rewriteのストリーミング版
+    """
+    prompt = build_rewrite_prompt(file_path, rewrite_style)
+    async for event in _stream_generation(prompt, use_cache=use_cache):
+        yield event
+        if event["type"] == "done" and version_control:
+            await vcs.version_control(file_path, "AI書き直し")
+
+def build_append_prompt(file_path: str, append_location: str) -> str:
     full_path = get_file_path("", file_path, "")
     with open(full_path, 'r') as file:
         content = file.read()
-    prompt = f"以下のファイル内容の{append_location}に追記してください：\n\n{content}"
-    result = await generate_text_anthropic(prompt)
+    return f"以下のファイル内容の{append_location}に追記してください：\n\n{content}"
+
+async def ai_append(file_path: str, version_control: bool, append_location: str, use_cache: bool = True):
+    prompt = build_append_prompt(file_path, append_location)
+    result = await generate_text_anthropic(prompt, use_cache=use_cache)
     if version_control:
-        await version_control(file_path, "AI追記")
+        await vcs.version_control(file_path, "AI追記")
     return result
 
-async def ai_analyze_dependencies(file_paths: List[str], version_control: bool, analysis_scope: str):
-    contents = []
-    for file_path in file_paths:
-        full_path = get_file_path("", file_path, "")
-        with open(full_path, 'r') as file:
-            contents.append(file.read())
-    prompt = f"以下のファイル内容の依存関係を{analysis_scope}の範囲で分析してください：\n\n" + "\n\n".join(contents)
-    result = await generate_text_anthropic(prompt)
+async def ai_append_stream(file_path: str, version_control: bool, append_location: str, use_cache: bool = True):
+    """
+    ai_appendのストリーミング版
+    """
+    prompt = build_append_prompt(file_path, append_location)
+    async for event in _stream_generation(prompt, use_cache=use_cache):
+        yield event
+        if event["type"] == "done" and version_control:
+            await vcs.version_control(file_path, "AI追記")
+
+async def ai_analyze_dependencies(file_paths: List[str], version_control: bool, analysis_scope: str, use_cache: bool = True, static_only: bool = False):
+    full_paths = [get_file_path("", file_path, "") for file_path in file_paths]
+    # どのファイルがどのファイルを読み込んでいるかはインポートグラフから求め、AIには意味的な分析だけを任せる
+    static = await run_io(static_dependencies, full_paths)
+    if static_only:
+        if static is None:
+            raise ValueError("静的解析は ~/babel_generated 配下の同じプロジェクトのファイルにのみ対応しています")
+        return {"static_dependencies": static["nodes"]}
+
+    instruction = f"以下のファイル内容の依存関係を{analysis_scope}の範囲で分析してください：\n\n"
+    files, scores = None, None
+    if static is not None:
+        instruction = (
+            f"以下のファイルの依存関係を{analysis_scope}の範囲で分析してください。\n"
+            "ファイル間のimportは静的解析で求めた次の一覧のとおりです。これを前提に、"
+            "各依存が何のために使われているか、結合の強さ、循環や設計上の問題など、一覧からは分からない点を中心に説明してください。\n\n"
+            f"{format_dependencies(static['nodes'])}\n\n"
+        )
+        # 表示するパスをインポートグラフと同じプロジェクトルートからの相対パスにそろえ、重要度で並べる
+        files = await run_io(load_context_files, full_paths, static["root"])
+        scores = static["scores"]
+
+    # ファイルの内容はトークン予算に収めて渡す（収まらない場合はグループごとに要約してからまとめる）
+    result = await run_with_context(
+        instruction,
+        full_paths,
+        lambda prompt: generate_text_anthropic(prompt, use_cache=use_cache),
+        map_instruction="以下のファイルについて、依存関係の分析に必要な情報（import/export、公開している関数・クラス・コンポーネント、他のファイルへの参照）を簡潔にまとめてください：\n\n",
+        reduce_instruction="複数のファイルグループの要約をもとに回答してください。\n",
+        scores=scores,
+        files=files,
+        provider="anthropic",
+    )
+    if static is not None:
+        result["static_dependencies"] = static["nodes"]
     if version_control:
-        for file_path in file_paths:
-            await version_control(file_path, "AI依存関係分析")
+        async with vcs.commit_batch():
+            for file_path in file_paths:
+                await vcs.version_control(file_path, "AI依存関係分析")
     return result
 
-async def multi_ai_analyze(file_paths: List[str], version_control: bool, analysis_depth: str, execution_mode: str, ):
-    tasks = [ai_analyze(file_path, version_control, analysis_depth) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
-
-async def multi_ai_reply(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str):
-    tasks = [ai_reply(file_path, version_control, change_type, feature_request) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
-
-async def multi_ai_rewrite(file_paths: List[str], version_control: bool, rewrite_style: str, execution_mode: str):
-    tasks = [ai_rewrite(file_path, version_control, rewrite_style) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
-
-async def multi_ai_append(file_paths: List[str], version_control: bool, append_location: str, execution_mode: str):
-    tasks = [ai_append(file_path, version_control, append_location) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
+async def _run_multi(file_paths: List[str], worker, execution_mode: str, version_control: bool, max_in_flight: Optional[int] = None):
+    # version_control が有効な場合は、全ファイルの変更を1つのコミットにまとめる
+    if not version_control:
+        return await run_file_tasks(file_paths, worker, execution_mode, max_in_flight)
+    async with vcs.commit_batch():
+        return await run_file_tasks(file_paths, worker, execution_mode, max_in_flight)
 
-async def multi_ai_analyze_dependencies(file_paths: List[str], version_control: bool, analysis_scope: str, execution_mode: str):
-    return await ai_analyze_dependencies(file_paths, version_control, analysis_scope)
+async def multi_ai_analyze(file_paths: List[str], version_control: bool, analysis_depth: str, execution_mode: str, use_cache: bool = True, max_in_flight: Optional[int] = None):
+    worker = lambda file_path: ai_analyze(file_path, version_control, analysis_depth, use_cache=use_cache)
+    return await _run_multi(file_paths, worker, execution_mode, version_control, max_in_flight)
 
+async def multi_ai_reply(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str, use_cache: bool = True, max_in_flight: Optional[int] = None):
+    worker = lambda file_path: ai_reply(file_path, version_control, change_type, feature_request, use_cache=use_cache)
+    return await _run_multi(file_paths, worker, execution_mode, version_control, max_in_flight)
 
-async def ai_process(file_path: str, version_control: bool, change_type: str, feature_request: str):
-    # 機能追加系
+async def multi_ai_rewrite(file_paths: List[str], version_control: bool, rewrite_style: str, execution_mode: str, use_cache: bool = True, max_in_flight: Optional[int] = None):
+    worker = lambda file_path: ai_rewrite(file_path, version_control, rewrite_style, use_cache=use_cache)
+    return await _run_multi(file_paths, worker, execution_mode, version_control, max_in_flight)
+
+async def multi_ai_append(file_paths: List[str], version_control: bool, append_location: str, execution_mode: str, use_cache: bool = True, max_in_flight: Optional[int] = None):
+    worker = lambda file_path: ai_append(file_path, version_control, append_location, use_cache=use_cache)
+    return await _run_multi(file_paths, worker, execution_mode, version_control, max_in_flight)
+
+async def multi_ai_analyze_dependencies(file_paths: List[str], version_control: bool, analysis_scope: str, execution_mode: str, use_cache: bool = True, static_only: bool = False):
+    return await ai_analyze_dependencies(file_paths, version_control, analysis_scope, use_cache=use_cache, static_only=static_only)
+
+
+async def ai_process(file_path: str, version_control: bool, change_type: str, feature_request: str, use_cache: bool = False):
+    # 機能追加系（生成したコードを実行するため、既定ではキャッシュを使わない）
     full_path = get_file_path("", file_path, "")
     
     # ディレクトリかどうかをチェック
     if os.path.isdir(full_path):
-        # ディレクトリの場合、直下のツリー構造を取得
-        tree_structure = get_directory_tree(full_path)
+        # ディレクトリの場合、ツリー構造を取得（無視対象・深すぎるフォルダはファイル数だけを示す）
+        tree_structure = await run_io(render_tree, full_path, style="icons")
         content = tree_structure
     else:
         # ファイルの場合は内容を読み込む
-        with open(full_path, 'r') as file:
-            content = file.read()
+        content = await run_io(read_file, full_path)
+
+    # 要望に関連するコードをプロジェクト内から探してトークン予算に収める
+    related, context = await run_io(related_context, full_path, feature_request)
 
     python_process_prompt = f"""
     ファイルの書き込みはpythonファイルを作成します。
@@ -182,10 +268,10 @@ async def ai_process(file_path: str, version_control: bool, change_type: str, fe
     - プログラムは全文出力し、コードブロックで囲うこと。省略は一切しない。
     """
     prompt = f"""\n\n{content} \n\n に対して、{feature_request} を実現するコードを提案してください。
-    """ + python_process_prompt
+    """ + _related_section(related) + python_process_prompt
 
     logger.info(f"Anthropicからテキストを生成します。プロンプト: {prompt[:100]}...")
-    result = await generate_text_anthropic(prompt)
+    result = await generate_text_anthropic(prompt, use_cache=use_cache)
     text = result['generated_text']
     logger.info("Anthropicからのテキスト生成が完了しました。")
 
@@ -208,40 +294,26 @@ async def ai_process(file_path: str, version_control: bool, change_type: str, fe
         temp_file.write(code)
     logger.info(f"コードを一時ファイルに書き込みました: {temp_file_name}")
     
-    # サブプロセスでコードを実行
-    try:
-        logger.info("サブプロセスでコードを実行します。")
-        output = subprocess.check_output(['python', temp_file_name], stderr=subprocess.STDOUT, universal_newlines=True)
-        result = {"generated_text": code, "execution_output": output}
+    # サンドボックスのワーカープールでコードを実行（標準エラーは標準出力にまとめる）
+    logger.info("サンドボックスでコードを実行します。")
+    execution = await sandbox_pool.run(code, filename=os.path.abspath(temp_file_name), merge_stderr=True)
+    if execution["timed_out"]:
+        logger.error("コードの実行がタイムアウトしました")
+        result = {"generated_text": code, "execution_error": execution["stdout"] + "\n実行がタイムアウトしました"}
+    elif execution["returncode"] != 0:
+        logger.error(f"コードの実行中にエラーが発生しました: 終了コード {execution['returncode']}")
+        result = {"generated_text": code, "execution_error": execution["stdout"]}
+    else:
+        result = {"generated_text": code, "execution_output": execution["stdout"]}
         logger.info("コードの実行が成功しました。")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"コードの実行中にエラーが発生しました: {e}")
-        result = {"generated_text": code, "execution_error": e.output}
     
     if version_control:
         logger.info(f"バージョン管理を実行します: {file_path}")
-        await version_control(file_path, "AI更新")
+        await vcs.version_control(file_path, "AI更新")
 
     logger.info(f"処理が完了しました: {file_path}")
-    return {"result": result, "file_path": file_path, "is_directory": os.path.isdir(full_path)}
-
-def get_directory_tree(path, level=0):
-    tree = ""
-    for item in os.listdir(path):
-        item_path = os.path.join(path, item)
-        if os.path.isdir(item_path):
-            tree += "    " * level + f"📁 {item}/\n"
-            tree += get_directory_tree(item_path, level + 1)
-        else:
-            tree += "    " * level + f"📄 {item}\n"
-    return tree
-
-async def multi_ai_process(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str):
-    tasks = [ai_process(file_path, version_control, change_type, feature_request) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
\ No newline at end of file
+    return {"result": result, "file_path": file_path, "is_directory": os.path.isdir(full_path), "context": context}
+
+async def multi_ai_process(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str, use_cache: bool = False, max_in_flight: Optional[int] = None):
+    worker = lambda file_path: ai_process(file_path, version_control, change_type, feature_request, use_cache=use_cache)
+    return await _run_multi(file_paths, worker, execution_mode, version_control, max_in_flight)
\ No newline at end of file
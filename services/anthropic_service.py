@@ -1,28 +1,104 @@
-from anthropic import Anthropic
-import asyncio
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+import httpx
 import logging
+from config.settings import (
+    ANTHROPIC_MAX_CONNECTIONS, ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+    ANTHROPIC_KEEPALIVE_EXPIRY, ANTHROPIC_TIMEOUT, ANTHROPIC_MODEL, LLM_CACHE_ENABLED
+)
+from services.llm_limits import provider_semaphore
+from services.llm_cache import cached_generation, llm_cache, make_cache_key
+import asyncio
 
 logger = logging.getLogger(__name__)
 
-anthropic_client = Anthropic()
+# 全リクエストで共有する非同期クライアント（HTTPのキープアライブ接続を再利用する）
+anthropic_client = AsyncAnthropic(
+    timeout=ANTHROPIC_TIMEOUT,
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=ANTHROPIC_MAX_CONNECTIONS,
+            max_keepalive_connections=ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=ANTHROPIC_KEEPALIVE_EXPIRY,
+        ),
+    ),
+)
 
-async def generate_text_anthropic(prompt: str):
-    logger.info(f"Anthropicリクエストを受信: prompt={prompt}")
-    try:
-        message = await asyncio.to_thread(
-            anthropic_client.messages.create,
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=8192,
-            temperature=0.7,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            extra_headers={"anthropic-beta":
+def _message_params(prompt: str) -> dict:
+    """
+    Anthropicへのリクエストパラメータを組み立てる関数
+    """
+    return dict(
+        model=ANTHROPIC_MODEL,
+        max_tokens=8192,
+        temperature=0.7,
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+        extra_headers={"anthropic-beta":
 "max-tokens-3-5-sonnet-2024-07-15"}
-        )
+    )
+
+def _cache_params(params: dict) -> dict:
+    # キャッシュキーに含める生成パラメータ（モデル名とプロンプトは別に扱う）
+    return {k: v for k, v in params.items() if k not in ("model", "messages")}
+
+async def generate_text_anthropic(prompt: str, use_cache: bool = True):
+    logger.info(f"Anthropicリクエストを受信: prompt={prompt}")
+    params = _message_params(prompt)
+
+    async def generate():
+        async with provider_semaphore("anthropic"):
+            message = await anthropic_client.messages.create(**params)
         logger.info("Anthropicでテキスト生成成功")
         logger.info(message.content[0].text)
         return {"generated_text": message.content[0].text}
+
+    try:
+        return await cached_generation(
+            "anthropic", params["model"], _cache_params(params), prompt, generate, use_cache
+        )
     except Exception as e:
         logger.error(f"Anthropicでのテキスト生成中にエラーが発生: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+async def stream_text_anthropic(prompt: str, use_cache: bool = True):
+    """
+    Anthropicの生成結果をトークンの差分（テキスト断片）として逐次返す非同期ジェネレータ
+
+    キャッシュにヒットした場合は保存済みの全文を1つの差分として返す。
+    """
+    logger.info(f"Anthropicストリーミングリクエストを受信: prompt={prompt}")
+    params = _message_params(prompt)
+    # キャッシュの無効化（LLM_CACHE_ENABLED=false）と use_cache=False の扱いは cached_generation と同じ
+    cache_key = None
+    if LLM_CACHE_ENABLED and use_cache:
+        cache_key = make_cache_key("anthropic", params["model"], _cache_params(params), prompt)
+    try:
+        if cache_key:
+            cached = await asyncio.to_thread(llm_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"Anthropicのキャッシュにヒットしました: key={cache_key[:12]}")
+                yield cached["generated_text"]
+                return
+        else:
+            llm_cache.bypasses += 1
+
+        chunks = []
+        async with provider_semaphore("anthropic"):
+            async with anthropic_client.messages.stream(**params) as stream:
+                async for text in stream.text_stream:
+                    chunks.append(text)
+                    yield text
+        logger.info("Anthropicでのストリーミング生成成功")
+        if cache_key:
+            await asyncio.to_thread(llm_cache.set, cache_key, {"generated_text": "".join(chunks)})
+    except Exception as e:
+        logger.error(f"Anthropicでのストリーミング生成中にエラーが発生: {str(e)}")
+        raise
+
+async def close_anthropic_client():
+    """
+    共有クライアントのコネクションプールを閉じる関数（アプリ終了時に呼び出す）
+    """
+    await anthropic_client.close()
+    logger.info("Anthropicクライアントを閉じました")
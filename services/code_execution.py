@@ -1,23 +1,268 @@
 # コード実行サービス
-# 依存: utils.security
-def dummy_code_execution():
-    pass
+#
+# 事前に起動しておいたPythonワーカープロセス（services/sandbox_worker.py）のプールでコードを実行する。
+# 各実行はワーカーからforkした子プロセスで行い、CPU時間・メモリ・実行時間に上限を設ける。
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+from typing import Any, AsyncIterator, Dict, Optional
+from config.settings import (
+    SANDBOX_WORKERS, SANDBOX_MAX_RUNS_PER_WORKER, SANDBOX_CPU_SECONDS, SANDBOX_MEMORY_MB,
+    SANDBOX_WALL_TIMEOUT, SANDBOX_MAX_OUTPUT
+)
 
+logger = logging.getLogger(__name__)
 
-# 追記された内容:
-# # コード実行サービス
-# # 依存: utils.security
-# def dummy_code_execution():
-#     pass
-# 
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
 
-# 追記された内容:
-# コード実行サービス
-def dummy_code_execution():
-    pass
+# ワーカーから応答がない場合に、実行時間の上限に加えて待つ時間（秒）
+_WORKER_GRACE = 5.0
 
+class SandboxWorker:
+    """
+    1つのワーカープロセス
 
-# 追記された内容:
-# コード実行サービス
-def dummy_code_execution():
-    pass
+    標準入力にジョブをJSON行で書き込み、標準出力から実行中の出力と終了通知をJSON行で受け取る。
+    """
+
+    def __init__(self):
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.runs = 0
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-u", WORKER_SCRIPT,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            limit=SANDBOX_MAX_OUTPUT * 4 + 65536,
+        )
+        ready = json.loads(await self.process.stdout.readline())
+        logger.info(f"サンドボックスワーカーを起動しました: pid={ready.get('pid')}")
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def run(self, job: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        self.runs += 1
+        self.process.stdin.write((json.dumps(job, ensure_ascii=False) + "\n").encode("utf-8"))
+        await self.process.stdin.drain()
+        deadline = asyncio.get_running_loop().time() + job["wall_timeout"] + _WORKER_GRACE
+        while True:
+            remaining = deadline - asyncio.get_running_loop().time()
+            line = await asyncio.wait_for(self.process.stdout.readline(), timeout=max(remaining, 0.01))
+            if not line:
+                raise RuntimeError("サンドボックスワーカーが予期せず終了しました")
+            event = json.loads(line)
+            if event.get("id") != job["id"]:
+                continue
+            yield event
+            if event["type"] == "exit":
+                return
+
+    async def kill(self):
+        if self.alive:
+            self.process.kill()
+            await self.process.wait()
+
+class SandboxPool:
+    """
+    サンドボックスワーカーのプール
+
+    ワーカーは起動済みのまま再利用し、max_runs 回実行したワーカーは作り直す。
+    実行途中で中断された（ストリーミングのクライアントが切断したなど）ワーカーは状態が不明なため破棄する。
+    """
+
+    def __init__(self, size: int = SANDBOX_WORKERS, max_runs: int = SANDBOX_MAX_RUNS_PER_WORKER):
+        self.size = max(1, size)
+        self.max_runs = max(1, max_runs)
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._job_ids = itertools.count(1)
+        self._warming = set()
+
+    @property
+    def supported(self) -> bool:
+        # fork と resource が使えるPOSIX環境でのみワーカーを使う
+        return os.name == "posix" and hasattr(os, "fork")
+
+    def _bind_loop(self):
+        # ワーカーのパイプはイベントループに紐づくため、別のループから使われた場合は作り直す
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker.alive:
+                worker.process.kill()
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._warming = set()
+
+    async def start(self):
+        """
+        ワーカーを事前に起動する（アプリケーション起動時に呼ぶ）
+        """
+        self._bind_loop()
+        if not self.supported:
+            logger.warning("この環境ではサンドボックスワーカーを使えないため、実行ごとにプロセスを起動します")
+            return
+        for _ in range(self.size - self._idle.qsize()):
+            await self._spawn()
+
+    async def _spawn(self):
+        worker = SandboxWorker()
+        try:
+            await worker.start()
+            self._idle.put_nowait(worker)
+        except Exception as e:
+            logger.error(f"サンドボックスワーカーの起動に失敗しました: {str(e)}")
+
+    def _spawn_in_background(self):
+        task = asyncio.get_running_loop().create_task(self._spawn())
+        self._warming.add(task)
+        task.add_done_callback(self._warming.discard)
+
+    async def _acquire(self) -> SandboxWorker:
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker.alive:
+                return worker
+        worker = SandboxWorker()
+        await worker.start()
+        return worker
+
+    async def _release(self, worker: SandboxWorker, reusable: bool):
+        if reusable and worker.alive and worker.runs < self.max_runs:
+            self._idle.put_nowait(worker)
+            return
+        await worker.kill()
+        # 作り直したワーカーを次の実行までに温めておく
+        if self.supported and self._idle.qsize() + len(self._warming) < self.size:
+            self._spawn_in_background()
+
+    async def run_stream(self, code: str, cwd: Optional[str] = None, filename: str = "<sandbox>",
+                         wall_timeout: float = SANDBOX_WALL_TIMEOUT) -> AsyncIterator[Dict[str, Any]]:
+        """
+        コードを実行し、出力を逐次返す非同期ジェネレータ
+
+        イベント:
+            {"type": "stdout" | "stderr", "data": "..."}
+            {"type": "exit", "returncode": 0, "timed_out": False, "truncated": False}
+        """
+        job = {
+            "id": next(self._job_ids),
+            "code": code,
+            "filename": filename,
+            "cwd": cwd or os.getcwd(),
+            "cpu_seconds": SANDBOX_CPU_SECONDS,
+            "memory_bytes": SANDBOX_MEMORY_MB * 1024 * 1024 if SANDBOX_MEMORY_MB > 0 else 0,
+            "wall_timeout": wall_timeout,
+            "max_output": SANDBOX_MAX_OUTPUT,
+        }
+        if not self.supported:
+            async for event in _run_unpooled(job):
+                yield event
+            return
+
+        self._bind_loop()
+        async with self._semaphore:
+            worker = await self._acquire()
+            finished = False
+            try:
+                async for event in worker.run(job):
+                    event.pop("id", None)
+                    finished = event["type"] == "exit"
+                    yield event
+            except asyncio.TimeoutError:
+                logger.error("サンドボックスワーカーが応答しないため終了します")
+                yield {"type": "exit", "returncode": -1, "timed_out": True, "truncated": False}
+            finally:
+                await self._release(worker, finished)
+
+    async def run(self, code: str, cwd: Optional[str] = None, filename: str = "<sandbox>",
+                  wall_timeout: float = SANDBOX_WALL_TIMEOUT, merge_stderr: bool = False) -> Dict[str, Any]:
+        """
+        コードを実行し、出力をまとめて返す関数
+
+        Returns:
+            dict: {"stdout", "stderr", "returncode", "timed_out", "truncated"}（merge_stderr の場合 stderr は stdout に含める）
+        """
+        stdout, stderr = [], []
+        result: Dict[str, Any] = {}
+        async for event in self.run_stream(code, cwd, filename, wall_timeout):
+            if event["type"] == "stdout" or (merge_stderr and event["type"] == "stderr"):
+                stdout.append(event["data"])
+            elif event["type"] == "stderr":
+                stderr.append(event["data"])
+            elif event["type"] == "exit":
+                result = event
+        return {
+            "stdout": "".join(stdout),
+            "stderr": "".join(stderr),
+            "returncode": result.get("returncode", -1),
+            "timed_out": result.get("timed_out", False),
+            "truncated": result.get("truncated", False),
+        }
+
+    async def close(self):
+        for task in list(self._warming):
+            task.cancel()
+        while not self._idle.empty():
+            await self._idle.get_nowait().kill()
+
+async def _run_unpooled(job: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    ワーカーを使えない環境向けに、実行ごとにPythonを起動して実行する（実行時間の上限のみ適用）
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-u", "-c", job["code"], cwd=job["cwd"],
+        stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(stream, name):
+        while chunk := await stream.read(65536):
+            await queue.put({"type": name, "data": chunk.decode("utf-8", errors="replace")})
+
+    pumps = asyncio.gather(pump(process.stdout, "stdout"), pump(process.stderr, "stderr"))
+    pumps.add_done_callback(lambda _: queue.put_nowait(None))
+    timed_out = False
+    deadline = asyncio.get_running_loop().time() + job["wall_timeout"]
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=max(deadline - asyncio.get_running_loop().time(), 0.01))
+            except asyncio.TimeoutError:
+                timed_out = True
+                process.kill()
+                break
+            if event is None:
+                break
+            yield event
+    finally:
+        if process.returncode is None and (timed_out or not pumps.done()):
+            process.kill()
+        returncode = await process.wait()
+    yield {"type": "exit", "returncode": returncode, "timed_out": timed_out, "truncated": False}
+
+sandbox_pool = SandboxPool()
+
+async def execute_python(code: str):
+    """
+    /execute 用にコードを実行する関数
+    """
+    logger.info("受信したコードを取得しました")
+    logger.info(f"実行するコード: {code}")
+    result = await sandbox_pool.run(code)
+    if result["timed_out"]:
+        logger.error("実行がタイムアウトしました")
+        return {"error": "実行がタイムアウトしました", "output": result["stdout"]}
+    if result["returncode"] != 0:
+        logger.error(f"実行エラーが発生しました: {result['stderr']}")
+        return {"error": result["stderr"], "output": result["stdout"]}
+    logger.info("Pythonコードの実行に成功しました")
+    return {"output": result["stdout"]}
@@ -0,0 +1,290 @@
+# コンテキストパッカー
+#
+# 複数ファイルの内容をAIに渡す前に、トークン数を数え、価値の低い部分（ロックファイル、生成物、長い文字列リテラル）を
+# 省略・要約し、重要なファイルから順にトークン予算に収める。
+# 予算に収まらない場合は、ファイルをいくつかのグループに分けて並行して要約（map）し、要約をまとめて回答（reduce）する。
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config.settings import CONTEXT_TOKEN_BUDGET, CONTEXT_MAX_STRING_LITERAL
+from services.scheduler import run_bounded
+from utils.file_operations import run_io
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# 内容を送らず要約だけにするファイル
+LOCKFILE_NAMES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+    "Cargo.lock", "composer.lock", "Gemfile.lock", "go.sum", "bun.lockb",
+}
+GENERATED_SUFFIXES = (".min.js", ".min.css", ".map", ".bundle.js", ".chunk.js", ".pyc", ".svg")
+GENERATED_DIRS = {"node_modules", "dist", "build", ".next", "out", "coverage", "__pycache__"}
+# 1行の平均文字数がこれを超えるファイルは圧縮済みとみなす
+MINIFIED_LINE_LENGTH = 500
+
+_STRING_LITERAL = re.compile(
+    r'"(?:[^"\\\n]|\\.){%d,}"|\'(?:[^\'\\\n]|\\.){%d,}\'|`(?:[^`\\]|\\.){%d,}`'
+    % ((CONTEXT_MAX_STRING_LITERAL,) * 3)
+)
+_DATA_URI = re.compile(r"data:[\w/+.-]+;base64,[A-Za-z0-9+/=]{100,}")
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """
+    テキストのトークン数を数える関数
+
+    tiktoken がインストールされていればそれを使い、なければ文字種から見積もる
+    （ASCIIは約4文字で1トークン、日本語などはほぼ1文字で1トークン）。
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text, disallowed_special=()))
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+def _shorten_literal(match: re.Match) -> str:
+    literal = match.group(0)
+    quote = literal[0]
+    return f"{quote}{literal[1:41]}...（{len(literal) - 2}文字省略）{quote}"
+
+def strip_low_value(path: str, content: str) -> Tuple[str, Optional[str]]:
+    """
+    価値の低い部分を省略した内容と、省略した理由（省略していなければ None）を返す関数
+    """
+    name = os.path.basename(path)
+    parts = set(path.replace("\\", "/").split("/"))
+    lines = max(1, content.count("\n") + (0 if content.endswith("\n") else 1))
+    if name in LOCKFILE_NAMES:
+        return f"（ロックファイルのため省略: {lines}行）", "lockfile"
+    if name.endswith(GENERATED_SUFFIXES) or parts & GENERATED_DIRS:
+        return f"（生成物のため省略: {lines}行, {len(content)}文字）", "generated"
+    if "\0" in content[:8192]:
+        return f"（バイナリファイルのため省略: {len(content)}バイト）", "binary"
+    if len(content) / lines > MINIFIED_LINE_LENGTH:
+        return f"（圧縮されたファイルのため省略: {lines}行, {len(content)}文字）", "minified"
+    stripped = _DATA_URI.sub("data:（base64省略）", content)
+    stripped = _STRING_LITERAL.sub(_shorten_literal, stripped)
+    return stripped, ("long_literals" if stripped != content else None)
+
+@dataclass
+class ContextFile:
+    path: str
+    content: str
+    tokens: int = 0
+    score: float = 0.0
+    omitted: Optional[str] = None
+
+    def render(self) -> str:
+        content = self.content.rstrip("\n")
+        return f"### {self.path}\n```\n{content}\n```"
+
+@dataclass
+class PackedContext:
+    files: List[ContextFile]
+    tokens: int
+    # 予算に収まらなかったファイル
+    overflow: List[ContextFile] = field(default_factory=list)
+
+    def render(self) -> str:
+        return "\n\n".join(file.render() for file in self.files)
+
+def load_context_files(paths: List[str], root: Optional[str] = None) -> List[ContextFile]:
+    """
+    ファイルを読み込み、価値の低い部分を省略した ContextFile のリストを返す関数（ブロッキング）
+
+    表示するパスは root（未指定の場合は共通の親ディレクトリ）からの相対パスになる。
+    """
+    if root is None and paths:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    files = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            content = f.read()
+        display_path = os.path.relpath(path, root) if root else path
+        content, omitted = strip_low_value(display_path, content)
+        file = ContextFile(display_path, content, omitted=omitted)
+        file.tokens = count_tokens(file.render())
+        files.append(file)
+    return files
+
+def _module_names(path: str) -> List[str]:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if stem in ("index", "__init__", "main", "mod"):
+        parent = os.path.basename(os.path.dirname(path))
+        return [parent] if parent else []
+    return [stem]
+
+def mention_scores(files: List[ContextFile]) -> Dict[str, float]:
+    """
+    他のファイルから名前（モジュール名・ファイル名）で参照されている数をもとにした重要度を返す関数
+
+    参照されている数（被参照）を2倍、参照している数を1倍で数える。
+    """
+    patterns = {
+        file.path: [re.compile(rf"\b{re.escape(name)}\b") for name in _module_names(file.path) if len(name) > 1]
+        for file in files
+    }
+    scores = {file.path: 0.0 for file in files}
+    for file in files:
+        if file.omitted in ("lockfile", "generated", "binary", "minified"):
+            continue
+        for other in files:
+            if other is file:
+                continue
+            if any(pattern.search(file.content) for pattern in patterns[other.path]):
+                scores[other.path] += 2
+                scores[file.path] += 1
+    return scores
+
+def rank_files(files: List[ContextFile], scores: Optional[Dict[str, float]] = None) -> List[ContextFile]:
+    """
+    重要度の高い順に並べる関数（同じ重要度の場合は指定された順）
+    """
+    scores = scores if scores is not None else mention_scores(files)
+    for file in files:
+        file.score = scores.get(file.path, 0.0)
+    order = {id(file): i for i, file in enumerate(files)}
+    return sorted(files, key=lambda file: (-file.score, order[id(file)]))
+
+def pack(files: List[ContextFile], budget: int) -> PackedContext:
+    """
+    並んだ順にファイルを予算に収まるだけ詰める関数（収まらないファイルは飛ばして次を試す）
+    """
+    packed, overflow, used = [], [], 0
+    for file in files:
+        # ファイル間の区切り（空行）の分も数える
+        cost = file.tokens + 1
+        if used + cost <= budget:
+            packed.append(file)
+            used += cost
+        else:
+            overflow.append(file)
+    return PackedContext(packed, used, overflow)
+
+def _split_file(file: ContextFile, budget: int) -> List[ContextFile]:
+    # 1ファイルで予算を超える場合は行単位で分割する（見出しとコードブロックの記号の分をあけておく）
+    if file.tokens <= budget:
+        return [file]
+    limit = max(1, budget - count_tokens(file.path) - 16)
+    parts, lines, used = [], [], 0
+    for line in file.content.split("\n"):
+        tokens = count_tokens(line) + 1
+        if lines and used + tokens > limit:
+            parts.append(lines)
+            lines, used = [], 0
+        lines.append(line)
+        used += tokens
+    if lines:
+        parts.append(lines)
+    result = []
+    for i, part in enumerate(parts):
+        chunk = ContextFile(f"{file.path}（{i + 1}/{len(parts)}）", "\n".join(part), score=file.score, omitted=file.omitted)
+        chunk.tokens = count_tokens(chunk.render())
+        result.append(chunk)
+    return result
+
+def split_into_groups(files: List[ContextFile], budget: int) -> List[PackedContext]:
+    """
+    すべてのファイルを、それぞれが予算に収まるグループに分ける関数（並んだ順を保つ）
+    """
+    groups: List[PackedContext] = []
+    current: List[ContextFile] = []
+    used = 0
+    for file in files:
+        for part in _split_file(file, budget - 1):
+            cost = part.tokens + 1
+            if current and used + cost > budget:
+                groups.append(PackedContext(current, used))
+                current, used = [], 0
+            current.append(part)
+            used += cost
+    if current:
+        groups.append(PackedContext(current, used))
+    return groups
+
+def _truncate(text: str, budget: int) -> str:
+    if count_tokens(text) <= budget:
+        return text
+    # 見積もりが予算に収まるまで末尾を削る
+    ratio = budget / max(1, count_tokens(text))
+    while count_tokens(text) > budget and text:
+        text = text[:int(len(text) * ratio * 0.95)]
+    return text + "\n（以下省略）"
+
+async def run_with_context(
+    instruction: str, paths: List[str], generate: Callable[[str], Awaitable[Dict[str, Any]]],
+    map_instruction: str, reduce_instruction: str,
+    budget: int = CONTEXT_TOKEN_BUDGET, scores: Optional[Dict[str, float]] = None,
+    max_in_flight: Optional[int] = None, files: Optional[List[ContextFile]] = None,
+    provider: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    ファイルの内容をトークン予算に収めてAIに渡す関数
+
+    - すべてのファイルが予算に収まる場合: instruction + ファイルの内容で1回生成する
+    - 収まらない場合: ファイルをグループに分けて map_instruction で並行して要約し、
+      要約をまとめて reduce_instruction + instruction で回答を生成する
+
+    generate はプロンプトを受け取り {"generated_text": ...} を返す関数。
+    provider を指定した場合は、要約のリクエストをそのプロバイダのレート制限に従って送る。
+    返り値は最後の生成結果に、パッキングの結果（"context"）を加えたもの。
+    """
+    if files is None:
+        files = await run_io(load_context_files, paths)
+    ranked = rank_files(files, scores)
+    available = max(1, budget - count_tokens(instruction))
+    packed = pack(ranked, available)
+    context = {
+        "budget": budget,
+        "files": len(files),
+        "omitted": {file.path: file.omitted for file in files if file.omitted},
+        "order": [file.path for file in ranked],
+    }
+
+    if not packed.overflow:
+        logger.info(f"コンテキストを1つのプロンプトに収めました: {len(packed.files)}ファイル, {packed.tokens}トークン")
+        result = await generate(instruction + packed.render())
+        return {**result, "context": {**context, "strategy": "single", "tokens": packed.tokens}}
+
+    map_budget = max(1, budget - count_tokens(map_instruction))
+    groups = split_into_groups(ranked, map_budget)
+    logger.info(f"コンテキストが予算を超えるため、{len(groups)}グループに分けて要約します（{len(files)}ファイル）")
+
+    async def summarize(index: int):
+        result = await generate(map_instruction + groups[index].render())
+        return result["generated_text"]
+
+    mapped = await run_bounded(range(len(groups)), summarize, max_in_flight, provider=provider, key="group")
+    summaries = []
+    for i, item in enumerate(mapped):
+        paths_in_group = ", ".join(file.path for file in groups[i].files)
+        if item["status"] == "success":
+            summaries.append(f"### グループ{i + 1}（{paths_in_group}）\n{item['result']}")
+        else:
+            summaries.append(f"### グループ{i + 1}（{paths_in_group}）\n（要約に失敗しました: {item['error']}）")
+    if all(item["status"] == "error" for item in mapped):
+        raise RuntimeError(f"すべてのグループの要約に失敗しました: {mapped[0]['error']}")
+
+    reduce_prompt = reduce_instruction + instruction
+    summary_text = _truncate("\n\n".join(summaries), max(1, budget - count_tokens(reduce_prompt)))
+    result = await generate(reduce_prompt + summary_text)
+    return {
+        **result,
+        "context": {
+            **context,
+            "strategy": "map_reduce",
+            "groups": len(groups),
+            "failed_groups": sum(1 for item in mapped if item["status"] == "error"),
+        },
+    }
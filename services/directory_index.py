@@ -0,0 +1,460 @@
+import os
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+from watchdog.observers import Observer
+from watchdog.observers.api import ObservedWatch
+from watchdog.events import FileSystemEventHandler
+from utils.gitignore import GitIgnoreMatcher, get_gitignore_matcher
+
+logger = logging.getLogger(__name__)
+
+def _split_path(rel_path: Optional[str]) -> List[str]:
+    """
+    相対パスを要素に分割する関数（ルートの外を指すパスは ValueError）
+    """
+    if not rel_path:
+        return []
+    normalized = os.path.normpath(rel_path.replace("\\", "/")).replace(os.sep, "/").strip("/")
+    if normalized == ".":
+        return []
+    parts = normalized.split("/")
+    if ".." in parts or os.path.isabs(rel_path):
+        raise ValueError(f"不正なパスです: {rel_path}")
+    return parts
+
+class _Node:
+    """
+    ディレクトリインデックスの1エントリ
+
+    cached にはフォルダの children（APIレスポンス用のリスト）を保持し、
+    配下に変更があった場合のみ None に戻して作り直す。
+    """
+    __slots__ = ("name", "path", "is_dir", "children", "cached")
+
+    def __init__(self, name: str, path: str, is_dir: bool):
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.children: Dict[str, "_Node"] = {}
+        self.cached: Optional[List[dict]] = None
+
+class DirectoryIndex:
+    """
+    プロジェクトごとのディレクトリ構造のインメモリインデックス
+
+    os.scandir で一度だけ走査し、以降は watchdog のイベントで差分更新する。
+    ファイルの内容は読まない。
+    """
+
+    def __init__(self, root: str, gitignore_path: str):
+        self.root = os.path.abspath(root)
+        self.gitignore_path = os.path.abspath(gitignore_path)
+        self.matcher: GitIgnoreMatcher = None
+        # .gitignoreの場所（マッチャーのルート）から見たインデックスのルート
+        self._prefix = ""
+        self._root_node = _Node("", "", True)
+        self._lock = threading.RLock()
+        self._load_matcher()
+
+    def seed(self):
+        """
+        os.scandir でディレクトリ全体を走査してインデックスを作り直す
+        """
+        with self._lock:
+            self._load_matcher()
+            self._root_node = _Node("", "", True)
+            self._scan(self._root_node)
+        logger.info(f"ディレクトリインデックスを作成しました: {self.root}")
+
+    def _load_matcher(self):
+        gitignore_root = os.path.dirname(self.gitignore_path)
+        prefix = os.path.relpath(self.root, gitignore_root)
+        if prefix.startswith(".."):
+            gitignore_root, prefix = self.root, "."
+        self.matcher = get_gitignore_matcher(gitignore_root)
+        self._prefix = "" if prefix == "." else prefix
+
+    def _ignored(self, rel_path: str, is_dir: bool) -> bool:
+        return self.matcher.match(os.path.join(self._prefix, rel_path), is_dir)
+
+    def _scan(self, node: _Node):
+        # 再帰を使わずにスタックで走査する
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            current.cached = None
+            try:
+                entries = list(os.scandir(os.path.join(self.root, current.path)))
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+            for entry in entries:
+                is_dir = entry.is_dir()
+                path = os.path.join(current.path, entry.name)
+                if self._ignored(path, is_dir):
+                    continue
+                child = _Node(entry.name, path, is_dir)
+                current.children[entry.name] = child
+                if is_dir:
+                    stack.append(child)
+
+    def _relative_parts(self, abs_path: str) -> Optional[List[str]]:
+        rel_path = os.path.relpath(abs_path, self.root)
+        if rel_path == "." or rel_path.startswith(".."):
+            return None
+        return rel_path.split(os.sep)
+
+    def _find_parent(self, parts: List[str]) -> Optional[List[_Node]]:
+        """
+        親フォルダまでのノード列（ルートから順）を返す。途中が存在しない/無視対象の場合は None
+        """
+        chain = [self._root_node]
+        for name in parts[:-1]:
+            node = chain[-1].children.get(name)
+            if node is None or not node.is_dir:
+                return None
+            chain.append(node)
+        return chain
+
+    @staticmethod
+    def _invalidate(chain: List[_Node]):
+        for node in chain:
+            node.cached = None
+
+    def add(self, abs_path: str, is_dir: bool):
+        parts = self._relative_parts(abs_path)
+        if not parts:
+            return
+        with self._lock:
+            if self._ignored(os.sep.join(parts), is_dir):
+                return
+            chain = self._find_parent(parts)
+            if chain is None:
+                return
+            parent = chain[-1]
+            node = parent.children.get(parts[-1])
+            if node is None or node.is_dir != is_dir:
+                node = _Node(parts[-1], os.path.join(parent.path, parts[-1]), is_dir)
+                parent.children[parts[-1]] = node
+                if is_dir:
+                    self._scan(node)
+                self._invalidate(chain)
+
+    def remove(self, abs_path: str):
+        parts = self._relative_parts(abs_path)
+        if not parts:
+            return
+        with self._lock:
+            chain = self._find_parent(parts)
+            if chain is None:
+                return
+            if chain[-1].children.pop(parts[-1], None) is not None:
+                self._invalidate(chain)
+        self._check_gitignore(abs_path)
+
+    def update(self, abs_path: str, is_dir: bool):
+        """
+        作成・変更・移動先のエントリを反映する（watch_tree から呼ばれる）
+        """
+        self.add(abs_path, is_dir)
+        self._check_gitignore(abs_path)
+
+    def _check_gitignore(self, abs_path: str):
+        # .gitignore（入れ子を含む）が変わった場合は無視対象が変わるため作り直す
+        if os.path.basename(abs_path) == ".gitignore" and self._relative_parts(abs_path):
+            logger.info(f".gitignoreの変更を検知しました。インデックスを作り直します: {self.root}")
+            self.matcher.invalidate()
+            self.seed()
+
+    def _find(self, rel_path: str) -> _Node:
+        node = self._root_node
+        for name in _split_path(rel_path):
+            node = node.children.get(name)
+            if node is None or not node.is_dir:
+                raise FileNotFoundError(f"ディレクトリが見つかりません: {rel_path}")
+        return node
+
+    def structure(self, path: str = "", depth: Optional[int] = None) -> List[dict]:
+        """
+        ディレクトリ構造（name・type・path・フォルダは children）を返す（変更のあったフォルダのみ作り直す）
+
+        path: 起点とするサブディレクトリ（ルートからの相対パス）
+        depth: 返す階層の深さ。これより深いフォルダは children の代わりに has_children を返す
+        """
+        with self._lock:
+            node = self._find(path)
+            if depth is None:
+                return self._render(node)
+            return self._render_depth(node, depth)
+
+    def entries(self, path: str = "", depth: Optional[int] = None,
+                cursor: Optional[str] = None, limit: int = 200) -> Tuple[List[dict], Optional[str]]:
+        """
+        深さ優先（各階層は名前順）のフラットな一覧をカーソル付きで返す
+
+        cursor には前回の next_cursor（最後に返したエントリのパス）を渡す。
+        戻り値: (エントリのリスト, 次のカーソル。最後まで返した場合は None)
+        """
+        cursor_parts = tuple(_split_path(cursor)) if cursor else None
+        items = []
+        with self._lock:
+            start = self._find(path)
+            # 行きがけ順（名前順）で走査する。この順序はパス要素のタプルの辞書順と一致する
+            stack = [(self._sorted_children(start), 1)]
+            while stack:
+                children, level = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    continue
+                descend = child.is_dir and (depth is None or level < depth)
+                if cursor_parts is not None:
+                    child_parts = tuple(_split_path(child.path))
+                    cursor_prefix = cursor_parts[:len(child_parts)]
+                    # カーソルより前のエントリとそのサブツリーは読み飛ばす
+                    if child_parts < cursor_prefix:
+                        continue
+                    if child_parts == cursor_prefix:
+                        if descend:
+                            stack.append((self._sorted_children(child), level + 1))
+                        continue
+                    cursor_parts = None
+                if len(items) == limit:
+                    return items, items[-1]["path"]
+                items.append(self._entry(child, level))
+                if descend:
+                    stack.append((self._sorted_children(child), level + 1))
+        return items, None
+
+    @staticmethod
+    def _sorted_children(node: _Node) -> Iterator[_Node]:
+        return iter([node.children[name] for name in sorted(node.children)])
+
+    @staticmethod
+    def _entry(node: _Node, level: int) -> dict:
+        entry = {
+            "name": node.name,
+            "type": "folder" if node.is_dir else "file",
+            "path": node.path,
+            "depth": level,
+        }
+        if node.is_dir:
+            entry["has_children"] = bool(node.children)
+        return entry
+
+    def _render(self, node: _Node) -> List[dict]:
+        if node.cached is None:
+            items = []
+            for name in sorted(node.children):
+                child = node.children[name]
+                if child.is_dir:
+                    items.append({
+                        "name": child.name,
+                        "type": "folder",
+                        "path": child.path,
+                        "children": self._render(child),
+                    })
+                else:
+                    items.append({
+                        "name": child.name,
+                        "type": "file",
+                        "path": child.path,
+                    })
+            node.cached = items
+        return node.cached
+
+    def _render_depth(self, node: _Node, depth: int) -> List[dict]:
+        items = []
+        for name in sorted(node.children):
+            child = node.children[name]
+            if not child.is_dir:
+                items.append({"name": child.name, "type": "file", "path": child.path})
+            elif depth > 1:
+                items.append({
+                    "name": child.name,
+                    "type": "folder",
+                    "path": child.path,
+                    "children": self._render_depth(child, depth - 1),
+                })
+            else:
+                items.append({
+                    "name": child.name,
+                    "type": "folder",
+                    "path": child.path,
+                    "has_children": bool(child.children),
+                })
+        return items
+
+_indexes: Dict[str, DirectoryIndex] = {}
+_indexes_lock = threading.Lock()
+_observer = None
+# 監視しているルート -> (watchdogの監視, イベントを配るハンドラ)
+_watches: Dict[str, Tuple[ObservedWatch, "_TreeEventHandler"]] = {}
+_watches_lock = threading.Lock()
+
+# .gitignore に書かれていなくても走査しないディレクトリ（インポートグラフ・関連コード・全文検索で共通）
+SKIP_DIRS = {"node_modules", ".git", "__pycache__", ".next", "dist", "build", ".venv", "venv"}
+
+def in_skipped_dir(rel_path: str, is_dir: bool = False) -> bool:
+    """
+    相対パス（区切りは /）が SKIP_DIRS のディレクトリ配下（is_dir の場合は自身を含む）にあれば True
+    """
+    parts = rel_path.split("/")
+    return any(part in SKIP_DIRS for part in (parts if is_dir else parts[:-1]))
+
+def walk_files(root: str, start: str = "") -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    root（または start 以下のサブディレクトリ）配下の通常のファイルを (ルートからの相対パス, DirEntry) で返すイテレータ
+
+    再帰を使わずにスタックで走査し、SKIP_DIRS と .gitignore で無視されるものはたどらない。
+    start 自身が無視対象でないことは呼び出し側で確認すること。
+    """
+    matcher = get_gitignore_matcher(root)
+    stack = [start]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(os.path.join(root, current)))
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        for entry in entries:
+            rel_path = f"{current}/{entry.name}" if current else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if (is_dir and entry.name in SKIP_DIRS) or matcher.match(rel_path, is_dir):
+                    continue
+                if is_dir:
+                    stack.append(rel_path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield rel_path, entry
+            except OSError:
+                continue
+
+class _TreeEventHandler(FileSystemEventHandler):
+    """
+    1つの監視のイベントを、登録されたすべてのインデックスに配るハンドラ
+
+    インデックスは update(絶対パス, is_dir) と remove(絶対パス) を持ち、自身のルート外のパスは無視すること。
+    """
+
+    def __init__(self, listeners):
+        self.listeners = list(listeners)
+
+    def _dispatch(self, method: str, *args):
+        for listener in list(self.listeners):
+            # 監視スレッドを止めないよう、例外はログに残して続ける
+            try:
+                getattr(listener, method)(*args)
+            except Exception as e:
+                logger.error(f"{type(listener).__name__}の更新中にエラーが発生しました: {str(e)}")
+
+    def on_created(self, event):
+        self._dispatch("update", event.src_path, event.is_directory)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._dispatch("update", event.src_path, False)
+
+    def on_deleted(self, event):
+        self._dispatch("remove", event.src_path)
+
+    def on_moved(self, event):
+        self._dispatch("remove", event.src_path)
+        # ディレクトリの移動では配下のファイルごとのイベントが来ない場合があるため、移動先は is_dir=True で配下ごと反映させる
+        self._dispatch("update", event.dest_path, event.is_directory)
+
+def get_observer() -> Observer:
+    """
+    インデックスの更新に使う共有のwatchdogオブザーバーを取得する関数（監視の登録は watch_tree で行う）
+    """
+    global _observer
+    if _observer is None:
+        _observer = Observer()
+        _observer.daemon = True
+        _observer.start()
+        logger.info("インデックス用のファイル監視を開始しました")
+    return _observer
+
+def watch_tree(root: str, listener):
+    """
+    root 配下の変更を listener（update / remove を持つインデックス）に通知するよう登録する関数
+
+    同じルートや、監視済みのルートの配下は既存の監視を共有する（インデックスごとに監視を作らない）。
+    監視済みのルートを含むルートが登録された場合は、その監視にまとめる。
+    """
+    abs_root = os.path.abspath(root)
+    with _watches_lock:
+        for watched, (_, handler) in _watches.items():
+            if abs_root == watched or abs_root.startswith(watched + os.sep):
+                handler.listeners.append(listener)
+                return
+        nested = [watched for watched in _watches if watched.startswith(abs_root + os.sep)]
+        handler = _TreeEventHandler([listener] + [other for watched in nested for other in _watches[watched][1].listeners])
+        observer = get_observer()
+        # 変更を取りこぼさないよう、新しい監視を始めてから配下の監視を止める
+        _watches[abs_root] = (observer.schedule(handler, abs_root, recursive=True), handler)
+        for watched in nested:
+            observer.unschedule(_watches.pop(watched)[0])
+
+def get_directory_index(root: str, gitignore_path: str) -> DirectoryIndex:
+    """
+    ルートディレクトリごとのインデックスを取得する関数（初回のみ走査し、以降は監視で更新される）
+
+    ブロッキング処理を含むため、非同期関数からは asyncio.to_thread で呼び出すこと。
+    """
+    abs_root = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(abs_root)
+        if index is not None:
+            return index
+        if not os.path.isdir(abs_root):
+            raise FileNotFoundError(f"ディレクトリが見つかりません: {root}")
+        index = DirectoryIndex(abs_root, gitignore_path)
+        # 走査中の変更を取りこぼさないよう、監視を先に開始する
+        watch_tree(abs_root, index)
+        index.seed()
+        _indexes[abs_root] = index
+        return index
+
+def iter_directory_entries(root: str, gitignore_path: str, path: str = "",
+                           depth: Optional[int] = None) -> Iterator[dict]:
+    """
+    os.scandir で走査しながらエントリを1件ずつ返すイテレータを作成する関数（ストリーミング用）
+
+    インデックスを作らずに走査した順に返すため、巨大なディレクトリでも最初のエントリがすぐに返る。
+    パスの検証はイテレータを返す前に行う。
+    """
+    index = DirectoryIndex(root, gitignore_path)
+    start = os.path.join(*_split_path(path)) if path else ""
+    if not os.path.isdir(os.path.join(index.root, start)):
+        raise FileNotFoundError(f"ディレクトリが見つかりません: {path}")
+    return _walk_entries(index, start, depth)
+
+def _walk_entries(index: DirectoryIndex, start: str, depth: Optional[int]) -> Iterator[dict]:
+    def sorted_entries(rel_dir: str) -> Iterator[os.DirEntry]:
+        try:
+            with os.scandir(os.path.join(index.root, rel_dir)) as scanner:
+                return iter(sorted(scanner, key=lambda entry: entry.name))
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            return iter(())
+
+    # 行きがけ順（名前順）で走査する
+    stack = [(start, sorted_entries(start), 1)]
+    while stack:
+        current, entries, level = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            continue
+        is_dir = entry.is_dir()
+        rel_path = os.path.join(current, entry.name)
+        if index._ignored(rel_path, is_dir):
+            continue
+        yield {
+            "name": entry.name,
+            "type": "folder" if is_dir else "file",
+            "path": rel_path,
+            "depth": level,
+        }
+        if is_dir and (depth is None or level < depth):
+            stack.append((rel_path, sorted_entries(rel_path), level + 1))
@@ -6,7 +6,11 @@ import json
 import logging
 import aiofiles
 from fastapi import HTTPException
-import fnmatch
+from utils.gitignore import get_gitignore_matcher, read_gitignore, should_ignore
+from utils.file_utils import BABEL_ROOT
+from services.directory_index import get_directory_index, iter_directory_entries
+import itertools
+from typing import Iterator, List, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -42,8 +46,7 @@ def get_file_path(projectId: str, filename: str, upload_dir: str) -> str:
     projectIdに基づいてファイルパスを決定し、ファイルの存在を確認する関数
     """
     if projectId == "babel":
-        file_path = os.path.join('..', filename)
-        print(file_path)
+        file_path = os.path.join(BABEL_ROOT, filename)
     else:
         file_path = os.path.join(os.path.expanduser("~"), "babel_generated", projectId, filename)
     
@@ -88,185 +91,164 @@ async def load_file(projectId: str, filename: str):
         logger.error(f"ファイルの読み込み中にエラーが発生: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def get_generated_dirs():
+async def get_generated_dirs(cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    生成されたアプリの一覧を取得する関数
+
+    limit を指定した場合は名前順で cursor（前回の next_cursor）より後ろを返す: {"dirs": [...], "next_cursor": ...}
+    """
     # ホームディレクトリを取得
     home_dir = os.path.expanduser("~")
     base_path = os.path.join(home_dir, "babel_generated")
     logger.info(f"生成されたディレクトリの取得を開始します。ベースパス: {base_path}")
     try:
-        logger.debug("ディレクトリ構造の作成を開始します。")
-        gitignore_patterns = read_gitignore("../../.gitignore")
-        structure = create_structure(base_path, base_path, gitignore_patterns)
-        logger.debug(f"ディレクトリ構造を作成しました: {structure}")
-        
-        app_dirs = []
         logger.debug("アプリディレクトリの検索を開始します。")
-        for item in structure:
-            logger.debug(f"項目を処理中: {item['name']}")
-            if item["type"] == "folder":
-                frontend_path = os.path.join(item["path"])
-                full_path = os.path.join(base_path, frontend_path)
-                logger.debug(f"フロントエンドパスを確認中: {full_path}")
-                
-                if os.path.exists(full_path):
-                    app_dir = {
-                        "name": item["name"],
-                        "path": f"../generated/{item['name']}/frontend/App"
-                    }
-                    app_dirs.append(app_dir)
-                    logger.debug(f"アプリディレクトリを追加しました: {app_dir}")
-                else:
-                    logger.debug(f"フロントエンドパスが存在しません: {full_path}")
+        # 直下のフォルダだけを確認すればよいため、配下の走査は行わない
+        # コンパイル済みのマッチャーを使い回す（.gitignoreが変更された場合のみ作り直される）
+        matcher = get_gitignore_matcher(os.path.abspath("../.."))
+        app_dirs = []
+        with os.scandir(base_path) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                # .cache などの内部用ディレクトリはアプリとして扱わない
+                if not entry.is_dir() or entry.name.startswith(".") or matcher.match(entry.name, True):
+                    continue
+                if cursor is not None and entry.name <= cursor:
+                    continue
+                if limit is not None and len(app_dirs) == limit:
+                    logger.info(f"生成されたディレクトリを{limit}件取得しました。次のカーソル: {app_dirs[-1]['name']}")
+                    return {"dirs": app_dirs, "next_cursor": app_dirs[-1]["name"]}
+                app_dir = {
+                    "name": entry.name,
+                    "path": f"../generated/{entry.name}/frontend/App"
+                }
+                app_dirs.append(app_dir)
+                logger.debug(f"アプリディレクトリを追加しました: {app_dir}")
         
         logger.info(f"生成されたディレクトリを正常に取得しました。総数: {len(app_dirs)}")
         logger.debug(f"取得されたアプリディレクトリの詳細: {app_dirs}")
+        if limit is not None:
+            return {"dirs": app_dirs, "next_cursor": None}
         return app_dirs
     except Exception as e:
         logger.error(f"生成されたディレクトリの取得中にエラーが発生しました: {str(e)}", exc_info=True)
         logger.debug(f"エラーの詳細情報: {e.__class__.__name__}")
         raise HTTPException(status_code=500, detail="ディレクトリの取得に失敗しました")
 
-async def get_directory_structure(path_type: str):
-    logger.info(f"ディレクトリ構造の取得を開始します。path_type: {path_type}")
-
-    # 現在の作業ディレクトリを取得し、表示する
-    import os
-
-    def print_current_directory():
-        """
-        現在の作業ディレクトリを取得し、表示する関数
-        """
-        current_dir = os.getcwd()
-        logger.debug(f"現在の作業ディレクトリ: {current_dir}")
-
-    # 関数を呼び出して現在のディレクトリを表示
-    print_current_directory()
-
+def resolve_structure_paths(path_type: str):
+    """
+    path_typeから走査対象のパス一覧と.gitignoreのパスを決定する関数
+    """
     if path_type == "file_explorer":
-        base_path = "../src/components/generated/"
+        base_paths = ["../src/components/generated/"]
     elif path_type == "requirements_definition":
-        base_path = "meta/1_domain_exp"
+        base_paths = ["meta/1_domain_exp"]
     elif path_type == "babel":
         base_paths = ["../../src", "../../Dockerfile", "../../docker-compose.yml", "../../README.md"]
     else:
         # ホームディレクトリのbabel_generatedフォルダから取得するように変更
         home_dir = os.path.expanduser("~")
-        base_path = os.path.join(home_dir, "babel_generated", path_type)
-        logger.debug(f"base_pathを設定しました: {base_path}")
+        base_paths = [os.path.join(home_dir, "babel_generated", path_type)]
 
-    logger.info(f"base_pathを設定しました: {base_path if path_type != 'babel' else base_paths}")
+    if path_type == "babel":
+        gitignore_path = "../../.gitignore"
+    else:
+        gitignore_path = os.path.join(base_paths[0], ".gitignore")
+    return base_paths, gitignore_path
+
+async def get_directory_structure(path_type: str, path: Optional[str] = None, depth: Optional[int] = None,
+                                  cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    ディレクトリ構造を取得する関数
+
+    path: 起点とするサブディレクトリ / depth: 返す階層の深さ
+    limit を指定した場合はフラットな一覧を cursor 付きで返す: {"entries": [...], "next_cursor": ...}
+    """
+    logger.info(f"ディレクトリ構造の取得を開始します。path_type: {path_type}")
+    logger.debug(f"現在の作業ディレクトリ: {os.getcwd()}")
+
+    base_paths, gitignore_path = resolve_structure_paths(path_type)
+    logger.info(f"base_pathを設定しました: {base_paths}")
+    logger.debug(f".gitignoreファイルのパスを設定しました: {gitignore_path}")
+
+    if path_type == "babel" and (path or cursor or limit is not None):
+        raise HTTPException(status_code=400, detail="babelではpath・cursor・limitは指定できません")
 
     try:
         if path_type == "babel":
-            gitignore_patterns = read_gitignore("../../.gitignore")
-        else:
-            gitignore_path = os.path.join(base_path, ".gitignore")
-            logger.debug(f".gitignoreファイルのパスを設定しました: {gitignore_path}")
             gitignore_patterns = read_gitignore(gitignore_path)
-            logger.info(f".gitignoreファイルを読み込みました: {gitignore_path}")
-            logger.debug(f"読み込んだgitignoreパターン: {gitignore_patterns}")
-
-        if path_type == "babel":
             structure = []
             for base_path in base_paths:
                 logger.debug(f"babelモード: {base_path}を処理中")
                 if os.path.isfile(base_path):
                     if not should_ignore(os.path.basename(base_path), gitignore_patterns):
-                        content = read_file_content(base_path)
                         structure.append({
                             "name": os.path.basename(base_path),
                             "type": "file",
                             "path": base_path,
                         })
-                        # logger.debug(f"ファイルを追加しました: {os.path.basename(base_path)}")
                 else:
-                    structure.extend(create_structure(base_path, base_path, gitignore_patterns))
-                    # logger.debug(f"ディレクトリ構造を追加しました: {base_path}")
-        else:
-            structure = create_structure(base_path, base_path, gitignore_patterns)
-            # logger.debug(f"ディレクトリ構造を作成しました: {base_path}")
-
-        # logger.info(f"{path_type}のディレクトリ構造を正常に作成しました")
-        return {"structure": structure}
+                    index = await asyncio.to_thread(get_directory_index, base_path, gitignore_path)
+                    structure.extend(index.structure(depth=depth))
+            return {"structure": structure}
+
+        # インデックスは初回のみ走査し、以降はファイル監視で差分更新される
+        index = await asyncio.to_thread(get_directory_index, base_paths[0], gitignore_path)
+        if limit is not None:
+            entries, next_cursor = index.entries(path or "", depth, cursor, max(1, limit))
+            return {"entries": entries, "next_cursor": next_cursor}
+        return {"structure": index.structure(path or "", depth)}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        # logger.error(f"{path_type}のディレクトリ構造の取得中にエラーが発生しました: {str(e)}", exc_info=True)
+        logger.error(f"{path_type}のディレクトリ構造の取得中にエラーが発生しました: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="ディレクトリ構造の取得に失敗しました")
 
-def create_structure(path, base_path, gitignore_patterns):
-    structure = []
-    for item in os.listdir(path):
-        if should_ignore(item, gitignore_patterns):
-            continue
-        item_path = os.path.join(path, item)
-        relative_path = os.path.relpath(item_path, base_path)
-        if os.path.isdir(item_path):
-            structure.append({
-                "name": item,
-                "type": "folder",
-                "path": relative_path,
-                "children": create_structure(item_path, base_path, gitignore_patterns)
-            })
-        else:
-            content = read_file_content(item_path)
-            structure.append({
-                "name": item,
-                "type": "file",
-                "path": relative_path,
-            })
-    return structure
-
-def read_gitignore(path):
-    # .gitignoreファイルを読み込む関数
-    if os.path.exists(path):
-        # ファイルが存在する場合
-        with open(path, 'r') as f:
-            # ファイルを開いて読み込む
-            return [
-                line.strip()  # 各行の前後の空白を削除
-                for line in f
-                if line.strip() and not line.startswith('#')  # 空行とコメント行を除外
-            ]
-    # ファイルが存在しない場合は空のリストを返す
-    return []
-
-def should_ignore(item, gitignore_patterns):
-    if gitignore_patterns is None:
-        return False
-    
-    # node_modules、.git、.nextディレクトリを無視
-    if any(dir in item.split(os.path.sep) for dir in ['node_modules', '.git']):
-        return True
-    
-    # その他の .gitignore パターンをチェック
-    for pattern in gitignore_patterns:
-        if fnmatch.fnmatch(item, pattern):
-            return True
-        # ディレクトリパターンの場合、すべてのサブディレクトリを無視
-        if pattern.endswith('/') and (item.startswith(pattern) or item.startswith(pattern.rstrip('/'))):
-            return True
-    
-    return False
-
-def read_file_content(file_path):
+def stream_directory_structure(path_type: str, path: Optional[str] = None, depth: Optional[int] = None) -> Iterator[str]:
+    """
+    走査しながらエントリを1行1JSON（NDJSON）で返すイテレータを作成する関数
+    """
+    base_paths, gitignore_path = resolve_structure_paths(path_type)
+    if path_type == "babel" and path:
+        raise HTTPException(status_code=400, detail="babelではpathは指定できません")
     try:
-        if os.path.splitext(file_path)[1] in ['.gz', '.woff2', '.ico', '.pyc']:
-            return None
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
-    except UnicodeDecodeError:
-        # logger.warning(f"ファイルの読み込みをスキップしました（エンコーディングエラー）: {file_path}")
-        return None
-    except Exception as e:
-        # logger.error(f"ファイル読み込み中にエラーが発生しました: {file_path}, エラー: {str(e)}")
-        return None
+        if path_type == "babel":
+            gitignore_patterns = read_gitignore(gitignore_path)
+            iterators = []
+            for base_path in base_paths:
+                if os.path.isfile(base_path):
+                    if not should_ignore(os.path.basename(base_path), gitignore_patterns):
+                        iterators.append(iter([{"name": os.path.basename(base_path), "type": "file", "path": base_path, "depth": 1}]))
+                elif os.path.isdir(base_path):
+                    iterators.append(iter_directory_entries(base_path, gitignore_path, depth=depth))
+            entries = itertools.chain.from_iterable(iterators)
+        else:
+            entries = iter_directory_entries(base_paths[0], gitignore_path, path or "", depth)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return (json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
 
 # ファイル操作サービス
 import os
 from fastapi import UploadFile
-from models.file import FileModel
-from utils.file_operations import get_file_size, ensure_directory_exists, read_file, write_file, append_to_file
+from models.file import FileModel, FileLineEdit
+from utils.line_index import apply_line_edits
+from utils.file_operations import (
+    get_file_size, ensure_directory_exists, read_file, write_file, append_to_file, delete_file,
+    run_io, parse_range_header, set_replacement_mode, FILE_IO_CHUNK_SIZE
+)
+import tempfile
 
 class FileService:
+    """
+    ファイル操作サービス
+
+    ブロッキングするファイル操作はすべて run_io でI/O専用スレッドプールに渡し、イベントループ上では実行しない。
+    """
+
     def __init__(self, upload_dir=os.path.expanduser("~")):
         """
         FileServiceクラスのコンストラクタ
@@ -278,43 +260,91 @@ class FileService:
         ensure_directory_exists(self.upload_dir)
 
     async def save_file(self, file: UploadFile) -> FileModel:
-        file_path = get_file_path("babel", file.filename, self.upload_dir)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        size = get_file_size(file_path)
-        return FileModel(filename=file.filename, size=size)
+        """
+        アップロードされたファイルを一定サイズのチャンクごとに一時ファイルへ書き込み、最後にリネームで置き換える
 
-    async def list_files(self) -> list[FileModel]:
+        1リクエストあたりのメモリ使用量はファイルサイズに関係なく FILE_IO_CHUNK_SIZE 程度に収まる。
+        """
+        filename = os.path.basename(file.filename)
+        if not filename:
+            raise ValueError("ファイル名が指定されていません")
+        file_path = os.path.join(self.upload_dir, filename)
+        fd, temp_path = await run_io(tempfile.mkstemp, dir=self.upload_dir, prefix=f".{filename}.", suffix=".part")
+        buffer = await run_io(os.fdopen, fd, "wb")
+        try:
+            while chunk := await file.read(FILE_IO_CHUNK_SIZE):
+                await run_io(buffer.write, chunk)
+            await run_io(buffer.close)
+            await run_io(set_replacement_mode, temp_path, file_path)
+            await run_io(os.replace, temp_path, file_path)
+        except BaseException:
+            await run_io(buffer.close)
+            if await run_io(os.path.exists, temp_path):
+                await run_io(os.remove, temp_path)
+            raise
+        size = await run_io(get_file_size, file_path)
+        return FileModel(filename=filename, size=size)
+
+    def _list_files(self) -> list[FileModel]:
         files = []
         for filename in os.listdir(self.upload_dir):
-            file_path = get_file_path("babel", filename, self.upload_dir)
+            file_path = os.path.join(self.upload_dir, filename)
+            if not os.path.isfile(file_path):
+                continue
             size = get_file_size(file_path)
             files.append(FileModel(filename=filename, size=size))
         return files
 
+    async def list_files(self) -> list[FileModel]:
+        return await run_io(self._list_files)
+
+    async def open_file_range(self, projectId: str, filename: str, range_header: Optional[str] = None):
+        """
+        ダウンロード用にファイルの範囲を決定する関数
+
+        Returns:
+            tuple: (ファイルパス, ファイルサイズ, 開始位置, 終了位置, 部分応答かどうか)
+        """
+        file_path = await run_io(get_file_path, projectId, filename, self.upload_dir)
+        if not await run_io(os.path.isfile, file_path):
+            raise FileNotFoundError(f"ファイル {filename} が見つかりません")
+        file_size = await run_io(get_file_size, file_path)
+        byte_range = parse_range_header(range_header, file_size) if file_size else None
+        if byte_range is None:
+            return file_path, file_size, 0, file_size - 1, False
+        return file_path, file_size, byte_range[0], byte_range[1], True
+
     async def get_file_content(self, projectId: str, filename: str) -> str:
-        file_path = get_file_path(projectId, filename, self.upload_dir)
-        return read_file(file_path)
+        file_path = await run_io(get_file_path, projectId, filename, self.upload_dir)
+        return await run_io(read_file, file_path)
 
+    async def patch_file(self, filename: str, edits: List[FileLineEdit]):
+        """
+        複数の行範囲の編集を1回のアトミックな書き込みで適用する関数
 
-    async def edit_file(self, filename: str, line_number: int, new_content: str):
+        行オフセットのインデックス（mtime・サイズで無効化）を使い、変更しない部分はバイト単位でコピーする。
+        """
         file_path = os.path.join(self.upload_dir, filename)
-        content = read_file(file_path).splitlines()
-        if line_number < 1 or line_number > len(content):
-            raise ValueError("Invalid line number")
-        content[line_number - 1] = new_content
-        write_file(file_path, "\n".join(content))
+        line_edits = [
+            (edit.start_line, edit.start_line if edit.end_line is None else edit.end_line, edit.new_lines)
+            for edit in edits
+        ]
+        await run_io(apply_line_edits, file_path, line_edits)
+
+    async def edit_file(self, filename: str, line_number: int, new_content: str):
+        await self.patch_file(filename, [
+            FileLineEdit(start_line=line_number, new_lines=new_content.splitlines() or [""])
+        ])
 
     async def append_to_file(self, filename: str, content: str):
         file_path = os.path.join(self.upload_dir, filename)
-        append_to_file(file_path, content)
+        await run_io(append_to_file, file_path, content)
 
     async def delete_file(self, filename: str):
         file_path = os.path.join(self.upload_dir, filename)
-        if not os.path.exists(file_path):
+        if not await run_io(os.path.exists, file_path):
             raise FileNotFoundError(f"File {filename} not found")
-        os.remove(file_path)
+        await run_io(delete_file, file_path)
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
@@ -1,7 +1,8 @@
 import google.generativeai as genai
-import asyncio
 import logging
-from config.settings import GEMINI_API_KEY
+from config.settings import GEMINI_API_KEY, GEMINI_MODEL
+from services.llm_limits import provider_semaphore
+from services.llm_cache import cached_generation
 
 logger = logging.getLogger(__name__)
 
@@ -16,21 +17,26 @@ generation_config = {
 }
 
 gemini_model = genai.GenerativeModel(
-    model_name="gemini-1.5-pro",
+    model_name=GEMINI_MODEL,
     generation_config=generation_config,
 )
 
-async def generate_text_gemini(prompt: str):
+async def generate_text_gemini(prompt: str, use_cache: bool = True):
     logger.info(f"Geminiリクエストを受信: prompt={prompt}")
-    try:
+    full_prompt = prompt + "コードはコードブロックに入れる 例 ```html <h1>Hello, World!</h1> ```"
+
+    async def generate():
         chat = gemini_model.start_chat(history=[])
-        response = await asyncio.to_thread(
-            chat.send_message,
-            prompt + "コードはコードブロックに入れる 例 ```html <h1>Hello, World!</h1> ```"
-        )
+        async with provider_semaphore("gemini"):
+            response = await chat.send_message_async(full_prompt)
         logger.info("Geminiでテキスト生成成功")
         logger.info(response.text)
         return {"generated_text": response.text}
+
+    try:
+        return await cached_generation(
+            "gemini", gemini_model.model_name, generation_config, full_prompt, generate, use_cache
+        )
     except Exception as e:
         logger.error(f"Geminiでのテキスト生成中にエラーが発生: {str(e)}")
         raise
\ No newline at end of file
@@ -1,24 +1,241 @@
-import asyncio
-import subprocess
-
-async def git_add(repo_path: str, file_path: str):
-    process = await asyncio.create_subprocess_exec(
-        'git', '-C', repo_path, 'add', file_path,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    stdout, stderr = await process.communicate()
-    if process.returncode != 0:
-        raise Exception(f"Git add failed: {stderr.decode()}")
-    return stdout.decode()
-
-async def git_commit(repo_path: str, message: str):
-    process = await asyncio.create_subprocess_exec(
-        'git', '-C', repo_path, 'commit', '-m', message,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    stdout, stderr = await process.communicate()
-    if process.returncode != 0:
-        raise Exception(f"Git commit failed: {stderr.decode()}")
-    return stdout.decode()
\ No newline at end of file
+# Gitサービス
+#
+# gitコマンドを呼び出すたびにプロセスを起動せず、GitPythonでリポジトリを操作する。
+# リポジトリのハンドルはプロジェクトごとにキャッシュし、インデックスの更新とコミットはプロセス内で行う。
+# GitPythonの操作はブロッキングするため、すべて run_io でI/O専用スレッドプールに渡す。
+import logging
+import os
+import threading
+from datetime import timezone
+from typing import Any, Dict, List, Optional, Union
+from git import NULL_TREE, Repo
+from git.exc import BadName, InvalidGitRepositoryError, NoSuchPathError
+from utils.file_operations import run_io
+
+logger = logging.getLogger(__name__)
+
+# 作業ツリーのルート -> Repo
+_repos: Dict[str, Repo] = {}
+# 探索を始めたディレクトリ -> 作業ツリーのルート
+_repo_roots: Dict[str, str] = {}
+# 作業ツリーのルート -> インデックスを操作する際のロック
+_repo_locks: Dict[str, threading.Lock] = {}
+_cache_lock = threading.Lock()
+
+class GitRepositoryNotFound(Exception):
+    pass
+
+def get_repo(path: str) -> Repo:
+    """
+    パス（ファイルまたはディレクトリ）を含むリポジトリのハンドルを取得する関数（キャッシュされる）
+    """
+    directory = os.path.abspath(path)
+    if not os.path.isdir(directory):
+        directory = os.path.dirname(directory)
+    with _cache_lock:
+        root = _repo_roots.get(directory)
+        if root is not None and root in _repos:
+            return _repos[root]
+    try:
+        repo = Repo(directory, search_parent_directories=True)
+    except (InvalidGitRepositoryError, NoSuchPathError):
+        raise GitRepositoryNotFound(f"Gitリポジトリが見つかりません: {path}")
+    root = os.path.abspath(repo.working_tree_dir)
+    with _cache_lock:
+        if root in _repos:
+            repo.close()
+            repo = _repos[root]
+        else:
+            _repos[root] = repo
+            _repo_locks[root] = threading.Lock()
+            logger.info(f"リポジトリを開きました: {root}")
+        _repo_roots[directory] = root
+    return repo
+
+def get_repo_root(path: str) -> str:
+    """
+    パスを含むリポジトリの作業ツリーのルートを返す関数
+    """
+    return os.path.abspath(get_repo(path).working_tree_dir)
+
+def _lock_for(repo: Repo) -> threading.Lock:
+    return _repo_locks[os.path.abspath(repo.working_tree_dir)]
+
+def _relative_paths(repo: Repo, repo_path: str, file_paths: List[str]) -> List[str]:
+    root = os.path.abspath(repo.working_tree_dir)
+    return [
+        os.path.relpath(os.path.abspath(os.path.join(repo_path, file_path)), root).replace(os.sep, '/')
+        for file_path in file_paths
+    ]
+
+def _head_commit(repo: Repo):
+    try:
+        return repo.head.commit
+    except ValueError:
+        # まだコミットがないリポジトリ
+        return None
+
+def _add(repo_path: str, file_paths: List[str]) -> List[str]:
+    repo = get_repo(repo_path)
+    paths = _relative_paths(repo, repo_path, file_paths)
+    root = repo.working_tree_dir
+    with _lock_for(repo):
+        index = repo.index
+        existing = [path for path in paths if os.path.lexists(os.path.join(root, path))]
+        if existing:
+            index.add(existing, write=False)
+        for path in paths:
+            if path not in existing:
+                index.entries.pop((path, 0), None)
+        index.write()
+    return paths
+
+async def git_add(repo_path: str, file_paths: Union[str, List[str]]) -> List[str]:
+    """
+    複数のファイルをまとめてインデックスに追加する関数（削除されたファイルはインデックスから外す）
+
+    Returns:
+        list: リポジトリのルートからの相対パス
+    """
+    if isinstance(file_paths, str):
+        file_paths = [file_paths]
+    if not file_paths:
+        return []
+    return await run_io(_add, repo_path, file_paths)
+
+def _has_staged_changes(repo_path: str, file_paths: Optional[List[str]] = None) -> bool:
+    repo = get_repo(repo_path)
+    with _lock_for(repo):
+        index = repo.index
+        head = _head_commit(repo)
+        if file_paths is None:
+            return bool(head.diff()) if head is not None else bool(index.entries)
+        for path in _relative_paths(repo, repo_path, file_paths):
+            entry = index.entries.get((path, 0))
+            try:
+                blob = head.tree / path if head is not None else None
+            except KeyError:
+                blob = None
+            if (entry is None) != (blob is None) or (entry is not None and entry.binsha != blob.binsha):
+                return True
+        return False
+
+async def git_has_staged_changes(repo_path: str, file_paths: Optional[List[str]] = None) -> bool:
+    """
+    HEADとインデックスに差分があるかを判定する関数（file_paths を指定した場合はそのファイルだけをプロセス内で比較する）
+    """
+    return await run_io(_has_staged_changes, repo_path, file_paths)
+
+def _commit(repo_path: str, message: str) -> Dict[str, Any]:
+    repo = get_repo(repo_path)
+    with _lock_for(repo):
+        commit = repo.index.commit(message)
+    return _commit_info(commit)
+
+async def git_commit(repo_path: str, message: str) -> Dict[str, Any]:
+    """
+    インデックスの内容をコミットする関数
+    """
+    return await run_io(_commit, repo_path, message)
+
+def _commit_info(commit) -> Dict[str, Any]:
+    return {
+        "hexsha": commit.hexsha,
+        "summary": commit.summary,
+        "message": commit.message,
+        "author": commit.author.name,
+        "email": commit.author.email,
+        "committed_at": commit.committed_datetime.astimezone(timezone.utc).isoformat(),
+    }
+
+def _change_type(diff) -> str:
+    # create_patch=True の場合 change_type が設定されないため、フラグから求める
+    if diff.new_file:
+        return "A"
+    if diff.deleted_file:
+        return "D"
+    if diff.renamed_file:
+        return "R"
+    return diff.change_type or "M"
+
+def _status(repo_path: str) -> Dict[str, Any]:
+    repo = get_repo(repo_path)
+    with _lock_for(repo):
+        index = repo.index
+        head = _head_commit(repo)
+        if head is None:
+            staged = [{"path": path, "change_type": "A"} for path, _ in index.entries]
+        else:
+            staged = [{"path": diff.b_path or diff.a_path, "change_type": _change_type(diff)} for diff in head.diff()]
+        unstaged = [{"path": diff.a_path or diff.b_path, "change_type": _change_type(diff)} for diff in index.diff(None)]
+        return {
+            "root": repo.working_tree_dir,
+            "branch": None if repo.head.is_detached else repo.active_branch.name,
+            "head": head.hexsha if head is not None else None,
+            "staged": staged,
+            "unstaged": unstaged,
+            "untracked": repo.untracked_files,
+        }
+
+async def git_status(repo_path: str) -> Dict[str, Any]:
+    """
+    ブランチ、ステージ済み・未ステージの変更、未追跡ファイルを返す関数
+    """
+    return await run_io(_status, repo_path)
+
+def _diff(repo_path: str, path: Optional[str] = None, staged: bool = False, commit: Optional[str] = None) -> List[Dict[str, Any]]:
+    repo = get_repo(repo_path)
+    with _lock_for(repo):
+        return _collect_diff(repo, repo_path, path, staged, commit)
+
+def _collect_diff(repo: Repo, repo_path: str, path: Optional[str], staged: bool, commit: Optional[str]) -> List[Dict[str, Any]]:
+    paths = _relative_paths(repo, repo_path, [path]) if path else None
+    try:
+        if commit is not None:
+            target = repo.commit(commit)
+            parent = target.parents[0] if target.parents else None
+            if parent is not None:
+                diffs = parent.diff(target, paths=paths, create_patch=True)
+            else:
+                # 最初のコミットは空のツリーと比較する
+                diffs = target.diff(NULL_TREE, paths=paths, create_patch=True)
+        elif staged:
+            head = _head_commit(repo)
+            diffs = head.diff(paths=paths, create_patch=True) if head is not None else []
+        else:
+            diffs = repo.index.diff(None, paths=paths, create_patch=True)
+    except (BadName, ValueError):
+        raise ValueError(f"コミットが見つかりません: {commit}")
+    return [
+        {
+            "path": diff.b_path or diff.a_path,
+            "old_path": diff.a_path,
+            "change_type": _change_type(diff),
+            "diff": diff.diff.decode('utf-8', errors='replace') if isinstance(diff.diff, bytes) else diff.diff,
+        }
+        for diff in diffs
+    ]
+
+async def git_diff(repo_path: str, path: Optional[str] = None, staged: bool = False, commit: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    差分をファイルごとに返す関数
+
+    - commit を指定した場合: そのコミットで入った変更
+    - staged=True: HEADとインデックスの差分
+    - それ以外: インデックスと作業ツリーの差分
+    """
+    return await run_io(_diff, repo_path, path, staged, commit)
+
+def _log(repo_path: str, path: Optional[str] = None, max_count: int = 20, skip: int = 0) -> List[Dict[str, Any]]:
+    repo = get_repo(repo_path)
+    with _lock_for(repo):
+        if _head_commit(repo) is None:
+            return []
+        paths = _relative_paths(repo, repo_path, [path]) if path else []
+        return [_commit_info(commit) for commit in repo.iter_commits(paths=paths, max_count=max_count, skip=skip)]
+
+async def git_log(repo_path: str, path: Optional[str] = None, max_count: int = 20, skip: int = 0) -> List[Dict[str, Any]]:
+    """
+    コミット履歴を新しい順に返す関数（path を指定した場合はそのファイルに関係するコミットのみ）
+    """
+    return await run_io(_log, repo_path, path, max_count, skip)
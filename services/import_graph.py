@@ -0,0 +1,435 @@
+# インポートグラフ
+#
+# プロジェクト内のPython（ast）とJavaScript/TypeScript（import/require の走査）のファイルから
+# import文を取り出し、どのファイルがどのファイルを読み込んでいるかをインメモリのグラフとして保持する。
+# 初回に一度だけ走査し、以降は watchdog のイベントで変更されたファイルだけを解析し直す。
+import ast
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+from services.directory_index import in_skipped_dir, walk_files, watch_tree
+from utils.gitignore import get_gitignore_matcher
+
+logger = logging.getLogger(__name__)
+
+GENERATED_ROOT = os.path.join(os.path.expanduser("~"), "babel_generated")
+
+PYTHON_SUFFIXES = (".py",)
+SCRIPT_SUFFIXES = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
+# import の指定子からファイルを探すときに試す接尾辞
+_RESOLVE_SUFFIXES = {
+    "python": (".py", "/__init__.py"),
+    "script": ("", ".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs",
+               "/index.ts", "/index.tsx", "/index.js", "/index.jsx"),
+}
+# ルートにあって変更されるとグラフ全体を作り直すファイル（'@/' の基準と無視対象）
+_CONFIG_FILES = ("tsconfig.json", "jsconfig.json", ".gitignore")
+
+_SCRIPT_IMPORT = re.compile(
+    r"""(?:^|[^\w$.])(?:import|export)\s+(?:type\s+)?(?:[\w$*{}\s,]+?\s+from\s+)?["']([^"'\n]+)["']"""
+    r"""|(?:^|[^\w$.])(?:require|import)\s*\(\s*["']([^"'\n]+)["']\s*\)""",
+    re.MULTILINE,
+)
+_SCRIPT_COMMENT = re.compile(r"/\*.*?\*/|(?<![:\"'`\w])//[^\n]*", re.DOTALL)
+
+# import の指定子と、解決を試すパス（プロジェクトルートからの相対パス、接尾辞なし）の組
+ImportSpec = Tuple[str, Tuple[str, ...]]
+
+def _language(path: str) -> Optional[str]:
+    if path.endswith(PYTHON_SUFFIXES):
+        return "python"
+    if path.endswith(SCRIPT_SUFFIXES) and not path.endswith(".d.ts"):
+        return "script"
+    return None
+
+def _normalize(path: str) -> str:
+    path = os.path.normpath(path).replace(os.sep, "/")
+    return "" if path == "." else path
+
+def parse_python_imports(rel_path: str, source: str) -> List[ImportSpec]:
+    """
+    Pythonファイルのimport文を取り出す関数（構文エラーの場合は SyntaxError）
+
+    from a import b は a/b（サブモジュール）と a の順に解決を試す。
+    絶対importはプロジェクトルートとファイルのあるディレクトリの両方を基準に試す。
+    """
+    tree = ast.parse(source, filename=rel_path)
+    directory = os.path.dirname(rel_path)
+    specs: List[ImportSpec] = []
+
+    def absolute(module: str) -> Tuple[str, ...]:
+        path = module.replace(".", "/")
+        return tuple(dict.fromkeys(_normalize(os.path.join(base, path)) for base in ("", directory)))
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                specs.append((alias.name, absolute(alias.name)))
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = directory
+                for _ in range(node.level - 1):
+                    base = os.path.dirname(base)
+                module_path = _normalize(os.path.join(base, *(node.module or "").split("."))) if node.module else _normalize(base)
+                raw = "." * node.level + (node.module or "")
+                candidates = [_normalize(os.path.join(module_path, alias.name)) for alias in node.names if alias.name != "*"]
+                specs.append((raw, tuple(dict.fromkeys(candidates + [module_path]))))
+            elif node.module:
+                candidates = [c for alias in node.names if alias.name != "*" for c in absolute(f"{node.module}.{alias.name}")]
+                specs.append((node.module, tuple(dict.fromkeys(candidates + list(absolute(node.module))))))
+    return specs
+
+def parse_script_imports(rel_path: str, source: str, alias_root: str = "src") -> List[ImportSpec]:
+    """
+    JavaScript/TypeScriptファイルの import / export from / require / import() を取り出す関数
+
+    相対パス（./, ../）はファイルのあるディレクトリ、'@/' は alias_root を基準に解決する。
+    それ以外（パッケージ名）は解決を試すパスを持たない（外部の依存関係として扱う）。
+    """
+    source = _SCRIPT_COMMENT.sub("", source)
+    directory = os.path.dirname(rel_path)
+    specs: List[ImportSpec] = []
+    for match in _SCRIPT_IMPORT.finditer(source):
+        specifier = match.group(1) or match.group(2)
+        if specifier.startswith("."):
+            specs.append((specifier, (_normalize(os.path.join(directory, specifier)),)))
+        elif specifier.startswith("@/"):
+            specs.append((specifier, (_normalize(os.path.join(alias_root, specifier[2:])),)))
+        else:
+            specs.append((specifier, ()))
+    return specs
+
+def _package_name(language: str, specifier: str) -> str:
+    # パッケージ名（Pythonは最上位のモジュール、JS/TSは @scope/name または最初の要素）だけを残す
+    if language == "python":
+        return specifier.split(".")[0]
+    if specifier.startswith("@"):
+        return "/".join(specifier.split("/")[:2])
+    return specifier.split("/")[0]
+
+def _read_alias_root(root: str) -> str:
+    """
+    tsconfig.json / jsconfig.json の paths から '@/*' の基準ディレクトリを求める関数
+
+    設定がなければ src/ があれば src、なければルートとする（Next.js の既定と同じ）。
+    """
+    for name in ("tsconfig.json", "jsconfig.json"):
+        try:
+            with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                text = re.sub(r"(?<![:\"])//[^\n]*|/\*.*?\*/", "", f.read(), flags=re.DOTALL)
+            options = json.loads(re.sub(r",(\s*[}\]])", r"\1", text)).get("compilerOptions", {})
+        except (OSError, ValueError, AttributeError):
+            continue
+        targets = (options.get("paths") or {}).get("@/*")
+        if targets:
+            return _normalize(os.path.join(options.get("baseUrl", "."), targets[0].rstrip("*")))
+    return "src" if os.path.isdir(os.path.join(root, "src")) else ""
+
+class _FileEntry:
+    __slots__ = ("mtime_ns", "size", "language", "specs", "error")
+
+    def __init__(self, mtime_ns: int, size: int, language: str, specs: List[ImportSpec], error: Optional[str]):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.language = language
+        self.specs = specs
+        self.error = error
+
+class ImportGraph:
+    """
+    1つのプロジェクトのインポートグラフ
+
+    ファイルごとの import 指定子を保持し、指定子からファイルへの解決（辺の作成）は
+    ファイルの追加・削除があったときにまとめてやり直す（解析済みのファイルは読み直さない）。
+    パスはすべてプロジェクトルートからの相対パス（区切りは /）。
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.alias_root = _read_alias_root(self.root)
+        self._files: Dict[str, _FileEntry] = {}
+        self._imports: Dict[str, List[str]] = {}
+        self._imported_by: Dict[str, List[str]] = {}
+        self._external: Dict[str, List[str]] = {}
+        self._assets: Dict[str, List[str]] = {}
+        self._unresolved: Dict[str, List[str]] = {}
+        self._dirty = True
+        self._lock = threading.RLock()
+
+    def seed(self):
+        """
+        プロジェクト全体を走査してグラフを作り直す
+        """
+        self.alias_root = _read_alias_root(self.root)
+        files: Dict[str, _FileEntry] = {}
+        for rel_path, _ in walk_files(self.root):
+            if _language(rel_path):
+                parsed = self._parse(rel_path)
+                if parsed is not None:
+                    files[rel_path] = parsed
+        with self._lock:
+            self._files = files
+            self._dirty = True
+        logger.info(f"インポートグラフを作成しました: {self.root}（{len(files)}ファイル）")
+
+    def _parse(self, rel_path: str, previous: Optional[_FileEntry] = None) -> Optional[_FileEntry]:
+        language = _language(rel_path)
+        path = os.path.join(self.root, rel_path)
+        try:
+            stat = os.stat(path)
+            if previous is not None and (previous.mtime_ns, previous.size) == (stat.st_mtime_ns, stat.st_size):
+                return previous
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                source = f.read()
+        except OSError:
+            return None
+        try:
+            if language == "python":
+                specs = parse_python_imports(rel_path, source)
+            else:
+                specs = parse_script_imports(rel_path, source, self.alias_root)
+            error = None
+        except (SyntaxError, ValueError) as e:
+            specs, error = [], f"{type(e).__name__}: {str(e)}"
+        return _FileEntry(stat.st_mtime_ns, stat.st_size, language, specs, error)
+
+    def _relative(self, abs_path: str) -> Optional[str]:
+        rel_path = os.path.relpath(abs_path, self.root)
+        if rel_path.startswith(".."):
+            return None
+        return _normalize(rel_path)
+
+    def update(self, abs_path: str, is_dir: bool = False):
+        """
+        作成・変更されたファイル（is_dir の場合はディレクトリ配下のすべてのファイル）を解析し直す（対象外のファイルは無視する）
+        """
+        rel_path = self._relative(abs_path)
+        if not rel_path:
+            return
+        if not is_dir and rel_path in _CONFIG_FILES:
+            # '@/' の基準や無視対象が変わった可能性があるため作り直す
+            logger.info(f"{rel_path}の変更を検知しました。インポートグラフを作り直します: {self.root}")
+            self.seed()
+            return
+        if in_skipped_dir(rel_path, is_dir) or get_gitignore_matcher(self.root).is_ignored(rel_path, is_dir):
+            return
+        if is_dir:
+            for file_path, _ in walk_files(self.root, rel_path):
+                if _language(file_path):
+                    self._update_file(file_path)
+        elif _language(rel_path):
+            self._update_file(rel_path)
+
+    def _update_file(self, rel_path: str):
+        with self._lock:
+            previous = self._files.get(rel_path)
+        parsed = self._parse(rel_path, previous)
+        with self._lock:
+            if parsed is None:
+                self._files.pop(rel_path, None)
+            elif parsed is not previous:
+                self._files[rel_path] = parsed
+            else:
+                return
+            self._dirty = True
+
+    def remove(self, abs_path: str):
+        """
+        削除されたファイル（またはディレクトリ配下のすべてのファイル）をグラフから取り除く
+        """
+        rel_path = self._relative(abs_path)
+        if rel_path is None:
+            return
+        prefix = rel_path + "/"
+        with self._lock:
+            removed = [path for path in self._files if path == rel_path or path.startswith(prefix)]
+            for path in removed:
+                del self._files[path]
+            if removed:
+                self._dirty = True
+
+    def _resolve(self, language: str, candidates: Tuple[str, ...]) -> Optional[str]:
+        for candidate in candidates:
+            for suffix in _RESOLVE_SUFFIXES[language]:
+                path = (candidate + suffix).lstrip("/")
+                if path in self._files:
+                    return path
+        return None
+
+    def _rebuild(self):
+        # 呼び出し側でロックを取得していること
+        imports, imported_by, external, assets, unresolved = {}, {}, {}, {}, {}
+        for path, entry in self._files.items():
+            targets, packages, static, missing = [], [], [], []
+            for specifier, candidates in entry.specs:
+                target = self._resolve(entry.language, candidates) if candidates else None
+                if target is not None and target != path:
+                    targets.append(target)
+                elif target is not None:
+                    continue
+                elif not specifier.startswith((".", "@/")):
+                    packages.append(_package_name(entry.language, specifier))
+                elif entry.language == "script" and os.path.splitext(specifier)[1] not in ("",) + SCRIPT_SUFFIXES:
+                    # CSS・画像・JSONなどのスクリプト以外のファイル
+                    static.append(candidates[0])
+                else:
+                    missing.append(specifier)
+            imports[path] = sorted(set(targets))
+            external[path] = sorted(set(packages))
+            assets[path] = sorted(set(static))
+            unresolved[path] = sorted(set(missing))
+            for target in imports[path]:
+                imported_by.setdefault(target, []).append(path)
+        self._imports, self._external, self._unresolved = imports, external, unresolved
+        self._assets = assets
+        self._imported_by = {path: sorted(sources) for path, sources in imported_by.items()}
+        self._dirty = False
+
+    def _ensure_edges(self):
+        if self._dirty:
+            self._rebuild()
+
+    def _node(self, path: str) -> Dict:
+        entry = self._files[path]
+        node = {
+            "path": path,
+            "language": entry.language,
+            "imports": self._imports.get(path, []),
+            "imported_by": self._imported_by.get(path, []),
+            "external": self._external.get(path, []),
+            "assets": self._assets.get(path, []),
+            "unresolved": self._unresolved.get(path, []),
+        }
+        if entry.error:
+            node["error"] = entry.error
+        return node
+
+    def file(self, path: str, depth: int = 1) -> Dict:
+        """
+        1ファイルの依存関係を返す関数（depth > 1 の場合は間接的な依存・被依存も depth 段まで含める）
+        """
+        path = _normalize(path)
+        with self._lock:
+            self._ensure_edges()
+            if path not in self._files:
+                raise FileNotFoundError(f"インポートグラフにファイルがありません: {path}")
+            node = self._node(path)
+            if depth > 1:
+                node["transitive_imports"] = self._reachable(path, self._imports, depth)
+                node["transitive_imported_by"] = self._reachable(path, self._imported_by, depth)
+            return node
+
+    @staticmethod
+    def _reachable(start: str, edges: Dict[str, List[str]], depth: int) -> List[str]:
+        seen: Set[str] = {start}
+        frontier = [start]
+        for _ in range(depth):
+            frontier = [target for path in frontier for target in edges.get(path, []) if target not in seen]
+            seen.update(frontier)
+            if not frontier:
+                break
+        seen.discard(start)
+        return sorted(seen)
+
+    def graph(self, prefix: str = "", paths: Optional[List[str]] = None) -> Dict:
+        """
+        グラフ全体（prefix 配下、または paths で指定したファイルのみ）を返す関数
+        """
+        prefix = _normalize(prefix)
+        wanted = {_normalize(path) for path in paths} if paths else None
+        with self._lock:
+            self._ensure_edges()
+            nodes = [
+                self._node(path) for path in sorted(self._files)
+                if (wanted is None or path in wanted) and (not prefix or path == prefix or path.startswith(prefix + "/"))
+            ]
+        return {
+            "root": self.root,
+            "files": len(nodes),
+            "edges": sum(len(node["imports"]) for node in nodes),
+            "nodes": nodes,
+        }
+
+    def centrality(self, paths: Optional[List[str]] = None) -> Dict[str, float]:
+        """
+        ファイルの重要度（プロジェクト全体で読み込まれている数を2倍、読み込んでいる数を1倍）を返す関数
+        """
+        with self._lock:
+            self._ensure_edges()
+            targets = [_normalize(path) for path in paths] if paths else list(self._files)
+            return {
+                path: 2.0 * len(self._imported_by.get(path, [])) + len(self._imports.get(path, []))
+                for path in targets
+            }
+
+_graphs: Dict[str, ImportGraph] = {}
+_graphs_lock = threading.Lock()
+
+def get_import_graph(root: str) -> ImportGraph:
+    """
+    ルートディレクトリごとのインポートグラフを取得する関数（初回のみ走査し、以降は監視で更新される）
+
+    ブロッキング処理を含むため、非同期関数からは run_io で呼び出すこと。
+    """
+    abs_root = os.path.abspath(root)
+    with _graphs_lock:
+        graph = _graphs.get(abs_root)
+        if graph is not None:
+            return graph
+        if not os.path.isdir(abs_root):
+            raise FileNotFoundError(f"ディレクトリが見つかりません: {root}")
+        graph = ImportGraph(abs_root)
+        # 走査中の変更を取りこぼさないよう、監視を先に開始する
+        watch_tree(abs_root, graph)
+        graph.seed()
+        _graphs[abs_root] = graph
+        return graph
+
+def find_project_root(abs_path: str) -> Optional[str]:
+    """
+    ~/babel_generated/<project> 配下のパスであれば、そのプロジェクトのルートを返す関数
+    """
+    rel_path = os.path.relpath(os.path.abspath(abs_path), GENERATED_ROOT)
+    if rel_path.startswith("..") or rel_path == ".":
+        return None
+    return os.path.join(GENERATED_ROOT, rel_path.split(os.sep)[0])
+
+def static_dependencies(abs_paths: List[str]) -> Optional[Dict]:
+    """
+    指定したファイルの依存関係をインポートグラフから求める関数（ブロッキング）
+
+    すべてのファイルが同じ ~/babel_generated/<project> 配下にある場合のみ結果を返し、それ以外は None。
+    返り値: {"root", "nodes": ファイルごとの依存関係, "scores": プロジェクト全体での重要度}
+    """
+    roots = {find_project_root(path) for path in abs_paths}
+    if len(roots) != 1 or None in roots:
+        return None
+    root = roots.pop()
+    graph = get_import_graph(root)
+    rel_paths = [_normalize(os.path.relpath(os.path.abspath(path), root)) for path in abs_paths]
+    return {
+        "root": root,
+        "nodes": graph.graph(paths=rel_paths)["nodes"],
+        "scores": graph.centrality(rel_paths),
+    }
+
+def format_dependencies(nodes: List[Dict]) -> str:
+    """
+    依存関係をプロンプトに含める形式（1ファイル1行）にする関数
+    """
+    lines = []
+    for node in nodes:
+        parts = [f"- {node['path']}"]
+        if node["imports"]:
+            parts.append(f"→ {', '.join(node['imports'])}")
+        if node["imported_by"]:
+            parts.append(f"（読み込み元: {', '.join(node['imported_by'])}）")
+        if node["external"]:
+            parts.append(f"（外部: {', '.join(node['external'])}）")
+        if node["unresolved"]:
+            parts.append(f"（解決できないimport: {', '.join(node['unresolved'])}）")
+        lines.append(" ".join(parts))
+    return "\n".join(lines)
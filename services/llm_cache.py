@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+from config.settings import (
+    LLM_CACHE_ENABLED, LLM_CACHE_DIR, LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(provider: str, model: str, params: Dict[str, Any], prompt: str) -> str:
+    """
+    プロバイダ・モデル・パラメータ・プロンプトからキャッシュキー（SHA-256）を作成する関数
+    """
+    payload = json.dumps(
+        {"provider": provider, "model": model, "params": params, "prompt": prompt},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    生成結果のキャッシュ
+
+    メモリ上のLRU（OrderedDict）を前段に、SQLiteの永続キャッシュを後段に持つ。
+    どちらも件数上限（LRU）とTTLで削除される。
+    """
+
+    def __init__(self, db_path: str, max_entries: int, ttl: float, memory_entries: int):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON responses(accessed_at)")
+            self._conn.commit()
+            logger.info(f"LLMキャッシュを開きました: {self.db_path}")
+        return self._conn
+
+    def _remember(self, key: str, created_at: float, value: Any):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = json.loads(row[0]), row[1]
+            if now - created_at > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self._remember(key, created_at, value)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            # TTL切れと件数上限を超えた古いエントリを削除
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+            logger.info("LLMキャッシュを削除しました")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "enabled": LLM_CACHE_ENABLED,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "path": self.db_path,
+            }
+
+llm_cache = LLMResponseCache(
+    db_path=os.path.join(LLM_CACHE_DIR, "llm_responses.sqlite3"),
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    ttl=LLM_CACHE_TTL,
+    memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+)
+
+async def cached_generation(
+    provider: str, model: str, params: Dict[str, Any], prompt: str,
+    generate: Callable[[], Awaitable[Dict[str, Any]]], use_cache: bool = True
+) -> Dict[str, Any]:
+    """
+    キャッシュにあれば保存済みの結果を返し、なければgenerateを呼び出して結果を保存する関数
+
+    use_cache=False の場合はキャッシュを参照も保存もしない。
+    """
+    if not (LLM_CACHE_ENABLED and use_cache):
+        llm_cache.bypasses += 1
+        return await generate()
+
+    key = make_cache_key(provider, model, params, prompt)
+    cached = await asyncio.to_thread(llm_cache.get, key)
+    if cached is not None:
+        logger.info(f"{provider}のキャッシュにヒットしました: key={key[:12]}")
+        return cached
+
+    result = await generate()
+    await asyncio.to_thread(llm_cache.set, key, result)
+    return result
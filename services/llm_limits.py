@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import time
+from config.settings import LLM_MAX_CONCURRENCY, LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_BURST
+
+logger = logging.getLogger(__name__)
+
+# プロバイダ名 -> セマフォ / トークンバケット
+_semaphores = {}
+_rate_limiters = {}
+
+def provider_semaphore(provider: str) -> asyncio.Semaphore:
+    """
+    プロバイダごとの同時実行数を制限するセマフォを取得する関数
+
+    スレッド数ではなくこのセマフォでプロバイダへの同時リクエスト数を制御する。
+    """
+    semaphore = _semaphores.get(provider)
+    if semaphore is None:
+        limit = LLM_MAX_CONCURRENCY.get(provider, 8)
+        semaphore = asyncio.Semaphore(limit)
+        _semaphores[provider] = semaphore
+        logger.info(f"{provider}の同時実行数の上限を設定しました: {limit}")
+    return semaphore
+
+class TokenBucket:
+    """
+    トークンバケット方式のレートリミッタ
+
+    rate_per_minute の速度でトークンが補充され、最大 capacity 個まで貯まる。
+    rate_per_minute が 0 以下の場合はレートを制限しない。
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def provider_rate_limiter(provider: str) -> TokenBucket:
+    """
+    プロバイダごとのトークンバケットを取得する関数
+    """
+    limiter = _rate_limiters.get(provider)
+    if limiter is None:
+        rpm = LLM_RATE_LIMIT_RPM.get(provider, 60)
+        limiter = TokenBucket(rpm, LLM_RATE_LIMIT_BURST)
+        _rate_limiters[provider] = limiter
+        if rpm > 0:
+            logger.info(f"{provider}のレート制限を設定しました: {rpm}リクエスト/分")
+        else:
+            logger.info(f"{provider}のレート制限は無効です")
+    return limiter
@@ -0,0 +1,318 @@
+# LLMプロバイダの共通インターフェースとルーター
+#
+# Anthropic / Gemini / OpenAI を同じインターフェース（LLMProvider）で扱い、
+# LLMRouter が選択方針に従ってプロバイダを選ぶ。失敗・タイムアウトした場合は次のプロバイダで再試行し、
+# hedge_after を指定した場合は応答が遅いときに次のプロバイダにも同じリクエストを送り、先に返った結果を使う。
+import asyncio
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+from config.settings import (
+    ANTHROPIC_API_KEY, GEMINI_API_KEY, OPENAI_API_KEY, ANTHROPIC_MODEL, GEMINI_MODEL, OPENAI_MODEL,
+    LLM_PRICES, LLM_ROUTER_POLICY, LLM_ROUTER_PROVIDERS, LLM_ROUTER_TIMEOUT, LLM_ROUTER_HEDGE_AFTER,
+    LLM_ROUTER_COOLDOWN, LLM_ROUTER_EXPECTED_OUTPUT_TOKENS, LLM_CACHE_ENABLED
+)
+from services.anthropic_service import stream_text_anthropic
+from services.gemini_service import generate_text_gemini
+from services.llm_cache import llm_cache, make_cache_key
+from services.openai_service import generate_text_gpt4o
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("cheapest", "p95_latency", "first_token")
+
+# レイテンシの統計に使う直近の件数
+_LATENCY_WINDOW = 100
+
+class LLMRouterError(Exception):
+    pass
+
+def percentile(samples, q: float) -> Optional[float]:
+    """
+    サンプルの q パーセンタイル（最近傍法）を返す関数（サンプルがなければ None）
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+class LLMProvider(ABC):
+    """
+    LLMプロバイダの共通インターフェース
+
+    サブクラスは name / model / price と stream を実装する。ストリーミングに対応しないプロバイダは
+    生成結果の全文を1つの断片として返せばよい（その場合、最初のトークンまでの時間は全体の時間と同じになる）。
+    直近のレイテンシ（全体と最初のトークンまで）と失敗の状況はプロバイダごとに記録する。
+    """
+
+    name: str = ""
+    model: str = ""
+    # 100万トークンあたりの料金（USD、入力, 出力）
+    price = (0.0, 0.0)
+
+    def __init__(self):
+        self.latencies = deque(maxlen=_LATENCY_WINDOW)
+        self.first_token_latencies = deque(maxlen=_LATENCY_WINDOW)
+        self.successes = 0
+        self.failures = 0
+        self.failed_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def stream(self, prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """
+        生成されたテキストを断片ごとに返す非同期ジェネレータ
+        """
+
+    def estimate_cost(self, prompt: str) -> float:
+        # 1トークンあたり約4文字として見積もる
+        input_price, output_price = self.price
+        return (input_price * len(prompt) / 4 + output_price * LLM_ROUTER_EXPECTED_OUTPUT_TOKENS) / 1_000_000
+
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.failed_until
+
+    def record_success(self, latency: float, first_token_latency: float):
+        self.latencies.append(latency)
+        self.first_token_latencies.append(first_token_latency)
+        self.successes += 1
+        self.failed_until = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        self.failed_until = time.monotonic() + LLM_ROUTER_COOLDOWN
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "available": self.available,
+            "price": list(self.price),
+            "p50_latency": percentile(self.latencies, 50),
+            "p95_latency": percentile(self.latencies, 95),
+            "p50_first_token": percentile(self.first_token_latencies, 50),
+            "p95_first_token": percentile(self.first_token_latencies, 95),
+            "samples": len(self.latencies),
+            "successes": self.successes,
+            "failures": self.failures,
+            "cooling_down": self.cooling_down(),
+        }
+
+class AnthropicProvider(LLMProvider):
+    name = "anthropic"
+    model = ANTHROPIC_MODEL
+    price = LLM_PRICES["anthropic"]
+
+    @property
+    def available(self) -> bool:
+        return bool(ANTHROPIC_API_KEY)
+
+    async def stream(self, prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+        async for text in stream_text_anthropic(prompt, use_cache=use_cache):
+            yield text
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    model = GEMINI_MODEL
+    price = LLM_PRICES["gemini"]
+
+    @property
+    def available(self) -> bool:
+        return bool(GEMINI_API_KEY)
+
+    async def stream(self, prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+        result = await generate_text_gemini(prompt, use_cache=use_cache)
+        yield result["generated_text"]
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    model = OPENAI_MODEL
+    price = LLM_PRICES["openai"]
+
+    @property
+    def available(self) -> bool:
+        return bool(OPENAI_API_KEY)
+
+    async def stream(self, prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+        result = await generate_text_gpt4o(prompt, use_cache=use_cache)
+        yield result["generated_text"]
+
+class LLMRouter:
+    """
+    選択方針に従ってプロバイダを選び、失敗時のフェイルオーバーとヘッジリクエストを行うクラス
+
+    選択方針:
+        cheapest:    見積もり料金が安い順
+        p95_latency: 直近の応答時間の95パーセンタイルが小さい順
+        first_token: 直近の最初のトークンまでの時間（中央値）が小さい順
+    レイテンシの記録がないプロバイダは記録のあるプロバイダの後ろに回し、
+    同じ評価のプロバイダは providers の順に並べる。直近で失敗したプロバイダは一定時間、最後に回す。
+    """
+
+    def __init__(self, providers: List[LLMProvider], policy: str = LLM_ROUTER_POLICY,
+                 timeout: float = LLM_ROUTER_TIMEOUT, hedge_after: float = LLM_ROUTER_HEDGE_AFTER):
+        if policy not in POLICIES:
+            raise ValueError(f"不明な選択方針です: {policy}")
+        self.providers = {provider.name: provider for provider in providers}
+        self.policy = policy
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+
+    def _score(self, provider: LLMProvider, policy: str, prompt: str) -> float:
+        if policy == "cheapest":
+            return provider.estimate_cost(prompt)
+        if policy == "p95_latency":
+            value = percentile(provider.latencies, 95)
+        else:
+            value = percentile(provider.first_token_latencies, 50)
+        return math.inf if value is None else value
+
+    def rank(self, prompt: str, policy: Optional[str] = None, names: Optional[List[str]] = None) -> List[LLMProvider]:
+        """
+        リクエストを送る順にプロバイダを並べる関数
+        """
+        policy = policy or self.policy
+        if policy not in POLICIES:
+            raise ValueError(f"不明な選択方針です: {policy}")
+        if names:
+            unknown = [name for name in names if name not in self.providers]
+            if unknown:
+                raise ValueError(f"不明なプロバイダです: {', '.join(unknown)}")
+            candidates = [self.providers[name] for name in names]
+        else:
+            candidates = list(self.providers.values())
+        candidates = [provider for provider in candidates if provider.available]
+        order = {provider.name: i for i, provider in enumerate(candidates)}
+        return sorted(
+            candidates,
+            key=lambda provider: (provider.cooling_down(), self._score(provider, policy, prompt), order[provider.name])
+        )
+
+    async def _call(self, provider: LLMProvider, prompt: str, use_cache: bool) -> Dict[str, Any]:
+        # キャッシュはルーターで扱い、プロバイダは常にキャッシュなしで呼び出す
+        # （キャッシュの応答時間をレイテンシとして記録すると、選択方針の統計が歪むため）
+        cache_key = None
+        if LLM_CACHE_ENABLED and use_cache:
+            cache_key = make_cache_key(provider.name, provider.model, {"router": True}, prompt)
+            cached = await asyncio.to_thread(llm_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"{provider.name}のキャッシュにヒットしました: key={cache_key[:12]}")
+                return {
+                    "generated_text": cached["generated_text"],
+                    "provider": provider.name,
+                    "model": provider.model,
+                    "latency": 0.0,
+                    "cached": True,
+                }
+
+        started = time.monotonic()
+        first_token_at = None
+        chunks = []
+
+        async def collect():
+            nonlocal first_token_at
+            async for text in provider.stream(prompt, use_cache=False):
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                chunks.append(text)
+
+        try:
+            await asyncio.wait_for(collect(), timeout=self.timeout)
+        except asyncio.CancelledError:
+            # ヘッジで別のプロバイダが先に返った場合は失敗として扱わない
+            raise
+        except asyncio.TimeoutError:
+            provider.record_failure()
+            raise LLMRouterError(f"{self.timeout}秒以内に応答がありませんでした")
+        except Exception:
+            provider.record_failure()
+            raise
+        finished = time.monotonic()
+        provider.record_success(finished - started, (first_token_at or finished) - started)
+        generated_text = "".join(chunks)
+        if cache_key:
+            await asyncio.to_thread(llm_cache.set, cache_key, {"generated_text": generated_text})
+        return {
+            "generated_text": generated_text,
+            "provider": provider.name,
+            "model": provider.model,
+            "latency": finished - started,
+            "cached": False,
+        }
+
+    async def generate(self, prompt: str, policy: Optional[str] = None, providers: Optional[List[str]] = None,
+                       use_cache: bool = True, hedge_after: Optional[float] = None) -> Dict[str, Any]:
+        """
+        プロンプトに対する応答を生成する関数
+
+        Returns:
+            dict: {"generated_text", "provider", "model", "latency", "cached", "attempts"}
+        Raises:
+            ValueError: 選択方針やプロバイダ名が不正な場合、または使えるプロバイダがない場合
+            LLMRouterError: すべてのプロバイダが失敗した場合
+        """
+        candidates = self.rank(prompt, policy, providers)
+        if not candidates:
+            raise ValueError("利用できるプロバイダがありません（APIキーを確認してください）")
+        hedge_after = self.hedge_after if hedge_after is None else hedge_after
+        remaining = iter(candidates)
+        running: Dict[asyncio.Task, LLMProvider] = {}
+        attempts: List[Dict[str, Any]] = []
+        hedged = False
+
+        def launch() -> bool:
+            provider = next(remaining, None)
+            if provider is None:
+                return False
+            running[asyncio.create_task(self._call(provider, prompt, use_cache))] = provider
+            return True
+
+        launch()
+        try:
+            while running:
+                # 最初のリクエストが hedge_after 秒以内に返らなければ、次のプロバイダにも送る（1回まで）
+                wait = hedge_after if hedge_after and not hedged else None
+                done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if launch():
+                        logger.info(f"{hedge_after}秒以内に応答がないため、ヘッジリクエストを送信します")
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.warning(f"{provider.name}での生成に失敗しました: {type(e).__name__}: {str(e)}")
+                        attempts.append({"provider": provider.name, "error": f"{type(e).__name__}: {str(e)}"})
+                        continue
+                    attempts.append({"provider": provider.name, "latency": result["latency"]})
+                    return {**result, "attempts": attempts}
+                # 実行中のリクエストがすべて失敗した場合は次のプロバイダで再試行する
+                if not running:
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        errors = ", ".join(f"{attempt['provider']}: {attempt['error']}" for attempt in attempts)
+        raise LLMRouterError(f"すべてのプロバイダで生成に失敗しました: {errors}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "timeout": self.timeout,
+            "hedge_after": self.hedge_after,
+            "providers": [provider.stats() for provider in self.providers.values()],
+        }
+
+_PROVIDER_CLASSES = {cls.name: cls for cls in (AnthropicProvider, GeminiProvider, OpenAIProvider)}
+
+llm_router = LLMRouter([_PROVIDER_CLASSES[name]() for name in LLM_ROUTER_PROVIDERS if name in _PROVIDER_CLASSES])
@@ -0,0 +1,333 @@
+# 関連コードの検索（ハッシュしたn-gramのベクトルによる類似検索）
+#
+# プロジェクト内のファイルを一定行数のチャンクに分け、識別子（camelCase・snake_case を分割したものを含む）、
+# 英単語の文字3-gram、日本語などの文字2-gram を特徴量としてハッシュした疎なベクトルで表す。
+# 問い合わせ（機能追加の要望など）のベクトルとのコサイン類似度が高いチャンクを、トークン予算に収まるだけ返す。
+# チャンクのベクトルは転置インデックス（次元 -> チャンク）に保持し、初回に一度だけ走査したあとは
+# watchdog のイベントで変更されたファイルだけを作り直す。
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from config.settings import (
+    RETRIEVAL_CHUNK_LINES, RETRIEVAL_DIMENSIONS, RETRIEVAL_TOP_K, RETRIEVAL_MIN_SCORE, RETRIEVAL_TOKEN_BUDGET,
+    RETRIEVAL_MAX_FILE_SIZE
+)
+from services.context_packer import ContextFile, count_tokens, pack, strip_low_value
+from services.directory_index import in_skipped_dir, walk_files, watch_tree
+from services.import_graph import find_project_root
+from utils.gitignore import get_gitignore_matcher
+
+logger = logging.getLogger(__name__)
+
+# 内容を索引に含めないファイル（strip_low_value の省略理由）
+_SKIP_REASONS = {"lockfile", "generated", "binary", "minified"}
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[^\x00-\x7f\s\W]+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+def features(text: str) -> Iterator[str]:
+    """
+    テキストから特徴量（文字列）を取り出す関数
+
+    - w:単語（小文字）と、camelCase・snake_case を分割した各部分
+    - g:英単語の文字3-gram（4文字以上の単語のみ。auth と authentication のような表記の違いを吸収する）
+    - g:日本語などの文字2-gram（単語の区切りがないため）
+    """
+    for word in _WORD.findall(text):
+        if not word.isascii():
+            if len(word) == 1:
+                yield "g:" + word
+            for i in range(len(word) - 1):
+                yield "g:" + word[i:i + 2]
+            continue
+        lower = word.lower()
+        yield "w:" + lower
+        parts = [part.lower() for piece in word.split("_") for part in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            for part in parts:
+                yield "w:" + part
+        if len(lower) >= 4:
+            for i in range(len(lower) - 2):
+                yield "g:" + lower[i:i + 3]
+
+def vectorize(text: str, dimensions: int = RETRIEVAL_DIMENSIONS) -> Dict[int, float]:
+    """
+    特徴量をハッシュした疎なベクトル（次元 -> 重み）を返す関数（重みは 1 + log(出現数)）
+
+    ハッシュには実行ごとに変わらない crc32 を使う。
+    """
+    counts = Counter(zlib.crc32(feature.encode("utf-8")) % dimensions for feature in features(text))
+    return {bucket: 1.0 + math.log(count) for bucket, count in counts.items()}
+
+def _normalized(vector: Dict[int, float]) -> Dict[int, float]:
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    if not norm:
+        return {}
+    return {bucket: weight / norm for bucket, weight in vector.items()}
+
+@dataclass
+class Chunk:
+    path: str
+    start_line: int
+    end_line: int
+    text: str
+
+@dataclass
+class _FileEntry:
+    mtime_ns: int
+    size: int
+    chunk_ids: List[int]
+
+def split_chunks(path: str, content: str, lines_per_chunk: int = RETRIEVAL_CHUNK_LINES) -> List[Chunk]:
+    """
+    ファイルの内容を lines_per_chunk 行ずつのチャンクに分ける関数（空白だけのチャンクは除く）
+    """
+    lines = content.split("\n")
+    chunks = []
+    for start in range(0, len(lines), lines_per_chunk):
+        part = lines[start:start + lines_per_chunk]
+        text = "\n".join(part)
+        if text.strip():
+            chunks.append(Chunk(path, start + 1, start + len(part), text))
+    return chunks
+
+class RetrievalIndex:
+    """
+    プロジェクトごとのチャンクのベクトルの転置インデックス
+
+    チャンクのベクトルは正規化した重み（lnc）で、問い合わせのベクトルは逆文書頻度を掛けて正規化した重み（ltc）で表し、
+    その内積をコサイン類似度として使う。ファイルのパスも特徴量に含める。
+    """
+
+    def __init__(self, root: str, dimensions: int = RETRIEVAL_DIMENSIONS,
+                 lines_per_chunk: int = RETRIEVAL_CHUNK_LINES, max_file_size: int = RETRIEVAL_MAX_FILE_SIZE):
+        self.root = os.path.abspath(root)
+        self.dimensions = dimensions
+        self.lines_per_chunk = lines_per_chunk
+        self.max_file_size = max_file_size
+        self._files: Dict[str, _FileEntry] = {}
+        self._chunks: Dict[int, Chunk] = {}
+        # チャンクごとのベクトルの次元（削除時に転置インデックスから取り除くため）
+        self._buckets: Dict[int, Tuple[int, ...]] = {}
+        self._postings: Dict[int, Dict[int, float]] = {}
+        self._next_id = 0
+        self._lock = threading.RLock()
+
+    def _relative(self, abs_path: str) -> Optional[str]:
+        rel_path = os.path.relpath(os.path.abspath(abs_path), self.root)
+        if rel_path == "." or rel_path.startswith(".."):
+            return None
+        return rel_path.replace(os.sep, "/")
+
+    def _ignored(self, rel_path: str, is_dir: bool = False) -> bool:
+        return in_skipped_dir(rel_path, is_dir) or get_gitignore_matcher(self.root).is_ignored(rel_path, is_dir)
+
+    def _load(self, rel_path: str) -> Optional[Tuple[os.stat_result, List[Tuple[Chunk, Dict[int, float]]]]]:
+        # ファイルを読み、チャンクとそのベクトルを作る（ロックの外で呼ぶ）。読めない場合は None
+        path = os.path.join(self.root, rel_path)
+        try:
+            stat = os.stat(path)
+            if stat.st_size > self.max_file_size:
+                return stat, []
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                content = f.read()
+        except OSError:
+            return None
+        content, omitted = strip_low_value(rel_path, content)
+        if omitted in _SKIP_REASONS:
+            return stat, []
+        path_vector = vectorize(rel_path.replace("/", " "), self.dimensions)
+        chunks = []
+        for chunk in split_chunks(rel_path, content, self.lines_per_chunk):
+            vector = vectorize(chunk.text, self.dimensions)
+            for bucket, weight in path_vector.items():
+                vector[bucket] = vector.get(bucket, 0.0) + weight
+            chunks.append((chunk, _normalized(vector)))
+        return stat, chunks
+
+    def _store(self, rel_path: str, stat: os.stat_result, chunks: List[Tuple[Chunk, Dict[int, float]]]):
+        # 呼び出し側でロックを取得していること
+        self._discard(rel_path)
+        chunk_ids = []
+        for chunk, vector in chunks:
+            chunk_id = self._next_id
+            self._next_id += 1
+            self._chunks[chunk_id] = chunk
+            self._buckets[chunk_id] = tuple(vector)
+            for bucket, weight in vector.items():
+                self._postings.setdefault(bucket, {})[chunk_id] = weight
+            chunk_ids.append(chunk_id)
+        self._files[rel_path] = _FileEntry(stat.st_mtime_ns, stat.st_size, chunk_ids)
+
+    def _discard(self, rel_path: str):
+        # 呼び出し側でロックを取得していること
+        entry = self._files.pop(rel_path, None)
+        if entry is None:
+            return
+        for chunk_id in entry.chunk_ids:
+            del self._chunks[chunk_id]
+            for bucket in self._buckets.pop(chunk_id):
+                postings = self._postings.get(bucket)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[bucket]
+
+    def seed(self):
+        """
+        プロジェクト全体を走査してインデックスを作り直す（変更されていないファイルは前回の結果を使う）
+        """
+        seen = set()
+        for rel_path, _ in walk_files(self.root):
+            seen.add(rel_path)
+            self.update(os.path.join(self.root, rel_path))
+        with self._lock:
+            for rel_path in [path for path in self._files if path not in seen]:
+                self._discard(rel_path)
+            logger.info(f"関連コードのインデックスを作成しました: {self.root}（{len(self._files)}ファイル, {len(self._chunks)}チャンク）")
+
+    def update(self, abs_path: str, is_dir: bool = False):
+        """
+        作成・変更されたファイル（is_dir の場合はディレクトリ配下のすべてのファイル）のチャンクを作り直す
+
+        対象外・変更されていないファイルは何もしない。
+        """
+        rel_path = self._relative(abs_path)
+        if rel_path is None or self._ignored(rel_path, is_dir):
+            return
+        if is_dir:
+            for file_path, _ in walk_files(self.root, rel_path):
+                self.update(os.path.join(self.root, file_path))
+            return
+        with self._lock:
+            entry = self._files.get(rel_path)
+        try:
+            stat = os.stat(abs_path)
+        except OSError:
+            self.remove(abs_path)
+            return
+        if entry is not None and (entry.mtime_ns, entry.size) == (stat.st_mtime_ns, stat.st_size):
+            return
+        loaded = self._load(rel_path)
+        with self._lock:
+            if loaded is None:
+                self._discard(rel_path)
+            else:
+                self._store(rel_path, *loaded)
+
+    def remove(self, abs_path: str):
+        """
+        削除されたファイル（またはディレクトリ配下のすべてのファイル）を取り除く
+        """
+        rel_path = self._relative(abs_path)
+        if rel_path is None:
+            return
+        prefix = rel_path + "/"
+        with self._lock:
+            for path in [path for path in self._files if path == rel_path or path.startswith(prefix)]:
+                self._discard(path)
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K, prefix: str = "",
+               exclude: Iterable[str] = (), min_score: float = RETRIEVAL_MIN_SCORE) -> List[Dict[str, Any]]:
+        """
+        問い合わせに似たチャンクを類似度の高い順に最大 k 件返す関数（類似度が min_score 未満のものは除く）
+
+        prefix: このディレクトリ配下のファイルだけを対象にする（ルートからの相対パス）
+        exclude: 対象から除くファイル（ルートからの相対パス）
+        """
+        query_vector = vectorize(query, self.dimensions)
+        prefix = prefix.strip("/")
+        exclude = set(exclude)
+        with self._lock:
+            total = len(self._chunks)
+            if not total:
+                return []
+            # 問い合わせの重みに逆文書頻度を掛けてから正規化する
+            weighted = {
+                bucket: weight * math.log((total + 1) / (len(self._postings[bucket]) + 1))
+                for bucket, weight in query_vector.items() if bucket in self._postings
+            }
+            scores: Dict[int, float] = {}
+            for bucket, weight in _normalized(weighted).items():
+                for chunk_id, chunk_weight in self._postings[bucket].items():
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + weight * chunk_weight
+
+            def allowed(chunk_id: int) -> bool:
+                path = self._chunks[chunk_id].path
+                return path not in exclude and (not prefix or path == prefix or path.startswith(prefix + "/"))
+
+            best = heapq.nlargest(k, (item for item in scores.items() if item[1] >= min_score and allowed(item[0])),
+                                  key=lambda item: item[1])
+            return [
+                {
+                    "path": self._chunks[chunk_id].path,
+                    "start_line": self._chunks[chunk_id].start_line,
+                    "end_line": self._chunks[chunk_id].end_line,
+                    "score": round(score, 4),
+                    "text": self._chunks[chunk_id].text,
+                }
+                for chunk_id, score in best
+            ]
+
+_indexes: Dict[str, RetrievalIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_retrieval_index(root: str) -> RetrievalIndex:
+    """
+    ルートディレクトリごとのインデックスを取得する関数（初回のみ走査し、以降は監視で更新される）
+
+    ブロッキング処理を含むため、非同期関数からは run_io で呼び出すこと。
+    """
+    abs_root = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(abs_root)
+        if index is not None:
+            return index
+        if not os.path.isdir(abs_root):
+            raise FileNotFoundError(f"ディレクトリが見つかりません: {root}")
+        index = RetrievalIndex(abs_root)
+        # 走査中の変更を取りこぼさないよう、監視を先に開始する
+        watch_tree(abs_root, index)
+        index.seed()
+        _indexes[abs_root] = index
+        return index
+
+def related_context(full_path: str, query: str, budget: int = RETRIEVAL_TOKEN_BUDGET,
+                    k: int = RETRIEVAL_TOP_K) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    ファイルまたはディレクトリに対する問い合わせに関連するコードを、トークン予算に収めて返す関数（ブロッキング）
+
+    ディレクトリの場合はその配下から、ファイルの場合はそのファイル以外のプロジェクト内のファイルから探す。
+    ~/babel_generated/<project> 配下以外のパスや、budget が0の場合は何も返さない。
+    戻り値: (プロンプトに加えるテキスト, 使ったチャンクの {"path", "start_line", "end_line", "score"} のリスト)
+    """
+    root = find_project_root(full_path) if budget > 0 else None
+    if root is None:
+        return "", []
+    index = get_retrieval_index(root)
+    rel_path = os.path.relpath(os.path.abspath(full_path), root).replace(os.sep, "/")
+    if os.path.isdir(full_path):
+        hits = index.search(query, k, prefix="" if rel_path == "." else rel_path)
+    else:
+        hits = index.search(query, k, exclude=[rel_path])
+    files = []
+    for hit in hits:
+        file = ContextFile(f"{hit['path']}（{hit['start_line']}〜{hit['end_line']}行目）", hit["text"], score=hit["score"])
+        file.tokens = count_tokens(file.render())
+        files.append(file)
+    packed = pack(files, budget)
+    used = {file.path for file in packed.files}
+    chunks = [
+        {key: hit[key] for key in ("path", "start_line", "end_line", "score")}
+        for hit, file in zip(hits, files) if file.path in used
+    ]
+    if chunks:
+        logger.info(f"関連するコードを{len(chunks)}チャンク（{packed.tokens}トークン）見つけました: {root}")
+    return packed.render(), chunks
@@ -0,0 +1,158 @@
+# サンドボックス実行用のワーカープロセス
+#
+# services/code_execution.py の SandboxPool から起動され、標準入力からJSON行でジョブを受け取る。
+#   {"id": 1, "code": "...", "filename": "<sandbox>", "cwd": "...", "cpu_seconds": 30, "memory_bytes": 1073741824,
+#    "wall_timeout": 60, "max_output": 1048576}
+# ジョブごとに fork した子プロセスでコードを実行し、出力を逐次JSON行で標準出力に返す。
+#   {"id": 1, "type": "stdout" | "stderr", "data": "..."}
+#   {"id": 1, "type": "exit", "returncode": 0, "timed_out": false, "truncated": false}
+# このファイルは起動を速くするためリポジトリ内のモジュールをimportしない。
+import codecs
+import json
+import os
+import resource
+import selectors
+import signal
+import sys
+import time
+import traceback
+
+# 子プロセスでよく使われるモジュールを事前に読み込んでおく（fork後はimport済みの状態で始まる）
+import pathlib  # noqa: F401
+import re  # noqa: F401
+import shutil  # noqa: F401
+import subprocess  # noqa: F401
+
+_protocol = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+
+def _emit(message):
+    _protocol.write(json.dumps(message, ensure_ascii=False) + "\n")
+
+def _run_child(job, out_w, err_w):
+    os.close(_protocol.fileno())
+    # 新しいプロセスグループにして、タイムアウト時に孫プロセスもまとめて終了できるようにする
+    os.setpgid(0, 0)
+    cpu_seconds = job.get("cpu_seconds")
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    memory_bytes = job.get("memory_bytes")
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(out_w, 1)
+    os.dup2(err_w, 2)
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", encoding="utf-8", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", encoding="utf-8", buffering=1, closefd=False)
+
+    filename = job.get("filename") or "<sandbox>"
+    exit_code = 0
+    try:
+        if job.get("cwd"):
+            os.chdir(job["cwd"])
+        sys.argv = [filename]
+        code = compile(job["code"], filename, "exec")
+        exec(code, {"__name__": "__main__", "__file__": filename, "__builtins__": __builtins__})
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # ワーカー自身のフレームは表示しない
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+def _run_job(job):
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    _protocol.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        os.close(err_r)
+        _run_child(job, out_w, err_w)
+    os.close(out_w)
+    os.close(err_w)
+
+    streams = {out_r: "stdout", err_r: "stderr"}
+    decoders = {fd: codecs.getincrementaldecoder("utf-8")("replace") for fd in streams}
+    selector = selectors.DefaultSelector()
+    for fd in streams:
+        selector.register(fd, selectors.EVENT_READ)
+
+    wall_timeout = job.get("wall_timeout")
+    deadline = time.monotonic() + wall_timeout if wall_timeout else None
+    max_output = job.get("max_output") or 0
+    written = 0
+    timed_out = truncated = False
+    while selector.get_map():
+        timeout = None if deadline is None else deadline - time.monotonic()
+        if timeout is not None and timeout <= 0:
+            if not timed_out:
+                timed_out = True
+                _kill_group(pid)
+                # 終了後に残った出力を読み切るための猶予
+                deadline = time.monotonic() + 1
+                continue
+            break
+        for key, _ in selector.select(timeout):
+            data = os.read(key.fd, 65536)
+            if not data:
+                selector.unregister(key.fd)
+                continue
+            if truncated:
+                continue
+            text = decoders[key.fd].decode(data)
+            if max_output and written + len(text) > max_output:
+                text = text[:max(0, max_output - written)]
+                truncated = True
+            written += len(text)
+            if text:
+                _emit({"id": job["id"], "type": streams[key.fd], "data": text})
+    selector.close()
+    for fd in streams:
+        os.close(fd)
+    if not timed_out:
+        _kill_group(pid, only_descendants=True)
+    _, status = os.waitpid(pid, 0)
+    returncode = os.waitstatus_to_exitcode(status)
+    _emit({"id": job["id"], "type": "exit", "returncode": returncode, "timed_out": timed_out, "truncated": truncated})
+
+def _kill_group(pid, only_descendants=False):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        if not only_descendants:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+def main():
+    # 子プロセスの出力と混ざらないよう、ワーカー自身の標準出力は標準エラーに向ける
+    os.dup2(2, 1)
+    _emit({"type": "ready", "pid": os.getpid()})
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        try:
+            _run_job(job)
+        except Exception as e:
+            _emit({"id": job.get("id"), "type": "exit", "returncode": -1, "timed_out": False,
+                   "truncated": False, "error": f"{type(e).__name__}: {str(e)}"})
+
+if __name__ == "__main__":
+    main()
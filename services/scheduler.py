@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
+from config.settings import MULTI_AI_MAX_IN_FLIGHT
+from services.llm_limits import provider_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+async def run_bounded(
+    items: Sequence[T], worker: Callable[[T], Awaitable[Any]],
+    max_in_flight: Optional[int] = None, provider: Optional[str] = "anthropic", key: str = "file_path"
+) -> List[Dict[str, Any]]:
+    """
+    同時実行数とプロバイダのレート制限を守りながら項目ごとの処理を実行する関数
+
+    1件の失敗で全体を失敗にせず、項目ごとに status を付けた結果を返す（key は結果で項目を示すキー名）。
+      {"file_path": ..., "status": "success", "result": ...}
+      {"file_path": ..., "status": "error", "error": ...}
+    provider が None の場合はレート制限を行わない（worker 側で制限する場合など）。
+    """
+    limit = max(1, max_in_flight or MULTI_AI_MAX_IN_FLIGHT)
+    semaphore = asyncio.Semaphore(limit)
+    rate_limiter = provider_rate_limiter(provider) if provider else None
+    logger.info(f"boundedモードで{len(items)}件を実行します。同時実行数: {limit}")
+
+    async def run_one(item: T) -> Dict[str, Any]:
+        async with semaphore:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            try:
+                result = await worker(item)
+                return {key: item, "status": "success", "result": result}
+            except Exception as e:
+                logger.error(f"{item}の処理中にエラーが発生しました: {str(e)}")
+                return {key: item, "status": "error", "error": str(e)}
+
+    results = await asyncio.gather(*(run_one(item) for item in items))
+    failed = sum(1 for result in results if result["status"] == "error")
+    logger.info(f"boundedモードの実行が完了しました。成功: {len(results) - failed}, 失敗: {failed}")
+    return results
+
+async def run_file_tasks(
+    file_paths: List[str], worker: Callable[[str], Awaitable[Any]],
+    execution_mode: str, max_in_flight: Optional[int] = None
+) -> List[Any]:
+    """
+    execution_mode に応じてファイルごとの処理を実行する関数
+
+    - parallel: すべてのファイルを同時に実行する
+    - bounded: run_bounded で同時実行数とレートを制限し、ファイルごとの結果を返す
+    - それ以外: 1ファイルずつ順番に実行する
+    """
+    if execution_mode == "bounded":
+        return await run_bounded(file_paths, worker, max_in_flight)
+    if execution_mode == "parallel":
+        return await asyncio.gather(*(worker(file_path) for file_path in file_paths))
+    results = []
+    for file_path in file_paths:
+        results.append(await worker(file_path))
+    return results
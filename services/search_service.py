@@ -0,0 +1,495 @@
+# 全文検索インデックス
+#
+# ~/babel_generated/<project> 配下と babel 自身のファイルの内容を SQLite FTS5（trigram トークナイザ）に格納し、
+# 部分一致・正規表現・パスのglobで検索する。trigram の索引で候補を絞り込んでから、
+# 候補のファイルだけを Python で照合して行番号とスニペットを作る。
+# 初回はバックグラウンドで全体を走査し（前回の内容とは mtime とサイズで比較する）、以降は watchdog のイベントで差分更新する。
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from config.settings import SEARCH_INDEX_PATH, SEARCH_MAX_FILE_SIZE
+from services.directory_index import in_skipped_dir, walk_files, watch_tree
+from utils.file_utils import BABEL_ROOT
+from utils.gitignore import get_gitignore_matcher
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+logger = logging.getLogger(__name__)
+
+GENERATED_ROOT = os.path.join(os.path.expanduser("~"), "babel_generated")
+
+# 頻繁に書き換えられるログやデータベースは索引に含めない
+_SKIP_SUFFIXES = (".log", ".pyc", ".sqlite3", ".sqlite3-wal", ".sqlite3-shm", ".db")
+# 1回のトランザクションで書き込むファイル数
+_BATCH_SIZE = 200
+# trigram の索引が使える最短の文字数
+_MIN_TRIGRAM = 3
+# 返すスニペットの最大文字数と、1ファイルで数える一致数の上限
+_SNIPPET_LENGTH = 240
+_MAX_MATCH_COUNT = 1000
+
+def _normalize(path: str) -> str:
+    path = os.path.normpath(path).replace(os.sep, "/")
+    return "" if path == "." else path
+
+def _phrase(text: str) -> str:
+    # FTS5のフレーズとしてエスケープする（trigram では部分文字列としての一致になる）
+    return '"' + text.replace('"', '""') + '"'
+
+def _like_pattern(text: str) -> str:
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def required_literals(pattern: str) -> List[str]:
+    """
+    正規表現に一致する文字列が必ず含む固定文字列を取り出す関数（trigram による絞り込み用）
+
+    最上位の連続したリテラルと、グループや1回以上の繰り返しの中のリテラルを返す。
+    選択（|）や0回を許す繰り返しの中は必須ではないため含めない。
+    """
+    literals: List[str] = []
+
+    def walk(items):
+        run: List[str] = []
+        for op, arg in items:
+            if op is sre_constants.LITERAL:
+                run.append(chr(arg))
+                continue
+            if run:
+                literals.append("".join(run))
+                run = []
+            if op is sre_constants.SUBPATTERN:
+                walk(arg[-1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and arg[0] >= 1:
+                walk(arg[2])
+        if run:
+            literals.append("".join(run))
+
+    walk(sre_parse.parse(pattern))
+    return literals
+
+def _read_text(path: str) -> Optional[str]:
+    # バイナリファイルは None
+    with open(path, "rb") as f:
+        data = f.read()
+    if b"\0" in data[:8192]:
+        return None
+    return data.decode("utf-8", errors="replace")
+
+def _snippet(line: str, spans: List[Tuple[int, int]]) -> Tuple[str, List[List[int]]]:
+    # 長い行は最初の一致の周辺だけを切り出し、一致範囲をスニペット内の位置に合わせる
+    if len(line) <= _SNIPPET_LENGTH:
+        return line, [[start, end] for start, end in spans]
+    offset = max(0, min(spans[0][0] - _SNIPPET_LENGTH // 4, len(line) - _SNIPPET_LENGTH))
+    text = line[offset:offset + _SNIPPET_LENGTH]
+    ranges = [
+        [start - offset, min(end, offset + _SNIPPET_LENGTH) - offset]
+        for start, end in spans if offset <= start < offset + _SNIPPET_LENGTH
+    ]
+    return text, ranges
+
+def find_matches(body: str, regex: re.Pattern, max_matches: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    本文中の一致を行ごとにまとめて返す関数
+
+    戻り値: (最初の max_matches 行分の {"line", "text", "ranges"}, 一致数（_MAX_MATCH_COUNT が上限）)
+    """
+    lines: List[Dict[str, Any]] = []
+    count = 0
+    line_no, line_start, line_end = 1, 0, -1
+    for match in regex.finditer(body):
+        if count == _MAX_MATCH_COUNT:
+            break
+        count += 1
+        start = match.start()
+        if start > line_end:
+            # 新しい行の一致。前回の行の先頭から数えて行番号を進める
+            if len(lines) == max_matches:
+                continue
+            line_no += body.count("\n", line_start, start)
+            line_start = body.rfind("\n", 0, start) + 1
+            line_end = body.find("\n", start)
+            if line_end == -1:
+                line_end = len(body)
+            lines.append({"line": line_no, "text": body[line_start:line_end], "spans": []})
+        lines[-1]["spans"].append((start - line_start, min(match.end(), line_end) - line_start))
+    result = []
+    for line in lines:
+        text, ranges = _snippet(line["text"].rstrip("\r"), line["spans"])
+        result.append({"line": line["line"], "text": text, "ranges": ranges})
+    return result, count
+
+class SearchIndex:
+    """
+    プロジェクトごとのファイルの内容の全文検索インデックス
+
+    files テーブルにファイルの mtime・サイズを、contents（FTS5）テーブルにパスと本文を保持する。
+    大きすぎるファイルとバイナリファイルは files にだけ記録し、本文は格納しない。
+    """
+
+    def __init__(self, db_path: str, generated_root: str = GENERATED_ROOT, babel_root: Optional[str] = None,
+                 max_file_size: int = SEARCH_MAX_FILE_SIZE):
+        self.db_path = db_path
+        self.generated_root = os.path.abspath(generated_root)
+        self.babel_root = os.path.abspath(babel_root) if babel_root else None
+        self.max_file_size = max_file_size
+        self.fts = True
+        self.indexing = False
+        self._conn = None
+        self._lock = threading.RLock()
+        self._started = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "id INTEGER PRIMARY KEY, project TEXT NOT NULL, path TEXT NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, indexed INTEGER NOT NULL, "
+                "UNIQUE(project, path))"
+            )
+            try:
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS contents USING fts5(path, body, tokenize='trigram')")
+            except sqlite3.OperationalError as e:
+                # trigram トークナイザがない古いSQLiteでは、索引なしで全件を照合する
+                logger.warning(f"FTS5（trigram）が使えないため、索引なしで検索します: {str(e)}")
+                self.fts = False
+                conn.execute("CREATE TABLE IF NOT EXISTS contents (path TEXT, body TEXT)")
+            conn.commit()
+            self._conn = conn
+            logger.info(f"全文検索インデックスを開きました: {self.db_path}")
+        return self._conn
+
+    # ---- プロジェクトとパス ----
+
+    def projects(self) -> Dict[str, str]:
+        """
+        インデックスの対象となるプロジェクトIDとルートディレクトリ
+        """
+        projects = {}
+        if self.babel_root and os.path.isdir(self.babel_root):
+            projects["babel"] = self.babel_root
+        try:
+            with os.scandir(self.generated_root) as entries:
+                for entry in entries:
+                    # .cache などの隠しディレクトリはプロジェクトではない
+                    if entry.is_dir() and not entry.name.startswith("."):
+                        projects[entry.name] = entry.path
+        except FileNotFoundError:
+            pass
+        return projects
+
+    def locate(self, abs_path: str) -> Optional[Tuple[str, str, str]]:
+        """
+        絶対パスを (プロジェクトID, プロジェクトのルート, ルートからの相対パス) に変換する関数（対象外は None）
+        """
+        abs_path = os.path.abspath(abs_path)
+        rel_path = os.path.relpath(abs_path, self.generated_root)
+        if not rel_path.startswith(".."):
+            if rel_path == ".":
+                return None
+            project, _, rest = rel_path.partition(os.sep)
+            if project.startswith("."):
+                return None
+            return project, os.path.join(self.generated_root, project), _normalize(rest) if rest else ""
+        if self.babel_root:
+            rel_path = os.path.relpath(abs_path, self.babel_root)
+            if not rel_path.startswith(".."):
+                return "babel", self.babel_root, _normalize(rel_path)
+        return None
+
+    @staticmethod
+    def _ignored(root: str, rel_path: str, is_dir: bool) -> bool:
+        if in_skipped_dir(rel_path, is_dir):
+            return True
+        if not is_dir and rel_path.endswith(_SKIP_SUFFIXES):
+            return True
+        return get_gitignore_matcher(root).is_ignored(rel_path, is_dir)
+
+    @staticmethod
+    def _walk(root: str, start: str = "") -> Iterator[Tuple[str, os.stat_result]]:
+        for rel_path, entry in walk_files(root, start):
+            if not entry.name.endswith(_SKIP_SUFFIXES):
+                try:
+                    yield rel_path, entry.stat()
+                except OSError:
+                    continue
+
+    # ---- インデックスの更新 ----
+
+    def _read_body(self, root: str, rel_path: str, stat: os.stat_result) -> Optional[str]:
+        # 大きすぎるファイルとバイナリファイルは本文を格納しない（None）。読めない場合は OSError
+        if stat.st_size > self.max_file_size:
+            return None
+        return _read_text(os.path.join(root, rel_path))
+
+    def _write(self, project: str, rel_path: str, stat: os.stat_result, body: Optional[str]):
+        # 呼び出し側でロックとトランザクションを管理すること
+        conn = self._connect()
+        row = conn.execute("SELECT id FROM files WHERE project = ? AND path = ?", (project, rel_path)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM contents WHERE rowid = ?", (row[0],))
+            conn.execute(
+                "UPDATE files SET mtime_ns = ?, size = ?, indexed = ? WHERE id = ?",
+                (stat.st_mtime_ns, stat.st_size, body is not None, row[0])
+            )
+            file_id = row[0]
+        else:
+            file_id = conn.execute(
+                "INSERT INTO files (project, path, mtime_ns, size, indexed) VALUES (?, ?, ?, ?, ?)",
+                (project, rel_path, stat.st_mtime_ns, stat.st_size, body is not None)
+            ).lastrowid
+        if body is not None:
+            conn.execute("INSERT INTO contents (rowid, path, body) VALUES (?, ?, ?)", (file_id, rel_path, body))
+
+    def _delete(self, project: str, rel_path: str):
+        # rel_path 自身と、ディレクトリであれば配下のすべてのファイルを削除する
+        conn = self._connect()
+        condition = "project = ?"
+        params: Tuple = (project,)
+        if rel_path:
+            condition += " AND (path = ? OR substr(path, 1, ?) = ?)"
+            params += (rel_path, len(rel_path) + 1, rel_path + "/")
+        conn.execute(f"DELETE FROM contents WHERE rowid IN (SELECT id FROM files WHERE {condition})", params)
+        conn.execute(f"DELETE FROM files WHERE {condition}", params)
+
+    def sync_project(self, project: str, root: str, start: str = ""):
+        """
+        プロジェクト（または start 以下のサブディレクトリ）を走査し、変更されたファイルだけを更新する
+        """
+        with self._lock:
+            conn = self._connect()
+            query = "SELECT path, mtime_ns, size FROM files WHERE project = ?"
+            params: Tuple = (project,)
+            if start:
+                query += " AND substr(path, 1, ?) = ?"
+                params += (len(start) + 1, start + "/")
+            known = {path: (mtime_ns, size) for path, mtime_ns, size in conn.execute(query, params)}
+        seen = set()
+        changed = []
+        for rel_path, stat in self._walk(root, start):
+            seen.add(rel_path)
+            if known.get(rel_path) != (stat.st_mtime_ns, stat.st_size):
+                changed.append((rel_path, stat))
+        removed = [path for path in known if path not in seen]
+        # 検索を長時間止めないよう、ファイルはロックの外で読み、少しずつ書き込む
+        for i in range(0, len(changed), _BATCH_SIZE):
+            batch = []
+            for rel_path, stat in changed[i:i + _BATCH_SIZE]:
+                try:
+                    batch.append((rel_path, stat, self._read_body(root, rel_path, stat)))
+                except OSError:
+                    continue
+            with self._lock, self._connect():
+                for rel_path, stat, body in batch:
+                    self._write(project, rel_path, stat, body)
+        with self._lock, self._connect():
+            for rel_path in removed:
+                self._delete(project, rel_path)
+        if changed or removed:
+            logger.info(f"全文検索インデックスを更新しました: {project}（更新 {len(changed)}件, 削除 {len(removed)}件）")
+
+    def sync(self):
+        """
+        すべてのプロジェクトを走査してインデックスを最新にする（削除されたプロジェクトは取り除く）
+        """
+        self.indexing = True
+        started = time.monotonic()
+        try:
+            projects = self.projects()
+            for project, root in projects.items():
+                self.sync_project(project, root)
+            with self._lock, self._connect() as conn:
+                indexed = [row[0] for row in conn.execute("SELECT DISTINCT project FROM files")]
+                for project in indexed:
+                    if project not in projects:
+                        self._delete(project, "")
+        finally:
+            self.indexing = False
+        logger.info(f"全文検索インデックスを作成しました（{time.monotonic() - started:.1f}秒）")
+
+    def update(self, abs_path: str, is_dir: bool = False):
+        """
+        作成・変更されたファイル（ディレクトリの場合は配下すべて）を更新する
+        """
+        location = self.locate(abs_path)
+        if location is None:
+            return
+        project, root, rel_path = location
+        if not rel_path or is_dir:
+            if rel_path and self._ignored(root, rel_path, True):
+                return
+            self.sync_project(project, root, rel_path)
+            return
+        if os.path.basename(rel_path) == ".gitignore":
+            # 無視対象が変わった可能性があるため、プロジェクト全体を走査し直す
+            self.sync_project(project, root)
+            return
+        if self._ignored(root, rel_path, False):
+            return
+        try:
+            stat = os.stat(os.path.join(root, rel_path))
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT mtime_ns, size FROM files WHERE project = ? AND path = ?", (project, rel_path)
+                ).fetchone()
+            if row is not None and tuple(row) == (stat.st_mtime_ns, stat.st_size):
+                return
+            body = self._read_body(root, rel_path, stat)
+        except OSError:
+            self.remove(abs_path)
+            return
+        with self._lock, self._connect():
+            self._write(project, rel_path, stat, body)
+
+    def remove(self, abs_path: str):
+        """
+        削除されたファイル（またはディレクトリ配下のすべてのファイル）を取り除く
+        """
+        location = self.locate(abs_path)
+        if location is None:
+            return
+        project, _, rel_path = location
+        with self._lock, self._connect():
+            self._delete(project, rel_path)
+
+    # ---- 検索 ----
+
+    def search(self, query: str, project: Optional[str] = None, regex: bool = False, case_sensitive: bool = False,
+               paths: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+               limit: int = 50, max_matches: int = 5) -> Dict[str, Any]:
+        """
+        ファイルの内容とパスを検索する関数
+
+        query: 検索する文字列（regex=True の場合は正規表現）
+        paths / exclude: 対象に含める・除外するパスのglob（SQLiteのGLOB。* は / にも一致する）
+        結果は trigram の索引で絞り込めた場合は関連度（bm25）順、そうでない場合はパス順に並ぶ。
+        Raises:
+            ValueError: 正規表現が不正な場合
+        """
+        if not query:
+            raise ValueError("検索する文字列を指定してください")
+        flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+        try:
+            pattern = re.compile(query if regex else re.escape(query), flags)
+            literals = required_literals(query) if regex else [query]
+        except re.error as e:
+            raise ValueError(f"正規表現が不正です: {str(e)}")
+        started = time.monotonic()
+
+        conditions, params = [], []
+        if project:
+            conditions.append("f.project = ?")
+            params.append(project)
+        if paths:
+            conditions.append("(" + " OR ".join("f.path GLOB ?" for _ in paths) + ")")
+            params.extend(paths)
+        for glob in exclude or []:
+            conditions.append("f.path NOT GLOB ?")
+            params.append(glob)
+        trigram_literals = [literal for literal in literals if len(literal) >= _MIN_TRIGRAM]
+        if self.fts and trigram_literals:
+            strategy = "index"
+            conditions.insert(0, "contents MATCH ?")
+            params.insert(0, " AND ".join(_phrase(literal) for literal in trigram_literals))
+            order = "bm25(contents, 5.0, 1.0), f.path"
+        else:
+            strategy = "scan"
+            if not regex:
+                # 索引が使えない短い文字列は、SQLite側で本文かパスに含むものだけに絞る
+                if case_sensitive:
+                    conditions.append("(instr(c.body, ?) > 0 OR instr(c.path, ?) > 0)")
+                    params.extend([query, query])
+                else:
+                    conditions.append("(c.body LIKE ? ESCAPE '\\' OR c.path LIKE ? ESCAPE '\\')")
+                    params.extend([_like_pattern(query)] * 2)
+            order = "f.project, f.path"
+        sql = (
+            "SELECT f.project, f.path, c.body FROM contents c JOIN files f ON f.id = c.rowid"
+            + (" WHERE " + " AND ".join(conditions) if conditions else "")
+            + f" ORDER BY {order}"
+        )
+
+        results, candidates, truncated = [], 0, False
+        with self._lock:
+            cursor = self._connect().execute(sql, params)
+            for file_project, path, body in cursor:
+                candidates += 1
+                matches, count = find_matches(body, pattern, max_matches)
+                path_match = pattern.search(path) is not None
+                if not count and not path_match:
+                    continue
+                if len(results) == limit:
+                    truncated = True
+                    break
+                results.append({
+                    "project": file_project,
+                    "path": path,
+                    "path_match": path_match,
+                    "match_count": count,
+                    "matches": matches,
+                })
+            cursor.close()
+        return {
+            "query": query,
+            "regex": regex,
+            "strategy": strategy,
+            "results": results,
+            "truncated": truncated,
+            "candidates": candidates,
+            "indexing": self.indexing,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 2),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._connect()
+            projects = {
+                project: {"files": files, "indexed": indexed or 0}
+                for project, files, indexed in conn.execute(
+                    "SELECT project, COUNT(*), SUM(indexed) FROM files GROUP BY project"
+                )
+            }
+        return {
+            "path": self.db_path,
+            "fts": self.fts,
+            "indexing": self.indexing,
+            "projects": projects,
+            "max_file_size": self.max_file_size,
+        }
+
+    # ---- 監視 ----
+
+    def start(self):
+        """
+        ファイル監視を開始し、バックグラウンドでインデックスを最新にする（2回目以降は何もしない）
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        os.makedirs(self.generated_root, exist_ok=True)
+        # 走査中の変更を取りこぼさないよう、監視を先に開始する
+        for root in filter(None, (self.generated_root, self.babel_root)):
+            watch_tree(root, self)
+        self.indexing = True
+        threading.Thread(target=self._initial_sync, name="search-index-sync", daemon=True).start()
+
+    def _initial_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            logger.error(f"全文検索インデックスの作成中にエラーが発生しました: {str(e)}")
+
+search_index = SearchIndex(SEARCH_INDEX_PATH, babel_root=BABEL_ROOT)
@@ -1,12 +0,0 @@
-# 検索機能のテスト
-# 依存: pytest, api.search
-def test_dummy_search():
-    assert True
-
-
-# 追記された内容:
-# # 検索機能のテスト
-# # 依存: pytest, api.search
-# def test_dummy_search():
-#     assert True
-# 
\ No newline at end of file
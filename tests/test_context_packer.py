@@ -0,0 +1,74 @@
+# コンテキストパッカーのテスト
+import asyncio
+from services import context_packer
+from services.context_packer import (
+    ContextFile, count_tokens, load_context_files, pack, rank_files, run_with_context,
+    split_into_groups, strip_low_value
+)
+
+def _file(path, content):
+    file = ContextFile(path, content)
+    file.tokens = count_tokens(file.render())
+    return file
+
+def test_strip_low_value():
+    content, omitted = strip_low_value("app/package-lock.json", '{"a": 1}\n' * 100)
+    assert omitted == "lockfile" and content == "（ロックファイルのため省略: 100行）"
+    content, omitted = strip_low_value("dist/app.js", "x")
+    assert omitted == "generated"
+    literal = "a" * 500
+    content, omitted = strip_low_value("src/data.py", f'DATA = "{literal}"\nprint(DATA)\n')
+    assert omitted == "long_literals"
+    assert literal not in content and "500文字省略" in content
+    assert "print(DATA)" in content
+    content, omitted = strip_low_value("src/ok.py", "print('hello')\n")
+    assert omitted is None and content == "print('hello')\n"
+
+def test_rank_by_mentions():
+    files = [
+        _file("pages/home.tsx", "import Button from './Button'\nimport { api } from './api'"),
+        _file("api.ts", "export const api = 1"),
+        _file("Button.tsx", "import { api } from './api'\nexport default function Button() {}"),
+    ]
+    ranked = rank_files(files)
+    assert [file.path for file in ranked] == ["api.ts", "Button.tsx", "pages/home.tsx"]
+
+def test_pack_and_split_respect_budget():
+    files = [_file(f"f{i}.py", "x = 1\n" * 40) for i in range(5)]
+    budget = files[0].tokens * 2 + 2
+    packed = pack(files, budget)
+    assert len(packed.files) == 2 and len(packed.overflow) == 3
+    groups = split_into_groups(files, budget)
+    assert len(groups) == 3
+    assert all(group.tokens <= budget for group in groups)
+    big = _file("big.py", "\n".join(f"line_{i} = {i}" for i in range(500)))
+    parts = split_into_groups([big], 200)
+    assert len(parts) > 1
+    assert all(part.files[0].tokens <= 200 for part in parts)
+
+def test_run_with_context_single_and_map_reduce(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"module{i}.py"
+        path.write_text(f"import module{(i + 1) % 4}\n" + "value = 1\n" * 50)
+        paths.append(str(path))
+    prompts = []
+
+    async def generate(prompt):
+        prompts.append(prompt)
+        return {"generated_text": f"summary{len(prompts)}"}
+
+    files = load_context_files(paths)
+    result = asyncio.run(run_with_context("分析して：\n", paths, generate, "要約して：\n", "まとめて：\n",
+                                          budget=100000, files=files))
+    assert result["context"]["strategy"] == "single"
+    assert len(prompts) == 1 and "### module0.py" in prompts[0]
+
+    prompts.clear()
+    budget = files[0].tokens * 2 + 20
+    result = asyncio.run(run_with_context("分析して：\n", paths, generate, "要約して：\n", "まとめて：\n",
+                                          budget=budget, files=load_context_files(paths)))
+    assert result["context"]["strategy"] == "map_reduce"
+    assert result["context"]["groups"] == len(prompts) - 1
+    assert prompts[-1].startswith("まとめて：\n分析して：\n")
+    assert all(count_tokens(prompt) <= budget for prompt in prompts)
@@ -0,0 +1,188 @@
+# ディレクトリ構造のインメモリインデックスのテスト
+import json
+import os
+import shutil
+import pytest
+from fastapi import HTTPException
+from watchdog.events import (
+    DirCreatedEvent, DirDeletedEvent, FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent
+)
+from services import directory_index
+from services.directory_index import DirectoryIndex, _TreeEventHandler, walk_files, watch_tree
+from services.file_service import stream_directory_structure
+
+def _write(root, rel_path, content=""):
+    path = os.path.join(root, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+def _names(items):
+    return [item["name"] for item in items]
+
+@pytest.fixture
+def project(tmp_path):
+    root = str(tmp_path / "project")
+    _write(root, ".gitignore", "*.log\nbuild/\n")
+    _write(root, "src/app.py")
+    _write(root, "src/util/helpers.py")
+    _write(root, "docs/readme.md")
+    _write(root, "debug.log")
+    _write(root, "build/bundle.js")
+    return root
+
+@pytest.fixture
+def index(project):
+    index = DirectoryIndex(project, os.path.join(project, ".gitignore"))
+    index.seed()
+    return index
+
+def test_seed_skips_ignored_entries(index):
+    structure = index.structure()
+    assert _names(structure) == [".gitignore", "docs", "src"]
+    src = structure[2]
+    assert src == {
+        "name": "src", "type": "folder", "path": "src",
+        "children": [
+            {"name": "app.py", "type": "file", "path": os.path.join("src", "app.py")},
+            {"name": "util", "type": "folder", "path": os.path.join("src", "util"), "children": [
+                {"name": "helpers.py", "type": "file", "path": os.path.join("src", "util", "helpers.py")},
+            ]},
+        ],
+    }
+    assert _names(index.structure("src/util")) == ["helpers.py"]
+    assert index.structure(depth=1)[2] == {"name": "src", "type": "folder", "path": "src", "has_children": True}
+    with pytest.raises(FileNotFoundError):
+        index.structure("missing")
+    with pytest.raises(ValueError):
+        index.structure("../outside")
+
+def test_events_update_index(index, project):
+    handler = _TreeEventHandler([index])
+
+    handler.on_created(FileCreatedEvent(_write(project, "src/new.py")))
+    handler.on_created(FileCreatedEvent(_write(project, "src/trace.log")))
+    _write(project, "lib/core/main.py")
+    handler.on_created(DirCreatedEvent(os.path.join(project, "lib")))
+    assert _names(index.structure("src")) == ["app.py", "new.py", "util"]
+    assert _names(index.structure("lib/core")) == ["main.py"]
+
+    os.rename(os.path.join(project, "src/new.py"), os.path.join(project, "docs/new.py"))
+    handler.on_moved(FileMovedEvent(os.path.join(project, "src/new.py"), os.path.join(project, "docs/new.py")))
+    assert _names(index.structure("src")) == ["app.py", "util"]
+    assert _names(index.structure("docs")) == ["new.py", "readme.md"]
+
+    os.remove(os.path.join(project, "docs/readme.md"))
+    handler.on_deleted(FileDeletedEvent(os.path.join(project, "docs/readme.md")))
+    shutil.rmtree(os.path.join(project, "lib"))
+    handler.on_deleted(DirDeletedEvent(os.path.join(project, "lib")))
+    assert _names(index.structure()) == [".gitignore", "docs", "src"]
+    assert _names(index.structure("docs")) == ["new.py"]
+
+    # .gitignore が変わった場合は作り直す
+    _write(project, ".gitignore", "*.log\n")
+    handler.on_modified(FileModifiedEvent(os.path.join(project, ".gitignore")))
+    assert _names(index.structure()) == [".gitignore", "build", "docs", "src"]
+
+def test_walk_files_skips_ignored_and_skip_dirs(project):
+    _write(project, "node_modules/pkg/index.js")
+    _write(project, "src/__pycache__/app.cpython-312.pyc")
+    assert sorted(rel for rel, _ in walk_files(project)) == [
+        ".gitignore", "docs/readme.md", "src/app.py", "src/util/helpers.py"
+    ]
+    assert [rel for rel, _ in walk_files(project, "src/util")] == ["src/util/helpers.py"]
+
+def test_watch_tree_shares_watches(tmp_path, monkeypatch):
+    monkeypatch.setattr(directory_index, "_watches", {})
+    root = tmp_path / "root"
+    os.makedirs(root / "nested")
+    first, second, third = object(), object(), object()
+    watch_tree(str(root / "nested"), first)
+    watch_tree(str(root), second)
+    # 配下の監視は親ルートの監視にまとめられる
+    assert list(directory_index._watches) == [str(root)]
+    watch_tree(str(root / "nested"), third)
+    watch, handler = directory_index._watches[str(root)]
+    assert handler.listeners == [second, first, third]
+    directory_index.get_observer().unschedule(watch)
+
+def test_render_cache_invalidated_per_node(index, project):
+    structure = index.structure()
+    docs_children = structure[1]["children"]
+    util_children = structure[2]["children"][1]["children"]
+    assert index.structure() is structure
+
+    index.add(_write(project, "src/util/more.py"), False)
+    rebuilt = index.structure()
+    assert rebuilt is not structure
+    # 変更のあったフォルダとその祖先だけを作り直し、兄弟のフォルダはキャッシュを使う
+    assert rebuilt[1]["children"] is docs_children
+    assert rebuilt[2]["children"][1]["children"] is not util_children
+    assert _names(rebuilt[2]["children"][1]["children"]) == ["helpers.py", "more.py"]
+
+    # 変更のない追加・インデックス外の削除ではキャッシュを捨てない
+    index.add(os.path.join(project, "src/util/more.py"), False)
+    index.remove(os.path.join(project, "missing/file.py"))
+    assert index.structure() is rebuilt
+
+def _paths(items):
+    return [item["path"].replace(os.sep, "/") for item in items]
+
+def test_entries_cursor_pagination(index, project):
+    everything, next_cursor = index.entries(limit=100)
+    assert next_cursor is None
+    assert _paths(everything) == [
+        ".gitignore", "docs", "docs/readme.md", "src", "src/app.py", "src/util", "src/util/helpers.py"
+    ]
+    assert everything[3] == {"name": "src", "type": "folder", "path": "src", "depth": 1, "has_children": True}
+
+    pages, cursor = [], None
+    while True:
+        items, cursor = index.entries(cursor=cursor, limit=3)
+        assert len(items) <= 3
+        pages.append(_paths(items))
+        if cursor is None:
+            break
+        # 次のページは前のページの最後のエントリの直後から始まる
+        assert cursor == items[-1]["path"]
+    assert pages == [
+        [".gitignore", "docs", "docs/readme.md"], ["src", "src/app.py", "src/util"], ["src/util/helpers.py"]
+    ]
+
+    # カーソルのエントリが削除されていても、その位置の直後から再開する
+    index.remove(os.path.join(project, "src", "app.py"))
+    assert _paths(index.entries(cursor="src/app.py", limit=10)[0]) == ["src/util", "src/util/helpers.py"]
+
+def test_entries_depth_and_path(index):
+    items, _ = index.entries(depth=1)
+    assert _paths(items) == [".gitignore", "docs", "src"]
+    items, _ = index.entries("src", depth=1)
+    assert [(item["path"].replace(os.sep, "/"), item["depth"]) for item in items] == [("src/app.py", 1), ("src/util", 1)]
+    assert _paths(index.entries("src", cursor="src/app.py", limit=10)[0]) == ["src/util", "src/util/helpers.py"]
+    with pytest.raises(FileNotFoundError):
+        index.entries("missing")
+
+def test_stream_directory_structure_ndjson(project, tmp_path, monkeypatch):
+    generated = tmp_path / "babel_generated"
+    os.makedirs(generated)
+    os.rename(project, generated / "shop")
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    lines = list(stream_directory_structure("shop"))
+    assert all(line.endswith("\n") for line in lines)
+    entries = [json.loads(line) for line in lines]
+    assert [(entry["path"], entry["depth"]) for entry in entries] == [
+        (".gitignore", 1), ("docs", 1), ("docs/readme.md", 2), ("src", 1),
+        ("src/app.py", 2), ("src/util", 2), ("src/util/helpers.py", 3),
+    ]
+    assert entries[3] == {"name": "src", "type": "folder", "path": "src", "depth": 1}
+
+    entries = [json.loads(line) for line in stream_directory_structure("shop", "src", depth=1)]
+    assert [entry["path"] for entry in entries] == ["src/app.py", "src/util"]
+    with pytest.raises(HTTPException) as missing:
+        stream_directory_structure("shop", "missing")
+    assert missing.value.status_code == 404
+    with pytest.raises(HTTPException) as outside:
+        stream_directory_structure("shop", "../other")
+    assert outside.value.status_code == 400
@@ -0,0 +1,39 @@
+# ファイル変更イベントのまとめ処理のテスト
+import asyncio
+from utils.file_changes import ChangeCoalescer
+
+def _collect(events, debounce=0.05, max_delay=1.0):
+    async def run():
+        flushed = []
+        coalescer = ChangeCoalescer(flushed.append, debounce, max_delay, asyncio.get_running_loop())
+        for event_type, path in events:
+            coalescer.add(event_type, path)
+        await asyncio.sleep(debounce * 3)
+        return flushed
+    return asyncio.run(run())
+
+def test_events_are_coalesced_per_path():
+    flushed = _collect([
+        ("created", "/a"), ("modified", "/a"),
+        ("created", "/b"), ("modified", "/b"), ("deleted", "/b"),
+        ("modified", "/c"), ("deleted", "/c"),
+        ("deleted", "/d"), ("created", "/d"),
+        ("opened", "/e"),
+    ])
+    assert len(flushed) == 1
+    assert {change["path"]: change["type"] for change in flushed[0]} == {
+        "/a": "created", "/c": "deleted", "/d": "modified",
+    }
+
+def test_continuous_events_are_flushed_after_max_delay():
+    async def run():
+        flushed = []
+        coalescer = ChangeCoalescer(flushed.append, 0.05, 0.12, asyncio.get_running_loop())
+        for _ in range(10):
+            coalescer.add("modified", "/a")
+            await asyncio.sleep(0.03)
+        await asyncio.sleep(0.1)
+        return flushed
+    flushed = asyncio.run(run())
+    assert len(flushed) >= 2
+    assert all(batch == [{"type": "modified", "path": "/a", "is_directory": False}] for batch in flushed)
@@ -0,0 +1,21 @@
+# ファイル操作ユーティリティのテスト
+import pytest
+from utils.file_operations import RangeNotSatisfiable, parse_range_header
+
+def test_parse_range_header_valid():
+    assert parse_range_header("bytes=0-9", 100) == (0, 9)
+    assert parse_range_header("bytes=90-", 100) == (90, 99)
+    assert parse_range_header("bytes=90-200", 100) == (90, 99)
+    assert parse_range_header("bytes=-10", 100) == (90, 99)
+    assert parse_range_header("bytes=-500", 100) == (0, 99)
+
+def test_parse_range_header_ignores_invalid_syntax():
+    # 構文が不正なRangeは無視して全体を返す
+    for header in (None, "", "items=0-9", "bytes=0-9,20-29", "bytes=abc", "bytes=a-b", "bytes=-",
+                   "bytes=5", "bytes=1--5", "bytes=+1-5", "bytes=10-5"):
+        assert parse_range_header(header, 100) is None, header
+
+def test_parse_range_header_unsatisfiable():
+    for header in ("bytes=100-", "bytes=200-300", "bytes=-0"):
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range_header(header, 100)
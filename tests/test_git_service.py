@@ -0,0 +1,107 @@
+# GitPythonを使ったGitサービスのテスト
+import asyncio
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from git import Repo
+from api import git_operations
+from services.git_service import git_add, git_commit, git_diff, git_log, git_status
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return tmp_path
+
+@pytest.fixture
+def repo(home):
+    root = home / "babel_generated" / "shop"
+    repo = Repo.init(root)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "babel")
+        config.set_value("user", "email", "babel@example.com")
+    for name in ("keep.py", "edit.py", "gone.py"):
+        (root / name).write_text(f"{name}\n")
+    repo.index.add(["keep.py", "edit.py", "gone.py"])
+    repo.index.commit("initial")
+    return repo
+
+def test_status_change_types(repo):
+    root = repo.working_tree_dir
+    with open(os.path.join(root, "new.py"), "w") as f:
+        f.write("new\n")
+    with open(os.path.join(root, "edit.py"), "w") as f:
+        f.write("edited\n")
+    with open(os.path.join(root, "untracked.py"), "w") as f:
+        f.write("untracked\n")
+    os.remove(os.path.join(root, "gone.py"))
+
+    async def run():
+        await git_add(root, ["new.py", "gone.py"])
+        return await git_status(root)
+
+    status = asyncio.run(run())
+    assert sorted((entry["path"], entry["change_type"]) for entry in status["staged"]) == [("gone.py", "D"), ("new.py", "A")]
+    assert status["unstaged"] == [{"path": "edit.py", "change_type": "M"}]
+    assert status["untracked"] == ["untracked.py"]
+    assert status["head"] == repo.head.commit.hexsha
+
+def test_diff_unstaged_staged_and_commit(repo):
+    root = repo.working_tree_dir
+    with open(os.path.join(root, "edit.py"), "w") as f:
+        f.write("edited\n")
+
+    async def run():
+        unstaged = await git_diff(root)
+        await git_add(root, "edit.py")
+        staged = await git_diff(root, staged=True)
+        after_add = await git_diff(root)
+        info = await git_commit(root, "edit")
+        committed = await git_diff(root, commit=info["hexsha"])
+        first = await git_diff(root, path="keep.py", commit=repo.head.commit.parents[0].hexsha)
+        return unstaged, staged, after_add, committed, first
+
+    unstaged, staged, after_add, committed, first = asyncio.run(run())
+    assert [(entry["path"], entry["change_type"]) for entry in unstaged] == [("edit.py", "M")]
+    assert "-edit.py" in unstaged[0]["diff"] and "+edited" in unstaged[0]["diff"]
+    assert [entry["path"] for entry in staged] == ["edit.py"]
+    assert after_add == []
+    assert [entry["path"] for entry in committed] == ["edit.py"]
+    # 最初のコミットは空のツリーとの差分になる
+    assert [(entry["path"], entry["change_type"]) for entry in first] == [("keep.py", "A")]
+    with pytest.raises(ValueError):
+        asyncio.run(git_diff(root, commit="0" * 40))
+
+def test_log_paging(repo):
+    root = repo.working_tree_dir
+
+    async def run():
+        for i in range(4):
+            with open(os.path.join(root, "edit.py"), "w") as f:
+                f.write(f"{i}\n")
+            await git_add(root, "edit.py")
+            await git_commit(root, f"change {i}")
+        return (
+            await git_log(root, max_count=2),
+            await git_log(root, max_count=2, skip=2),
+            await git_log(root, path="keep.py"),
+        )
+
+    first_page, second_page, keep = asyncio.run(run())
+    assert [commit["summary"] for commit in first_page] == ["change 3", "change 2"]
+    assert [commit["summary"] for commit in second_page] == ["change 1", "change 0"]
+    assert [commit["summary"] for commit in keep] == ["initial"]
+
+def test_api_returns_404_without_repo(repo, home):
+    os.makedirs(home / "babel_generated" / "plain")
+    app = FastAPI()
+    app.include_router(git_operations.router)
+    client = TestClient(app)
+    assert client.get("/api/git/status", params={"project_id": "shop"}).status_code == 200
+    for endpoint in ("status", "diff", "log"):
+        assert client.get(f"/api/git/{endpoint}", params={"project_id": "plain"}).status_code == 404
+    assert client.post("/api/git/commit", json={"project_id": "plain", "message": "x"}).status_code == 404
+    # 存在しないプロジェクトと、~/babel_generated の外を指すID
+    assert client.get("/api/git/status", params={"project_id": "missing"}).status_code == 404
+    assert client.get("/api/git/log", params={"project_id": "../shop"}).status_code == 400
+    assert client.post("/api/git/commit", json={"project_id": "..", "message": "x"}).status_code == 400
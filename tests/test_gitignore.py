@@ -0,0 +1,74 @@
+# .gitignoreマッチャーのテスト
+import os
+from utils.gitignore import GitIgnoreRules, GitIgnoreMatcher, get_gitignore_matcher, should_ignore
+
+def test_basename_and_anchored_patterns():
+    rules = GitIgnoreRules(["*.log", "/build", "docs/*.md"])
+    assert rules.match("a/b/debug.log", False) is True
+    assert rules.match("build", True) is True
+    assert rules.match("src/build", True) is None
+    assert rules.match("docs/readme.md", False) is True
+    assert rules.match("docs/sub/readme.md", False) is None
+
+def test_negation_and_last_match_wins():
+    rules = GitIgnoreRules(["*.log", "!keep.log"])
+    assert rules.match("debug.log", False) is True
+    assert rules.match("keep.log", False) is False
+
+def test_directory_only_and_double_star():
+    rules = GitIgnoreRules(["out/", "**/cache/**", "a/**/z"])
+    assert rules.match("out", True) is True
+    assert rules.match("out", False) is None
+    assert rules.match("x/cache/y/z.txt", False) is True
+    assert rules.match("a/z", False) is True
+    assert rules.match("a/b/c/z", False) is True
+
+def test_nested_gitignore_and_parent_exclusion(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.tmp\nvendor/\n")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / ".gitignore").write_text("!important.tmp\n/local\n")
+    matcher = GitIgnoreMatcher(str(tmp_path))
+    assert matcher.is_ignored("a.tmp", False)
+    assert not matcher.is_ignored("pkg/important.tmp", False)
+    assert matcher.is_ignored("pkg/local", True)
+    assert not matcher.is_ignored("local", True)
+    assert matcher.is_ignored("vendor/lib/important.tmp", False)
+    assert matcher.is_ignored("web/node_modules/react/index.js", False)
+
+def test_stale_when_gitignore_changes(tmp_path):
+    gitignore = tmp_path / ".gitignore"
+    gitignore.write_text("*.log\n")
+    matcher = GitIgnoreMatcher(str(tmp_path))
+    assert matcher.is_ignored("x.log", False)
+    assert not matcher.is_stale()
+    gitignore.write_text("*.txt\n")
+    os.utime(gitignore, (0, 0))
+    assert matcher.is_stale()
+
+def test_should_ignore_compat():
+    assert should_ignore("node_modules", [])
+    assert should_ignore(".next", [".next/"])
+    assert not should_ignore("src", ["*.log"])
+
+def test_brackets_right_after_open_are_literal():
+    # [ の直後の ] は文字クラスの要素、閉じていない [ はそのままの文字
+    rules = GitIgnoreRules(["a[]b", "[]]x", "[!]]y", "z["])
+    assert rules.match("a[]b", False) is True
+    assert rules.match("]x", False) is True
+    assert rules.match("ax", False) is None
+    assert rules.match("ay", False) is True
+    assert rules.match("]y", False) is None
+    assert rules.match("z[", False) is True
+
+def test_stale_when_gitignore_created(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    matcher = get_gitignore_matcher(str(tmp_path))
+    assert not matcher.is_ignored("a.log", False)
+    assert not matcher.is_ignored("pkg/b.log", False)
+    assert not matcher.is_stale()
+    # 読み込んだ時点で.gitignoreがなかったディレクトリに作られた場合も作り直す
+    (tmp_path / "pkg" / ".gitignore").write_text("*.log\n")
+    assert matcher.is_stale()
+    assert get_gitignore_matcher(str(tmp_path)).is_ignored("pkg/b.log", False)
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    assert get_gitignore_matcher(str(tmp_path)).is_ignored("a.log", False)
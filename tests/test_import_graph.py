@@ -0,0 +1,100 @@
+# インポートグラフのテスト
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from api import dependencies
+from utils.file_utils import BABEL_ROOT, project_root
+from services.import_graph import ImportGraph, format_dependencies, parse_python_imports, parse_script_imports
+
+def _write(root, rel_path, content):
+    path = os.path.join(root, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+def test_parse_python_imports():
+    specs = dict(parse_python_imports("pkg/sub/mod.py", "import os.path\nfrom . import x\nfrom ..util import helper\n"))
+    assert specs["os.path"] == ("os/path", "pkg/sub/os/path")
+    assert specs["."] == ("pkg/sub/x", "pkg/sub")
+    assert specs["..util"] == ("pkg/util/helper", "pkg/util")
+
+def test_parse_script_imports():
+    source = (
+        'import React from "react";\n'
+        "import type { Props } from './types'\n"
+        "export * from '../lib/api'\n"
+        "const debounce = require('lodash.debounce')\n"
+        "// import Ignored from './ignored'\n"
+        "import {\n  a,\n  b,\n} from '@/components/Button'\n"
+    )
+    specs = dict(parse_script_imports("src/app/page.tsx", source, alias_root="src"))
+    assert specs == {
+        "react": (),
+        "./types": ("src/app/types",),
+        "../lib/api": ("src/lib/api",),
+        "lodash.debounce": (),
+        "@/components/Button": ("src/components/Button",),
+    }
+
+def test_graph_edges_and_incremental_updates(tmp_path):
+    root = str(tmp_path)
+    _write(root, "tsconfig.json", '{\n  // コメント\n  "compilerOptions": {"baseUrl": ".", "paths": {"@/*": ["./src/*"]},},\n}\n')
+    _write(root, "src/app/page.tsx", "import Button from '@/components/Button'\nimport './page.css'\nimport React from 'react'\n")
+    _write(root, "src/components/Button.tsx", "import { cn } from '../lib/utils'\n")
+    _write(root, "src/components/index.ts", "export * from './Button'\n")
+    _write(root, "src/lib/utils.ts", "export const cn = () => ''\n")
+    _write(root, "node_modules/react/index.js", "module.exports = {}\n")
+    _write(root, "backend/app.py", "from backend import models\nimport requests\n")
+    _write(root, "backend/__init__.py", "")
+    models_path = _write(root, "backend/models.py", "")
+
+    graph = ImportGraph(root)
+    graph.seed()
+    page = graph.file("src/app/page.tsx")
+    assert page["imports"] == ["src/components/Button.tsx"]
+    assert page["external"] == ["react"]
+    assert page["assets"] == ["src/app/page.css"]
+    assert graph.file("src/lib/utils.ts")["imported_by"] == ["src/components/Button.tsx"]
+    assert graph.file("backend/app.py")["imports"] == ["backend/models.py"]
+    assert graph.file("backend/app.py")["external"] == ["requests"]
+    assert "node_modules/react/index.js" not in {node["path"] for node in graph.graph()["nodes"]}
+    assert graph.file("src/app/page.tsx", depth=3)["transitive_imports"] == ["src/components/Button.tsx", "src/lib/utils.ts"]
+
+    scores = graph.centrality(["src/lib/utils.ts", "src/app/page.tsx"])
+    assert scores == {"src/lib/utils.ts": 2.0, "src/app/page.tsx": 1.0}
+
+    # 変更されたファイルだけを解析し直す
+    page_path = os.path.join(root, "src/app/page.tsx")
+    _write(root, "src/app/page.tsx", "import { cn } from '@/lib/utils'\n")
+    os.utime(page_path, ns=(1, 1))
+    graph.update(page_path)
+    assert graph.file("src/app/page.tsx")["imports"] == ["src/lib/utils.ts"]
+    assert graph.file("src/components/Button.tsx")["imported_by"] == ["src/components/index.ts"]
+
+    # サブモジュールが削除されると、from backend import models はパッケージ自体への依存になる
+    os.remove(models_path)
+    graph.remove(models_path)
+    assert graph.file("backend/app.py")["imports"] == ["backend/__init__.py"]
+    assert "backend/models.py" not in {node["path"] for node in graph.graph()["nodes"]}
+
+def test_format_dependencies():
+    text = format_dependencies([{
+        "path": "a.ts", "imports": ["b.ts"], "imported_by": [], "external": ["react"], "unresolved": ["./c"],
+    }])
+    assert text == "- a.ts → b.ts （外部: react） （解決できないimport: ./c）"
+
+def test_api_rejects_invalid_project_ids(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    os.makedirs(tmp_path / "babel_generated")
+    app = FastAPI()
+    app.include_router(dependencies.router)
+    client = TestClient(app)
+    assert client.get("/api/dependencies/missing").status_code == 404
+    assert client.get("/api/dependencies/a..b").status_code == 400
+    with pytest.raises(ValueError):
+        project_root("..")
+    with pytest.raises(ValueError):
+        project_root("../other")
+    assert project_root("babel") == BABEL_ROOT
@@ -0,0 +1,44 @@
+# 行オフセットインデックスと行編集のテスト
+import os
+import pytest
+from utils.line_index import apply_line_edits, get_line_index
+
+def _write(tmp_path, data: bytes):
+    path = tmp_path / "sample.txt"
+    path.write_bytes(data)
+    return str(path)
+
+def test_line_index_offsets(tmp_path):
+    path = _write(tmp_path, b"one\ntwo\nthree\n")
+    index = get_line_index(path)
+    assert index.line_count == 3
+    assert list(index.offsets) == [0, 4, 8]
+    assert index.ends_with_newline
+
+def test_multiple_edits_preserve_trailing_newline(tmp_path):
+    path = _write(tmp_path, b"a\nb\nc\nd\n")
+    apply_line_edits(path, [(4, 4, ["D"]), (1, 2, ["X"]), (3, 2, ["inserted"])])
+    assert open(path, "rb").read() == b"X\ninserted\nc\nD\n"
+
+def test_edit_without_trailing_newline_and_append(tmp_path):
+    path = _write(tmp_path, b"a\r\nb")
+    apply_line_edits(path, [(2, 2, ["B"])])
+    assert open(path, "rb").read() == b"a\r\nB"
+    apply_line_edits(path, [(3, 2, ["c"])])
+    assert open(path, "rb").read() == b"a\r\nB\r\nc"
+
+def test_delete_and_cache_invalidation(tmp_path):
+    path = _write(tmp_path, b"a\nb\nc\n")
+    assert get_line_index(path).line_count == 3
+    apply_line_edits(path, [(2, 2, [])])
+    assert open(path, "rb").read() == b"a\nc\n"
+    assert get_line_index(path).line_count == 2
+
+def test_invalid_and_overlapping_ranges(tmp_path):
+    path = _write(tmp_path, b"a\nb\n")
+    with pytest.raises(ValueError):
+        apply_line_edits(path, [(5, 5, ["x"])])
+    with pytest.raises(ValueError):
+        apply_line_edits(path, [(1, 2, ["x"]), (2, 2, ["y"])])
+    assert open(path, "rb").read() == b"a\nb\n"
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".part")] == []
@@ -0,0 +1,146 @@
+# LLMの生成結果キャッシュのテスト
+import asyncio
+import inspect
+import os
+import time
+import pytest
+
+# 各プロバイダのクライアントはimport時に作られるため、ダミーのAPIキーを設定しておく
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from models.ai_request import AIProcessRequest, AIUpdateRequest, MultiAIProcessRequest
+from services import anthropic_service, llm_cache as llm_cache_module
+from services.ai_service import ai_process, multi_ai_process
+from services.llm_cache import LLMResponseCache, cached_generation
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"), max_entries=3, ttl=60, memory_entries=2)
+    monkeypatch.setattr(llm_cache_module, "llm_cache", cache)
+    monkeypatch.setattr(llm_cache_module, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(anthropic_service, "llm_cache", cache)
+    monkeypatch.setattr(anthropic_service, "LLM_CACHE_ENABLED", True)
+    return cache
+
+def _generator(calls):
+    async def generate():
+        calls.append(1)
+        return {"generated_text": f"result {len(calls)}"}
+    return generate
+
+def test_hit_and_miss(cache):
+    calls = []
+
+    async def run():
+        first = await cached_generation("p", "m", {}, "hello", _generator(calls))
+        second = await cached_generation("p", "m", {}, "hello", _generator(calls))
+        other = await cached_generation("p", "m", {"temperature": 0}, "hello", _generator(calls))
+        return first, second, other
+
+    first, second, other = asyncio.run(run())
+    assert first == second == {"generated_text": "result 1"}
+    # パラメータが違えば別のキーになる
+    assert other == {"generated_text": "result 2"}
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_ttl_expiry(cache, clock):
+    cache.set("key", {"generated_text": "old"})
+    clock[0] += 59
+    assert cache.get("key") == {"generated_text": "old"}
+    clock[0] += 2
+    assert cache.get("key") is None
+    # メモリから消えた後もSQLite側のTTLで判定される
+    cache._memory.clear()
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+def test_lru_eviction(cache, clock):
+    for key in ("a", "b", "c"):
+        clock[0] += 1
+        cache.set(key, key)
+    # メモリは直近2件だけを保持する
+    assert list(cache._memory) == ["b", "c"]
+    clock[0] += 1
+    assert cache.get("a") == "a"
+    clock[0] += 1
+    cache.set("d", "d")
+    # SQLiteは最近使われていない "b" から削除する
+    assert cache.stats()["entries"] == 3
+    cache._memory.clear()
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["a", "c", "d"]
+
+def test_disabled_cache_bypasses(cache, monkeypatch):
+    monkeypatch.setattr(llm_cache_module, "LLM_CACHE_ENABLED", False)
+    calls = []
+
+    async def run():
+        await cached_generation("p", "m", {}, "hello", _generator(calls))
+        await cached_generation("p", "m", {}, "hello", _generator(calls))
+        # use_cache=False も同じく参照も保存もしない
+        await cached_generation("p", "m", {}, "hello", _generator(calls), use_cache=False)
+
+    asyncio.run(run())
+    assert len(calls) == 3
+    assert cache.bypasses == 3
+    assert cache.stats()["entries"] == 0
+
+class _FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+class _FakeMessages:
+    def __init__(self):
+        self.calls = 0
+
+    def stream(self, **params):
+        self.calls += 1
+        return _FakeStream(["He", "llo"])
+
+class _FakeClient:
+    def __init__(self):
+        self.messages = _FakeMessages()
+
+def test_streaming_path(cache, monkeypatch):
+    client = _FakeClient()
+    monkeypatch.setattr(anthropic_service, "anthropic_client", client)
+
+    async def collect(**kwargs):
+        return [chunk async for chunk in anthropic_service.stream_text_anthropic("hi", **kwargs)]
+
+    assert asyncio.run(collect()) == ["He", "llo"]
+    # キャッシュにヒットした場合は全文を1つの差分として返す
+    assert asyncio.run(collect()) == ["Hello"]
+    assert client.messages.calls == 1
+    assert asyncio.run(collect(use_cache=False)) == ["He", "llo"]
+    assert client.messages.calls == 2
+    monkeypatch.setattr(anthropic_service, "LLM_CACHE_ENABLED", False)
+    assert asyncio.run(collect()) == ["He", "llo"]
+    assert client.messages.calls == 3
+
+def test_code_execution_skips_cache_by_default():
+    # 生成したコードを実行する処理は、既定ではキャッシュを使わない
+    assert inspect.signature(ai_process).parameters["use_cache"].default is False
+    assert inspect.signature(multi_ai_process).parameters["use_cache"].default is False
+    assert AIProcessRequest(project_id="p", file_path="a.py", feature_request="x").use_cache is False
+    assert MultiAIProcessRequest(project_id="p", file_paths=["a.py"], feature_request="x").use_cache is False
+    assert AIUpdateRequest(project_id="p", file_path="a.py", feature_request="x").use_cache is True
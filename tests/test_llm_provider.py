@@ -0,0 +1,108 @@
+# LLMルーターのプロバイダ選択・フェイルオーバー・ヘッジのテスト
+import asyncio
+import os
+import pytest
+
+# 各プロバイダのクライアントはimport時に作られるため、ダミーのAPIキーを設定しておく
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from services import llm_provider
+from services.llm_cache import LLMResponseCache
+from services.llm_provider import LLMProvider, LLMRouter, LLMRouterError, percentile
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    # テストごとに空のキャッシュを使う
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"), max_entries=100, ttl=60, memory_entries=10)
+    monkeypatch.setattr(llm_provider, "llm_cache", cache)
+    monkeypatch.setattr(llm_provider, "LLM_CACHE_ENABLED", True)
+    return cache
+
+class FakeProvider(LLMProvider):
+    def __init__(self, name, price=(1.0, 1.0), delay=0.0, error=None):
+        super().__init__()
+        self.name = name
+        self.model = f"{name}-model"
+        self.price = price
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def stream(self, prompt, use_cache=True):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        yield f"{self.name}:"
+        yield prompt
+
+def test_percentile():
+    assert percentile([], 95) is None
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 95) == 95
+
+def test_rank_by_policy():
+    cheap = FakeProvider("cheap", price=(1, 1))
+    fast = FakeProvider("fast", price=(10, 10))
+    router = LLMRouter([fast, cheap], policy="cheapest")
+    assert [p.name for p in router.rank("x")] == ["cheap", "fast"]
+    fast.record_success(0.1, 0.05)
+    cheap.record_success(2.0, 1.0)
+    assert [p.name for p in router.rank("x", policy="p95_latency")] == ["fast", "cheap"]
+    assert [p.name for p in router.rank("x", policy="first_token")] == ["fast", "cheap"]
+    # 直近で失敗したプロバイダは後ろに回す
+    fast.record_failure()
+    assert [p.name for p in router.rank("x", policy="p95_latency")] == ["cheap", "fast"]
+
+def test_failover_to_next_provider():
+    broken = FakeProvider("broken", price=(1, 1), error=RuntimeError("down"))
+    backup = FakeProvider("backup", price=(2, 2))
+    router = LLMRouter([broken, backup], policy="cheapest")
+    result = asyncio.run(router.generate("hi"))
+    assert result["generated_text"] == "backup:hi"
+    assert result["provider"] == "backup"
+    assert [attempt["provider"] for attempt in result["attempts"]] == ["broken", "backup"]
+    assert broken.failures == 1
+
+def test_all_providers_fail():
+    router = LLMRouter([FakeProvider("a", error=RuntimeError("x")), FakeProvider("b", error=RuntimeError("y"))])
+    try:
+        asyncio.run(router.generate("hi"))
+    except LLMRouterError as e:
+        assert "a: RuntimeError: x" in str(e) and "b: RuntimeError: y" in str(e)
+    else:
+        raise AssertionError("LLMRouterError was not raised")
+
+def test_hedge_uses_faster_provider():
+    slow = FakeProvider("slow", price=(1, 1), delay=1.0)
+    fast = FakeProvider("fast", price=(2, 2), delay=0.01)
+    router = LLMRouter([slow, fast], policy="cheapest")
+    result = asyncio.run(router.generate("hi", hedge_after=0.05))
+    assert result["provider"] == "fast"
+    assert slow.calls == 1 and fast.calls == 1
+    # 取り消されたリクエストは失敗として記録しない
+    assert slow.failures == 0
+
+def test_timeout_triggers_failover():
+    slow = FakeProvider("slow", price=(1, 1), delay=1.0)
+    fast = FakeProvider("fast", price=(2, 2))
+    router = LLMRouter([slow, fast], policy="cheapest", timeout=0.05)
+    result = asyncio.run(router.generate("hi"))
+    assert result["provider"] == "fast"
+    assert slow.failures == 1
+
+def test_cache_hits_do_not_record_latency(cache):
+    provider = FakeProvider("only", delay=0.01)
+    router = LLMRouter([provider])
+    first = asyncio.run(router.generate("hi"))
+    second = asyncio.run(router.generate("hi"))
+    assert first["cached"] is False and second["cached"] is True
+    assert second["generated_text"] == first["generated_text"] == "only:hi"
+    # キャッシュの応答はプロバイダを呼び出さず、レイテンシの統計にも入れない
+    assert provider.calls == 1
+    assert len(provider.latencies) == 1 and provider.successes == 1
+
+    third = asyncio.run(router.generate("hi", use_cache=False))
+    assert third["cached"] is False
+    assert provider.calls == 2 and len(provider.latencies) == 2
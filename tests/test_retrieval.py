@@ -0,0 +1,63 @@
+# 関連コードの検索のテスト
+import os
+import services.import_graph as import_graph
+import services.retrieval as retrieval
+from services.retrieval import RetrievalIndex, features, split_chunks, vectorize
+
+def _write(root, rel_path, content):
+    path = os.path.join(root, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+def _project(root):
+    _write(root, "src/auth/login.ts", "export async function loginUser(email, password) {\n  return api.post('/login', { email, password })\n}\n")
+    _write(root, "src/cart/cart.ts", "export function addToCart(item) {\n  cart.items.push(item)\n}\n")
+    _write(root, "src/ui/Header.tsx", "// ヘッダーにログインボタンを表示する\nexport const Header = () => <LoginButton />\n")
+    _write(root, "package-lock.json", '{"name": "login", "lockfileVersion": 3}\n')
+    _write(root, "node_modules/auth/index.js", "function loginUser() {}\n")
+
+def test_features_split_identifiers():
+    found = set(features("loginUser user_email ログイン"))
+    assert {"w:loginuser", "w:login", "w:user", "w:user_email", "w:email", "g:log", "g:ログ", "g:グイ"} <= found
+    assert vectorize("a b a") == vectorize("a b a")
+
+def test_split_chunks():
+    chunks = split_chunks("a.py", "\n".join(str(i) for i in range(1, 6)) + "\n\n\n", lines_per_chunk=3)
+    assert [(chunk.start_line, chunk.end_line) for chunk in chunks] == [(1, 3), (4, 6)]
+
+def test_search_ranks_relevant_chunks(tmp_path):
+    root = str(tmp_path)
+    _project(root)
+    index = RetrievalIndex(root)
+    index.seed()
+    hits = index.search("ログイン処理でパスワードを検証する loginUser password", k=2)
+    assert hits[0]["path"] == "src/auth/login.ts"
+    assert {hit["path"] for hit in index.search("login", k=10)} <= {"src/auth/login.ts", "src/ui/Header.tsx"}
+    assert index.search("login", exclude=["src/auth/login.ts"])[0]["path"] == "src/ui/Header.tsx"
+    assert [hit["path"] for hit in index.search("item", prefix="src/cart")] == ["src/cart/cart.ts"]
+
+    # 変更・削除されたファイルだけを作り直す
+    path = _write(root, "src/cart/cart.ts", "export function checkout(order) {}\n")
+    os.utime(path, ns=(1, 1))
+    index.update(path)
+    assert all("addToCart" not in hit["text"] for hit in index.search("addToCart"))
+    assert index.search("checkout")[0]["path"] == "src/cart/cart.ts"
+    index.remove(os.path.join(root, "src", "auth"))
+    assert all(hit["path"] != "src/auth/login.ts" for hit in index.search("loginUser password"))
+
+def test_related_context_fits_budget(tmp_path, monkeypatch):
+    generated = tmp_path / "generated"
+    root = str(generated / "shop")
+    _project(root)
+    index = RetrievalIndex(root)
+    index.seed()
+    monkeypatch.setattr(import_graph, "GENERATED_ROOT", str(generated))
+    monkeypatch.setattr(retrieval, "get_retrieval_index", lambda _: index)
+
+    text, chunks = retrieval.related_context(os.path.join(root, "src/ui/Header.tsx"), "loginUser の呼び出し", budget=1000)
+    assert [chunk["path"] for chunk in chunks] == ["src/auth/login.ts"]
+    assert "### src/auth/login.ts（1〜4行目）" in text
+    assert retrieval.related_context(os.path.join(root, "src"), "loginUser", budget=5) == ("", [])
+    assert retrieval.related_context(str(tmp_path / "elsewhere.ts"), "loginUser") == ("", [])
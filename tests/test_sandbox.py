@@ -0,0 +1,96 @@
+# サンドボックス実行（ワーカープール）のテスト
+import asyncio
+import json
+import os
+import pytest
+
+# 各プロバイダのクライアントはimport時に作られるため、ダミーのAPIキーを設定しておく
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import api.routes as routes
+import services.code_execution as code_execution
+from services.code_execution import SandboxPool
+
+pytestmark = pytest.mark.skipif(not SandboxPool().supported, reason="ワーカーは fork を使えるPOSIX環境でのみ動く")
+
+def _run(test):
+    # プールはイベントループに紐づくため、1つのテストを1つのループで実行して最後に閉じる
+    async def run():
+        pool = SandboxPool(size=1)
+        try:
+            return await test(pool)
+        finally:
+            await pool.close()
+    return asyncio.run(run())
+
+def test_run_and_reuse_worker():
+    async def test(pool):
+        first = await pool.run("import os; print(os.getppid())")
+        second = await pool.run("import os, sys; print(os.getppid()); sys.exit(3)")
+        return first, second
+
+    first, second = _run(test)
+    assert first["returncode"] == 0 and not first["timed_out"]
+    assert second["returncode"] == 3
+    # 同じワーカーから fork されている
+    assert first["stdout"] == second["stdout"]
+
+def test_timeout_kills_child():
+    async def test(pool):
+        return await pool.run("import time\nprint('start', flush=True)\ntime.sleep(30)", wall_timeout=0.5)
+
+    result = _run(test)
+    assert result["timed_out"] is True
+    assert result["returncode"] == -9
+    assert result["stdout"] == "start\n"
+
+def test_memory_limit_raises_memory_error(monkeypatch):
+    monkeypatch.setattr(code_execution, "SANDBOX_MEMORY_MB", 256)
+
+    async def test(pool):
+        return await pool.run("data = bytearray(1024 * 1024 * 1024)\nprint('allocated')")
+
+    result = _run(test)
+    assert result["returncode"] == 1
+    assert "MemoryError" in result["stderr"]
+    assert "allocated" not in result["stdout"]
+
+def test_output_truncated(monkeypatch):
+    monkeypatch.setattr(code_execution, "SANDBOX_MAX_OUTPUT", 100)
+
+    async def test(pool):
+        return await pool.run("for _ in range(100):\n    print('x' * 99)")
+
+    result = _run(test)
+    assert result["truncated"] is True
+    assert len(result["stdout"]) == 100
+    assert result["returncode"] == 0
+
+def test_worker_replaced_after_crash():
+    async def test(pool):
+        with pytest.raises(RuntimeError):
+            # ワーカー自身を終了させる
+            await pool.run("import os, signal; os.kill(os.getppid(), signal.SIGKILL)")
+        return await pool.run("print('ok')")
+
+    result = _run(test)
+    assert result == {"stdout": "ok\n", "stderr": "", "returncode": 0, "timed_out": False, "truncated": False}
+
+def test_execute_stream_ndjson(monkeypatch):
+    pool = SandboxPool(size=1)
+    monkeypatch.setattr(routes, "sandbox_pool", pool)
+    app = FastAPI()
+    app.include_router(routes.router)
+    with TestClient(app) as client:
+        try:
+            response = client.post("/api/files/execute/stream", json={"code": "import sys\nprint('out')\nprint('err', file=sys.stderr)\nsys.exit(2)"})
+        finally:
+            client.portal.call(pool.close)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert {"type": "stdout", "data": "out\n"} in events
+    assert {"type": "stderr", "data": "err\n"} in events
+    assert events[-1] == {"type": "exit", "returncode": 2, "timed_out": False, "truncated": False}
@@ -0,0 +1,83 @@
+# ファイルごとの処理のスケジューリングとレート制限のテスト
+import asyncio
+import pytest
+import services.scheduler as scheduler
+from services.llm_limits import TokenBucket
+from services.scheduler import run_bounded, run_file_tasks
+
+@pytest.fixture(autouse=True)
+def unlimited_rate(monkeypatch):
+    # レート制限で待たないよう、制限なしのバケットを使う
+    monkeypatch.setattr(scheduler, "provider_rate_limiter", lambda provider: TokenBucket(0, 1))
+
+class Worker:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.running = 0
+        self.peak = 0
+        self.finished = []
+
+    async def __call__(self, file_path):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            if file_path in self.fail:
+                raise RuntimeError(f"{file_path}で失敗")
+            self.finished.append(file_path)
+            return file_path.upper()
+        finally:
+            self.running -= 1
+
+def test_token_bucket_zero_rpm_is_unlimited():
+    bucket = TokenBucket(0, 1)
+
+    async def run():
+        for _ in range(100):
+            await bucket.acquire()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=1))
+
+def test_run_bounded_caps_in_flight():
+    worker = Worker()
+    paths = [f"f{i}.py" for i in range(10)]
+    results = asyncio.run(run_bounded(paths, worker, max_in_flight=3))
+    assert worker.peak == 3
+    assert results == [{"file_path": path, "status": "success", "result": path.upper()} for path in paths]
+
+def test_run_bounded_isolates_errors():
+    worker = Worker(fail={"b.py"})
+    results = asyncio.run(run_bounded(["a.py", "b.py", "c.py"], worker, max_in_flight=2))
+    assert results == [
+        {"file_path": "a.py", "status": "success", "result": "A.PY"},
+        {"file_path": "b.py", "status": "error", "error": "b.pyで失敗"},
+        {"file_path": "c.py", "status": "success", "result": "C.PY"},
+    ]
+    assert sorted(worker.finished) == ["a.py", "c.py"]
+
+def test_run_bounded_generic_items(monkeypatch):
+    def limiter(provider):
+        raise AssertionError("provider=None ではレート制限を使わない")
+    monkeypatch.setattr(scheduler, "provider_rate_limiter", limiter)
+
+    async def double(index):
+        return index * 2
+
+    results = asyncio.run(run_bounded(range(3), double, max_in_flight=2, provider=None, key="group"))
+    assert results == [{"group": i, "status": "success", "result": i * 2} for i in range(3)]
+
+def test_run_file_tasks_modes():
+    paths = ["a.py", "b.py", "c.py"]
+
+    bounded = Worker(fail={"a.py"})
+    results = asyncio.run(run_file_tasks(paths, bounded, "bounded", max_in_flight=1))
+    assert bounded.peak == 1
+    assert [result["status"] for result in results] == ["error", "success", "success"]
+
+    parallel = Worker()
+    assert asyncio.run(run_file_tasks(paths, parallel, "parallel")) == ["A.PY", "B.PY", "C.PY"]
+    assert parallel.peak == 3
+
+    sequential = Worker()
+    assert asyncio.run(run_file_tasks(paths, sequential, "sequential")) == ["A.PY", "B.PY", "C.PY"]
+    assert sequential.peak == 1
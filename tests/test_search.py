@@ -0,0 +1,82 @@
+# 全文検索インデックスのテスト
+import os
+import re
+import pytest
+from services.search_service import SearchIndex, find_matches, required_literals
+
+def _write(root, rel_path, content):
+    path = os.path.join(root, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+@pytest.fixture
+def index(tmp_path):
+    generated = tmp_path / "generated"
+    _write(str(generated), "shop/src/cart.ts", "export function addToCart(item) {\n  return cartTotal(item)\n}\n")
+    _write(str(generated), "shop/src/total.ts", "export const cartTotal = (item) => item.price\n")
+    _write(str(generated), "shop/node_modules/lib/index.js", "function addToCart() {}\n")
+    _write(str(generated), "shop/.gitignore", "secret.txt\n")
+    _write(str(generated), "shop/secret.txt", "addToCart\n")
+    _write(str(generated), "blog/app.py", "def add_post():\n    pass\n")
+    _write(str(generated), ".cache/ignored.txt", "addToCart\n")
+    index = SearchIndex(str(tmp_path / "index.sqlite3"), generated_root=str(generated))
+    index.sync()
+    return index
+
+def test_required_literals():
+    assert required_literals(r"def\s+add_\w+") == ["def", "add_"]
+    assert required_literals(r"(foo|bar)baz") == ["baz"]
+    assert required_literals(r"(?:import )+x?") == ["import "]
+
+def test_find_matches_groups_by_line():
+    body = "a foo foo\nbar\nfoo\n"
+    matches, count = find_matches(body, re.compile("foo"), max_matches=1)
+    assert count == 3
+    assert matches == [{"line": 1, "text": "a foo foo", "ranges": [[2, 5], [6, 9]]}]
+    matches, _ = find_matches(body, re.compile("foo"), max_matches=5)
+    assert [match["line"] for match in matches] == [1, 3]
+
+def test_search_plain_and_filters(index):
+    result = index.search("addtocart")
+    assert result["strategy"] == "index"
+    assert [(r["project"], r["path"]) for r in result["results"]] == [("shop", "src/cart.ts")]
+    assert result["results"][0]["matches"][0] == {"line": 1, "text": "export function addToCart(item) {", "ranges": [[16, 25]]}
+
+    assert index.search("addtocart", case_sensitive=True)["results"] == []
+    both = index.search("cartTotal")
+    assert sorted(r["path"] for r in both["results"]) == ["src/cart.ts", "src/total.ts"]
+    assert [r["path"] for r in index.search("cartTotal", paths=["src/t*"])["results"]] == ["src/total.ts"]
+    assert [r["path"] for r in index.search("cartTotal", exclude=["*total*"])["results"]] == ["src/cart.ts"]
+    assert index.search("cartTotal", project="blog")["results"] == []
+    # trigram の索引が使えない短い文字列
+    short = index.search("=>")
+    assert short["strategy"] == "scan"
+    assert [r["path"] for r in short["results"]] == ["src/total.ts"]
+
+def test_search_regex(index):
+    result = index.search(r"def\s+add_\w+", regex=True)
+    assert [r["path"] for r in result["results"]] == ["app.py"]
+    scan = index.search(r"^\s+\w+ \w+\(", regex=True)
+    assert scan["strategy"] == "scan"
+    assert [r["path"] for r in scan["results"]] == ["src/cart.ts"]
+    with pytest.raises(ValueError):
+        index.search("(unclosed", regex=True)
+
+def test_incremental_updates(index, tmp_path):
+    root = str(tmp_path / "generated")
+    path = _write(root, "shop/src/total.ts", "export const grandTotal = 0\n")
+    os.utime(path, ns=(1, 1))
+    index.update(path)
+    assert [r["path"] for r in index.search("cartTotal")["results"]] == ["src/cart.ts"]
+    assert [r["path"] for r in index.search("grandTotal")["results"]] == ["src/total.ts"]
+
+    new_dir = os.path.join(root, "shop", "lib")
+    _write(root, "shop/lib/util.ts", "export const grandTotal2 = 1\n")
+    index.update(new_dir, is_dir=True)
+    assert sorted(r["path"] for r in index.search("grandTotal")["results"]) == ["lib/util.ts", "src/total.ts"]
+
+    index.remove(os.path.join(root, "shop", "src"))
+    assert [r["path"] for r in index.search("grandTotal")["results"]] == ["lib/util.ts"]
+    assert index.stats()["projects"]["shop"]["files"] == 2
@@ -0,0 +1,75 @@
+# ディレクトリのツリー表示のテスト
+import os
+from utils.tree import render_tree
+
+def _write(root, rel_path, content=""):
+    path = os.path.join(root, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+def test_render_tree_styles(tmp_path):
+    root = str(tmp_path)
+    _write(root, "src/app.py")
+    _write(root, "src/lib/util.py")
+    _write(root, "README.md")
+    assert render_tree(root) == "\n".join([
+        "├── README.md",
+        "└── src",
+        "    ├── app.py",
+        "    └── lib",
+        "        └── util.py",
+    ])
+    assert render_tree(root, style="icons") == "\n".join([
+        "📄 README.md",
+        "📁 src/",
+        "    📄 app.py",
+        "    📁 lib/",
+        "        📄 util.py",
+    ])
+
+def test_render_tree_collapses_ignored_and_deep_dirs(tmp_path):
+    root = str(tmp_path)
+    for i in range(3):
+        _write(root, f"node_modules/pkg{i}/index.js")
+    _write(root, ".gitignore", "*.log\nout/\n")
+    _write(root, "debug.log")
+    _write(root, "out/bundle.js")
+    _write(root, "a/b/c/deep.py")
+    assert render_tree(root, style="icons", max_depth=2) == "\n".join([
+        "📄 .gitignore",
+        "📁 a/",
+        "    📁 b/ （+1ファイル）",
+        "📁 node_modules/ （+3ファイル）",
+        "📁 out/ （+1ファイル）",
+    ])
+    assert "📁 node_modules/ （+2ファイル以上）" in render_tree(root, style="icons", count_limit=2)
+
+def test_render_tree_caps_entries(tmp_path):
+    root = str(tmp_path)
+    for i in range(5):
+        _write(root, f"dir/f{i}.txt")
+    assert render_tree(root, max_children=2) == "\n".join([
+        "└── dir",
+        "    ├── f0.txt",
+        "    ├── f1.txt",
+        "    └── … 他3件",
+    ])
+    assert render_tree(root, max_entries=2).splitlines()[-1] == "…（表示の上限 2 行に達したため以降を省略）"
+
+def test_render_tree_cache_invalidated_by_mtime(tmp_path):
+    root = str(tmp_path)
+    _write(root, "a.txt")
+    assert render_tree(root) == "└── a.txt"
+    _write(root, "b.txt")
+    os.utime(root, ns=(1, 1))
+    assert render_tree(root) == "├── a.txt\n└── b.txt"
+    # .gitignore の変更はフォルダの mtime が変わらなくても反映する
+    path = _write(root, ".gitignore", "")
+    assert "b.txt" in render_tree(root)
+    stat = os.stat(root)
+    _write(root, ".gitignore", "b.txt\n")
+    os.utime(path, ns=(10 ** 9, 10 ** 9))
+    os.utime(root, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert "b.txt" not in render_tree(root)
@@ -0,0 +1,72 @@
+# ファイル変更のバージョン管理（コミットのまとめ方）のテスト
+import asyncio
+import pytest
+from git import Repo
+import utils.version_control as version_control_module
+from utils.version_control import commit_batch, version_control
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = Repo.init(tmp_path / "project")
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "babel")
+        config.set_value("user", "email", "babel@example.com")
+    (tmp_path / "project" / "README.md").write_text("readme\n")
+    repo.index.add(["README.md"])
+    repo.index.commit("initial")
+    return repo
+
+def _write(repo, name, content):
+    path = f"{repo.working_tree_dir}/{name}"
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+def _commits(repo):
+    return list(repo.iter_commits())
+
+def test_commit_batch_makes_one_commit(repo, tmp_path):
+    outside = tmp_path / "outside.txt"
+    outside.write_text("x\n")
+
+    async def run():
+        async with commit_batch():
+            await asyncio.gather(
+                version_control(_write(repo, "a.py", "a\n"), "write"),
+                version_control(_write(repo, "b.py", "b\n"), "update"),
+                version_control(str(outside), "write"),
+            )
+
+    asyncio.run(run())
+    commits = _commits(repo)
+    assert len(commits) == 2
+    assert commits[0].summary == "AI write, update on 2 files"
+    assert sorted(commits[0].stats.files) == ["a.py", "b.py"]
+    assert not repo.is_dirty(untracked_files=True)
+
+def test_writes_within_window_coalesce(repo, monkeypatch):
+    monkeypatch.setattr(version_control_module, "VERSION_CONTROL_BATCH_WINDOW", 0.1)
+
+    async def run():
+        await asyncio.gather(
+            version_control(_write(repo, "a.py", "a\n"), "write"),
+            version_control(_write(repo, "b.py", "b\n"), "write"),
+        )
+        # 前のウィンドウのコミットが終わった後の変更は別のコミットになる
+        await version_control(_write(repo, "a.py", "a2\n"), "update")
+
+    asyncio.run(run())
+    commits = _commits(repo)
+    assert [commit.summary for commit in commits] == [
+        f"AI update on {repo.working_tree_dir}/a.py", "AI write on 2 files", "initial"
+    ]
+    assert list(commits[0].stats.files) == ["a.py"]
+    assert sorted(commits[1].stats.files) == ["a.py", "b.py"]
+
+def test_files_outside_repo_are_skipped(repo, tmp_path, monkeypatch):
+    monkeypatch.setattr(version_control_module, "VERSION_CONTROL_BATCH_WINDOW", 0.01)
+    outside = tmp_path / "outside.txt"
+    outside.write_text("x\n")
+
+    asyncio.run(version_control(str(outside), "write"))
+    assert len(_commits(repo)) == 1
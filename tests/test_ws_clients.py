@@ -0,0 +1,104 @@
+# WebSocket接続ごとの送信キューと購読のテスト
+import asyncio
+from utils.ws_clients import ConnectionManager
+from utils.file_changes import merge_change_messages
+
+class FakeWebSocket:
+    client = "fake"
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.sent = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+
+def test_subscriptions_filter_broadcasts():
+    async def run():
+        manager = ConnectionManager(max_queue=10, send_timeout=1)
+        all_ws, app_ws = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(all_ws)
+        app_connection = await manager.connect(app_ws)
+        manager.handle_message(app_connection, '{"action": "subscribe", "projects": ["app"], "paths": ["src"]}')
+        manager.broadcast({"n": 1}, project="app", path="src/main.py")
+        manager.broadcast({"n": 2}, project="app", path="docs/readme.md")
+        manager.broadcast({"n": 3}, project="other")
+        await asyncio.sleep(0.05)
+        return all_ws.sent, app_ws.sent
+    all_sent, app_sent = asyncio.run(run())
+    assert all_sent == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert app_sent[0]["type"] == "subscription"
+    assert app_sent[1:] == [{"n": 1}]
+
+def test_slow_client_does_not_block_and_queue_is_bounded():
+    async def run():
+        manager = ConnectionManager(max_queue=3, send_timeout=5)
+        fast, slow = FakeWebSocket(), FakeWebSocket(delay=0.2)
+        await manager.connect(fast)
+        await manager.connect(slow)
+        for n in range(10):
+            manager.broadcast({"n": n})
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        fast_sent = list(fast.sent)
+        await asyncio.sleep(1.2)
+        return fast_sent, slow.sent
+    fast_sent, slow_sent = asyncio.run(run())
+    assert [m["n"] for m in fast_sent] == list(range(10))
+    assert any(m.get("type") == "dropped" for m in slow_sent)
+    assert [m["n"] for m in slow_sent if "n" in m][-3:] == [7, 8, 9]
+
+def test_change_messages_are_merged_when_queue_is_full():
+    async def run():
+        manager = ConnectionManager(max_queue=1, send_timeout=5)
+        ws = FakeWebSocket(delay=0.1)
+        connection = await manager.connect(ws)
+        connection.enqueue({"changes": [{"type": "modified", "path": "/x"}]})
+        await asyncio.sleep(0)
+        connection.enqueue({"changes": [{"type": "created", "path": "/a"}]}, merge_change_messages)
+        connection.enqueue({"changes": [{"type": "modified", "path": "/a"}, {"type": "deleted", "path": "/b"}]}, merge_change_messages)
+        await asyncio.sleep(0.5)
+        return ws.sent
+    sent = asyncio.run(run())
+    assert sent[-1] == {"changes": [{"type": "created", "path": "/a"}, {"type": "deleted", "path": "/b"}]}
+    assert not any(m.get("type") == "dropped" for m in sent)
+
+def test_broadcast_excludes_sender():
+    async def run():
+        manager = ConnectionManager(max_queue=10, send_timeout=1)
+        sender_ws, receiver_ws = FakeWebSocket(), FakeWebSocket()
+        sender = await manager.connect(sender_ws)
+        await manager.connect(receiver_ws)
+        count = manager.broadcast({"type": "grimoire_progress", "file": "a"}, exclude=sender)
+        await asyncio.sleep(0.05)
+        return count, sender_ws.sent, receiver_ws.sent
+    count, sender_sent, receiver_sent = asyncio.run(run())
+    assert count == 1
+    assert sender_sent == []
+    assert receiver_sent == [{"type": "grimoire_progress", "file": "a"}]
+
+def test_invalid_subscription_returns_error():
+    async def run():
+        manager = ConnectionManager(max_queue=10, send_timeout=1)
+        ws = FakeWebSocket()
+        connection = await manager.connect(ws)
+        results = [
+            manager.handle_message(connection, '{"action": "subscribe", "projects": "app"}'),
+            manager.handle_message(connection, '{"action": "subscribe", "paths": [1, 2]}'),
+            manager.handle_message(connection, '{"action": "subscribe", "projects": {"app": true}}'),
+        ]
+        await asyncio.sleep(0.05)
+        return results, ws, connection
+    results, ws, connection = asyncio.run(run())
+    assert results == [True, True, True]
+    assert [message["type"] for message in ws.sent] == ["error", "error", "error"]
+    # 購読は変わらず、接続も切れない
+    assert not connection.projects and not ws.closed
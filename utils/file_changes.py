@@ -0,0 +1,98 @@
+# ファイル変更イベントをパスごとにまとめ、デバウンスして通知するユーティリティ
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 通知対象のイベント種別（opened / closed_no_write などは通知しない）
+_EVENT_TYPES = {"created": "created", "modified": "modified", "deleted": "deleted", "closed": "modified"}
+
+# まとめた結果、変更がなかったことになった場合
+_DROP = object()
+
+def merge_change(previous: Optional[str], current: str):
+    """
+    同じパスに対する2つのイベントを1つにまとめる関数
+
+    - created + modified -> created
+    - created + deleted  -> なし（通知しない）
+    - modified + deleted -> deleted
+    - deleted + created  -> modified
+    """
+    if previous is None:
+        return current
+    if previous == "created":
+        return _DROP if current == "deleted" else "created"
+    if previous == "deleted":
+        return "deleted" if current == "deleted" else "modified"
+    return "deleted" if current == "deleted" else "modified"
+
+class ChangeCoalescer:
+    """
+    ファイル変更イベントをパスごとにまとめ、一定時間新しいイベントが来なくなったら on_flush を呼ぶクラス
+
+    add はイベントループのスレッドから呼ぶ。watchdog のスレッドからは add_threadsafe を使う。
+    イベントが途切れなくても max_delay 秒を超えて通知を遅らせることはない。
+    """
+
+    def __init__(self, on_flush: Callable[[List[Dict]], None], debounce: float, max_delay: float,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.on_flush = on_flush
+        self.debounce = debounce
+        self.max_delay = max(debounce, max_delay)
+        self.loop = loop or asyncio.get_event_loop()
+        self._pending: Dict[str, Dict] = {}
+        self._first_event_at: Optional[float] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def add_threadsafe(self, event_type: str, path: str, is_directory: bool = False):
+        self.loop.call_soon_threadsafe(self.add, event_type, path, is_directory)
+
+    def add(self, event_type: str, path: str, is_directory: bool = False):
+        event_type = _EVENT_TYPES.get(event_type)
+        if event_type is None:
+            return
+        previous = self._pending.get(path)
+        merged = merge_change(previous["type"] if previous else None, event_type)
+        if merged is _DROP:
+            del self._pending[path]
+        else:
+            self._pending[path] = {"type": merged, "path": path, "is_directory": is_directory}
+
+        now = self.loop.time()
+        if self._first_event_at is None:
+            self._first_event_at = now
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self.loop.call_at(min(now + self.debounce, self._first_event_at + self.max_delay), self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._first_event_at = None
+        if not self._pending:
+            return
+        changes = list(self._pending.values())
+        self._pending = {}
+        try:
+            self.on_flush(changes)
+        except Exception as e:
+            logger.error(f"変更通知の処理中にエラーが発生しました: {str(e)}")
+
+def merge_change_messages(queued: Dict, message: Dict) -> Optional[Dict]:
+    """
+    送信待ちの変更通知 {"changes": [...]} に新しい変更通知をまとめる関数（送信キューが満杯のときに使う）
+    """
+    if "changes" not in queued or "changes" not in message:
+        return None
+    pending = {change["path"]: change for change in queued["changes"]}
+    for change in message["changes"]:
+        previous = pending.get(change["path"])
+        merged = merge_change(previous["type"] if previous else None, change["type"])
+        if merged is _DROP:
+            del pending[change["path"]]
+        else:
+            pending[change["path"]] = {**change, "type": merged}
+    return {**queued, "changes": list(pending.values())}
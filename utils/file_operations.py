@@ -1,45 +1,28 @@
-import tempfile
 import os
 import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def execute_python(code: str):
-    logger.info("受信したコードを取得しました")
-    logger.info(f"実行するコード: {code}")
-    
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp_file:
-        temp_file.write(code)
-        temp_file_path = temp_file.name
-        logger.info(f"一時ファイルを作成しました: {temp_file_path}")
-
-    try:
-        logger.info("サブプロセスでPythonコードを実行します")
-        process = await asyncio.create_subprocess_exec(
-            'python', temp_file_path,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode != 0:
-            logger.error(f"実行エラーが発生しました: {stderr.decode()}")
-            return {"error": stderr.decode(), "output": stdout.decode()}
-        
-        logger.info("Pythonコードの実行に成功しました")
-        return {"output": stdout.decode()}
-    except asyncio.TimeoutError:
-        logger.error("実行がタイムアウトしました")
-        return {"error": "実行がタイムアウトしました", "output": ""}
-    finally:
-        os.unlink(temp_file_path)
-        logger.info(f"一時ファイルを削除しました: {temp_file_path}")
-
 # 追記された内容:
 # # ファイル操作ユーティリティ
 # ファイル操作ユーティリティ
 import os
+import functools
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import FILE_IO_WORKERS, FILE_IO_CHUNK_SIZE
+from utils.tree import render_tree
+
+# ファイルI/O専用のスレッドプール（イベントループや既定のスレッドプールを塞がないようにする）
+_io_executor = ThreadPoolExecutor(max_workers=FILE_IO_WORKERS, thread_name_prefix="file-io")
+
+async def run_io(func, *args, **kwargs):
+    """
+    ブロッキングするファイル操作をI/O専用スレッドプールで実行する関数
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(func, *args, **kwargs))
 
 def get_file_size(file_path: str) -> int:
     return os.path.getsize(file_path)
@@ -48,6 +31,21 @@ def ensure_directory_exists(directory: str):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+# mkstemp は 0o600 で作るため、置き換え後のファイルには通常の作成時と同じ権限（umask を反映した 0o666）を付け直す
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def set_replacement_mode(temp_path: str, file_path: str):
+    """
+    一時ファイルで file_path を置き換える前に、一時ファイルの権限を設定する関数
+
+    既存のファイルを上書きする場合はその権限を引き継ぎ、新しく作る場合は通常の作成時と同じ権限にする。
+    """
+    if os.path.exists(file_path):
+        shutil.copymode(file_path, temp_path)
+    else:
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+
 def read_file(file_path: str) -> str:
     """
     ファイルまたはディレクトリの内容を読み取る関数
@@ -60,45 +58,90 @@ def read_file(file_path: str) -> str:
     """
     if os.path.isdir(file_path):
         # ディレクトリの場合、ツリー構造を返す
-        return generate_tree(file_path)
+        return render_tree(file_path)
     elif os.path.isfile(file_path):
-        # ファイルの場合、内容を読み取って返す
+        # ファイルの場合、内容を読み取って返す（大きなファイルの転送は iter_file_chunks を使う）
         with open(file_path, 'r') as file:
             return file.read()
     else:
         # ファイルもディレクトリも存在しない場合
         raise FileNotFoundError(f"指定されたパスが見つかりません: {file_path}")
 
-def generate_tree(directory: str, prefix: str = '') -> str:
-    """
-    ディレクトリのツリー構造を生成する関数
-
-    Args:
-        directory (str): ツリー構造を生成するディレクトリのパス
-        prefix (str): 各行の接頭辞（再帰呼び出し用）
-
-    Returns:
-        str: ディレクトリのツリー構造
-    """
-    tree = []
-    contents = os.listdir(directory)
-    contents.sort()
-    for i, item in enumerate(contents):
-        path = os.path.join(directory, item)
-        if i == len(contents) - 1:
-            tree.append(f"{prefix}└── {item}")
-            if os.path.isdir(path):
-                tree.append(generate_tree(path, prefix + "    "))
-        else:
-            tree.append(f"{prefix}├── {item}")
-            if os.path.isdir(path):
-                tree.append(generate_tree(path, prefix + "│   "))
-    return "\n".join(tree)
+def _write_chunks(file, content):
+    for start in range(0, len(content), FILE_IO_CHUNK_SIZE):
+        file.write(content[start:start + FILE_IO_CHUNK_SIZE])
 
 def write_file(file_path: str, content: str):
     with open(file_path, 'w') as file:
-        file.write(content)
+        _write_chunks(file, content)
 
 def append_to_file(file_path: str, content: str):
     with open(file_path, 'a') as file:
-        file.write(content)
+        _write_chunks(file, content)
+
+def delete_file(file_path: str):
+    os.remove(file_path)
+
+
+class RangeNotSatisfiable(ValueError):
+    """
+    Rangeがファイルサイズを満たせないことを表す例外（416の Content-Range に使うため file_size を持つ）
+    """
+
+    def __init__(self, message: str, file_size: int):
+        super().__init__(message)
+        self.file_size = file_size
+
+def _is_digits(text: str) -> bool:
+    return text.isascii() and text.isdigit()
+
+def parse_range_header(range_header: str, file_size: int):
+    """
+    HTTPのRangeヘッダー（単一範囲のみ）を解析する関数
+
+    構文が不正なRangeは無視して全体を返す（RFC 9110 14.2）。構文は正しいが満たせない範囲の場合のみ 416 にする。
+
+    Returns:
+        tuple: (開始位置, 終了位置) 終了位置を含む。Rangeが無い・複数範囲・構文が不正な場合は None
+    Raises:
+        RangeNotSatisfiable: 範囲がファイルサイズを満たせない場合
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, separator, end_text = range_header[len("bytes="):].strip().partition("-")
+    if not separator or not (start_text or end_text):
+        return None
+    if any(text and not _is_digits(text) for text in (start_text, end_text)):
+        return None
+    if start_text == "":
+        # bytes=-500 は末尾500バイト
+        length = int(end_text)
+        if length == 0:
+            raise RangeNotSatisfiable(f"範囲がファイルサイズを超えています: {range_header}", file_size)
+        start, end = max(0, file_size - length), file_size - 1
+    else:
+        start = int(start_text)
+        end = int(end_text) if end_text else file_size - 1
+        if end_text and end < start:
+            return None
+    end = min(end, file_size - 1)
+    if start >= file_size:
+        raise RangeNotSatisfiable(f"範囲がファイルサイズを超えています: {range_header}", file_size)
+    return start, end
+
+async def iter_file_chunks(file_path: str, start: int, end: int):
+    """
+    ファイルの start から end（含む）までをチャンクごとに返す非同期ジェネレータ
+    """
+    file = await run_io(open, file_path, "rb")
+    try:
+        await run_io(file.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await run_io(file.read, min(FILE_IO_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_io(file.close)
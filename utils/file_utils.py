@@ -3,6 +3,27 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# babel プロジェクトのルート（このリポジトリの1つ上の階層）
+BABEL_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def project_root(project_id: str) -> str:
+    """
+    プロジェクトIDからプロジェクトのルートディレクトリを求める関数
+
+    babel は BABEL_ROOT、それ以外は ~/babel_generated/<project_id>。
+    Raises:
+        ValueError: プロジェクトIDに .. やパスの区切りが含まれる場合
+        FileNotFoundError: プロジェクトのディレクトリが存在しない場合
+    """
+    if project_id == "babel":
+        return BABEL_ROOT
+    if not project_id or ".." in project_id or "/" in project_id or "\\" in project_id:
+        raise ValueError(f"不正なプロジェクトIDです: {project_id}")
+    root = os.path.join(os.path.expanduser("~"), "babel_generated", project_id)
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"プロジェクトが見つかりません: {project_id}")
+    return root
+
 def get_file_path(projectId: str, filename: str, upload_dir: str) -> str:
     """
     projectIdに基づいてファイルパスを決定し、ファイルの存在を確認する関数
@@ -12,7 +33,7 @@ def get_file_path(projectId: str, filename: str, upload_dir: str) -> str:
     if projectId == "babel":
 
         # ファイルパスを1つ上の階層から設定
-        file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), filename)
+        file_path = os.path.join(BABEL_ROOT, filename)
         
 
         logger.info(f"babelプロジェクトのファイルパス: {os.path.abspath(file_path)}")
@@ -0,0 +1,236 @@
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# .gitignoreがなくても常に無視するパターン
+DEFAULT_IGNORE_PATTERNS = ["node_modules", ".git"]
+
+def read_gitignore(path):
+    # .gitignoreファイルを読み込む関数
+    if os.path.exists(path):
+        # ファイルが存在する場合
+        with open(path, 'r') as f:
+            # ファイルを開いて読み込む
+            return [
+                line.strip()  # 各行の前後の空白を削除
+                for line in f
+                if line.strip() and not line.startswith('#')  # 空行とコメント行を除外
+            ]
+    # ファイルが存在しない場合は空のリストを返す
+    return []
+
+def _translate(pattern: str) -> str:
+    """
+    gitignoreのワイルドカードを正規表現に変換する関数
+
+    * と ? は / に一致しない。**/ は0個以上のディレクトリ、末尾の /** は配下すべてに一致する。
+    """
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 2] == '**' and (i == 0 or pattern[i - 1] == '/') and (i + 2 == n or pattern[i + 2] == '/'):
+                if i + 2 == n:
+                    result.append('.*')
+                    i += 2
+                else:
+                    result.append('(?:.*/)?')
+                    i += 3
+                continue
+            while i < n and pattern[i] == '*':
+                i += 1
+            result.append('[^/]*')
+            continue
+        if c == '?':
+            result.append('[^/]')
+        elif c == '[':
+            # [ または [! の直後の ] は閉じ括弧ではなく文字クラスの要素として扱う（gitと同じ）
+            start = i + 2 if pattern[i + 1:i + 2] in ('!', '^') else i + 1
+            end = pattern.find(']', start + 1)
+            if end == -1:
+                # 閉じていない文字クラスの [ はそのままの文字として扱う
+                result.append(re.escape(c))
+            else:
+                negated = start != i + 1
+                members = pattern[start:end].replace('\\', '\\\\').replace('[', '\\[').replace(']', '\\]')
+                result.append('[' + ('^' if negated else '') + members + ']')
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            result.append(re.escape(pattern[i]))
+        else:
+            result.append(re.escape(c))
+        i += 1
+    return ''.join(result)
+
+def _parse_pattern(line: str) -> Optional[Tuple[str, bool, bool]]:
+    """
+    .gitignoreの1行を (正規表現, 否定パターンか, ディレクトリ専用か) に変換する関数
+    """
+    line = line.rstrip('\n').rstrip()
+    if not line or line.startswith('#'):
+        return None
+    negated = line.startswith('!')
+    if negated:
+        line = line[1:]
+    elif line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    # 先頭または途中に / を含むパターンは .gitignore の場所を基準にする
+    if '/' in line:
+        regex = _translate(line.lstrip('/'))
+    else:
+        regex = '(?:.*/)?' + _translate(line)
+    return regex, negated, dir_only
+
+class GitIgnoreRules:
+    """
+    1つの.gitignoreをコンパイルしたもの
+
+    全パターンを1つの正規表現にまとめ、後に書かれたパターンが優先されるように逆順で並べる。
+    ディレクトリ用とファイル用（ディレクトリ専用パターンを除く）の2つを持つ。
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.rules = [rule for rule in (_parse_pattern(p) for p in patterns) if rule]
+        self._dir_regex = self._combine(self.rules, include_dir_only=True)
+        self._file_regex = self._combine(self.rules, include_dir_only=False)
+
+    @staticmethod
+    def _combine(rules, include_dir_only: bool):
+        parts = [
+            f"(?P<r{i}>{regex})"
+            for i, (regex, _, dir_only) in reversed(list(enumerate(rules)))
+            if include_dir_only or not dir_only
+        ]
+        return re.compile('|'.join(parts), re.DOTALL) if parts else None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """
+        True: 無視する / False: 否定パターンで再度含める / None: どのパターンにも一致しない
+        """
+        regex = self._dir_regex if is_dir else self._file_regex
+        if regex is None:
+            return None
+        m = regex.fullmatch(rel_path)
+        if m is None:
+            return None
+        return not self.rules[int(m.lastgroup[1:])][1]
+
+class GitIgnoreMatcher:
+    """
+    プロジェクトルート配下の.gitignore（入れ子を含む）をまとめて判定するクラス
+
+    各ディレクトリの.gitignoreは必要になった時点で読み込み、mtimeが変わった場合のみ作り直す。
+    パスはすべてルートからの相対パス（区切りは /）で扱う。
+    """
+
+    def __init__(self, root: str, default_patterns: Optional[List[str]] = None):
+        self.root = os.path.abspath(root)
+        self._defaults = GitIgnoreRules(DEFAULT_IGNORE_PATTERNS if default_patterns is None else default_patterns)
+        self._rules: Dict[str, Tuple[Optional[float], Optional[GitIgnoreRules]]] = {}
+        self._lock = threading.Lock()
+
+    def _rules_for(self, dir_rel: str) -> Optional[GitIgnoreRules]:
+        with self._lock:
+            cached = self._rules.get(dir_rel)
+            if cached is not None:
+                return cached[1]
+            path = os.path.join(self.root, dir_rel, ".gitignore")
+            try:
+                mtime = os.stat(path).st_mtime
+                rules = GitIgnoreRules(read_gitignore(path))
+            except OSError:
+                mtime, rules = None, None
+            self._rules[dir_rel] = (mtime, rules)
+            return rules
+
+    def invalidate(self, dir_rel: Optional[str] = None):
+        """
+        指定したディレクトリ（省略時はすべて）の.gitignoreを次回読み直すようにする
+        """
+        with self._lock:
+            if dir_rel is None:
+                self._rules.clear()
+            else:
+                self._rules.pop(dir_rel.strip('/'), None)
+
+    def is_stale(self) -> bool:
+        """
+        読み込み済みの.gitignoreが変更・削除されているか、なかったディレクトリに.gitignoreが作られていれば True
+        """
+        with self._lock:
+            # mtime が None のエントリは、確認した時点で.gitignoreがなかったディレクトリ
+            loaded = [(dir_rel, mtime) for dir_rel, (mtime, _) in self._rules.items()]
+        for dir_rel, mtime in loaded:
+            try:
+                if os.stat(os.path.join(self.root, dir_rel, ".gitignore")).st_mtime != mtime:
+                    return True
+            except OSError:
+                if mtime is not None:
+                    return True
+        return False
+
+    def match(self, rel_path: str, is_dir: bool) -> bool:
+        """
+        エントリ自身だけを判定する（親ディレクトリが無視されていないことは呼び出し側で保証する）
+
+        走査中のように親から順にたどる場合はこちらを使う。
+        """
+        rel_path = rel_path.replace(os.sep, '/').strip('/')
+        parts = rel_path.split('/')
+        # 深い場所の.gitignoreほど優先される
+        for depth in range(len(parts) - 1, -1, -1):
+            rules = self._rules_for('/'.join(parts[:depth]))
+            if rules is not None:
+                result = rules.match('/'.join(parts[depth:]), is_dir)
+                if result is not None:
+                    return result
+        return bool(self._defaults.match(rel_path, is_dir))
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        """
+        親ディレクトリも含めて判定する（親が無視されている場合、配下は否定パターンでも含められない）
+        """
+        parts = rel_path.replace(os.sep, '/').strip('/').split('/')
+        for depth in range(1, len(parts)):
+            if self.match('/'.join(parts[:depth]), True):
+                return True
+        return self.match('/'.join(parts), is_dir)
+
+_matchers: Dict[str, GitIgnoreMatcher] = {}
+_matchers_lock = threading.Lock()
+
+def get_gitignore_matcher(root: str) -> GitIgnoreMatcher:
+    """
+    プロジェクトごとにキャッシュされたマッチャーを取得する関数（.gitignoreが変更されていれば作り直す）
+    """
+    abs_root = os.path.abspath(root)
+    with _matchers_lock:
+        matcher = _matchers.get(abs_root)
+        if matcher is None or matcher.is_stale():
+            matcher = GitIgnoreMatcher(abs_root)
+            _matchers[abs_root] = matcher
+        return matcher
+
+@lru_cache(maxsize=128)
+def _compile_patterns(patterns: Tuple[str, ...]) -> GitIgnoreRules:
+    return GitIgnoreRules(DEFAULT_IGNORE_PATTERNS + list(patterns))
+
+def should_ignore(item, gitignore_patterns):
+    """
+    read_gitignore で読み込んだパターンに名前が一致するかを判定する関数
+
+    パターンはコンパイルしてキャッシュする。ディレクトリ専用パターン（末尾 /）も一致として扱う。
+    """
+    if gitignore_patterns is None:
+        return False
+    rules = _compile_patterns(tuple(gitignore_patterns))
+    parts = item.replace(os.sep, '/').strip('/').split('/')
+    return any(rules.match('/'.join(parts[:depth]), True) for depth in range(1, len(parts) + 1))
@@ -0,0 +1,154 @@
+# 行番号でファイルを編集するためのユーティリティ
+import os
+import shutil
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict, defaultdict
+from typing import List, Tuple
+from config.settings import FILE_IO_CHUNK_SIZE
+
+# 行オフセットのキャッシュ件数の上限
+LINE_INDEX_CACHE_SIZE = 64
+
+class LineIndex:
+    """
+    ファイルの各行の開始バイト位置を保持するインデックス
+
+    行番号は1始まり。末尾の改行は行を増やさない（str.splitlines と同じ数え方）。
+    """
+
+    def __init__(self, mtime_ns: int, size: int, offsets: array, newline: bytes, ends_with_newline: bool):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.offsets = offsets
+        self.newline = newline
+        self.ends_with_newline = ends_with_newline
+
+    @property
+    def line_count(self) -> int:
+        return len(self.offsets)
+
+    def line_start(self, line_number: int) -> int:
+        if line_number > self.line_count:
+            return self.size
+        return self.offsets[line_number - 1]
+
+    def line_end(self, line_number: int) -> int:
+        """
+        行の終端（改行を含む）の次のバイト位置
+        """
+        if line_number >= self.line_count:
+            return self.size
+        return self.offsets[line_number]
+
+def build_line_index(file_path: str) -> LineIndex:
+    """
+    ファイルをチャンクごとに走査して行オフセットを作成する関数
+    """
+    stat = os.stat(file_path)
+    offsets = array('q')
+    newline = b"\n"
+    last_byte = b""
+    position = 0
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(FILE_IO_CHUNK_SIZE):
+            if position == 0:
+                offsets.append(0)
+                first = chunk.find(b"\n")
+                if first > 0 and chunk[first - 1:first] == b"\r":
+                    newline = b"\r\n"
+            found = chunk.find(b"\n")
+            while found != -1:
+                offsets.append(position + found + 1)
+                found = chunk.find(b"\n", found + 1)
+            position += len(chunk)
+            last_byte = chunk[-1:]
+    # 末尾の改行の後ろには行がない
+    if offsets and offsets[-1] == position:
+        offsets.pop()
+    return LineIndex(stat.st_mtime_ns, position, offsets, newline, last_byte == b"\n")
+
+_cache: "OrderedDict[str, LineIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+_file_locks = defaultdict(threading.Lock)
+
+def get_line_index(file_path: str) -> LineIndex:
+    """
+    キャッシュ済みの行インデックスを返す関数（mtimeまたはサイズが変わっていれば作り直す）
+    """
+    key = os.path.abspath(file_path)
+    stat = os.stat(key)
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None and index.mtime_ns == stat.st_mtime_ns and index.size == stat.st_size:
+            _cache.move_to_end(key)
+            return index
+    index = build_line_index(key)
+    with _cache_lock:
+        _cache[key] = index
+        _cache.move_to_end(key)
+        while len(_cache) > LINE_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+def _copy_range(source, destination, start: int, end: int):
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = source.read(min(FILE_IO_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        destination.write(chunk)
+        remaining -= len(chunk)
+
+def apply_line_edits(file_path: str, edits: List[Tuple[int, int, List[str]]]):
+    """
+    複数の行範囲の置き換えを1回のアトミックな書き込みで適用する関数
+
+    edits: (開始行, 終了行, 新しい行のリスト) のリスト。行番号は1始まりで終了行を含む。
+        - 終了行 = 開始行 - 1 の場合は開始行の前に挿入する（開始行 = 行数 + 1 で末尾に追加）
+        - 新しい行のリストが空の場合は範囲を削除する
+    変更されない部分は元のファイルからバイト単位でコピーし、一時ファイルをリネームして置き換える。
+    """
+    key = os.path.abspath(file_path)
+    with _file_locks[key]:
+        index = get_line_index(key)
+        ordered = sorted(edits, key=lambda edit: (edit[0], edit[1]))
+        previous_end = 0
+        for start_line, end_line, _ in ordered:
+            if start_line < 1 or start_line > index.line_count + 1:
+                raise ValueError(f"Invalid line number: {start_line}")
+            if end_line < start_line - 1 or end_line > index.line_count:
+                raise ValueError(f"Invalid line range: {start_line}-{end_line}")
+            if start_line <= previous_end:
+                raise ValueError(f"Overlapping line ranges at line {start_line}")
+            previous_end = max(previous_end, end_line)
+
+        directory = os.path.dirname(key)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(key)}.", suffix=".part")
+        try:
+            with open(key, 'rb') as source, os.fdopen(fd, 'wb') as destination:
+                position = 0
+                for start_line, end_line, new_lines in ordered:
+                    start = index.line_start(start_line)
+                    end = index.line_end(end_line) if end_line >= start_line else start
+                    _copy_range(source, destination, position, start)
+                    position = end
+                    if not new_lines:
+                        continue
+                    reaches_eof = end == index.size
+                    if start == index.size and index.size and not index.ends_with_newline:
+                        # 改行で終わっていないファイルの末尾に追加する場合は、元の最終行を終端させる
+                        destination.write(index.newline)
+                    text = index.newline.join(line.encode('utf-8') for line in new_lines)
+                    if not reaches_eof or index.ends_with_newline or not index.size:
+                        text += index.newline
+                    destination.write(text)
+                _copy_range(source, destination, position, index.size)
+            shutil.copymode(key, temp_path)
+            os.replace(temp_path, key)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
@@ -0,0 +1,204 @@
+# ディレクトリのツリー表示
+#
+# プロンプトやファイル読み取りAPIで使うツリー表示を、再帰を使わずにスタックで作る。
+# .gitignore で無視されるフォルダ（node_modules・.git など）と深すぎるフォルダは展開せずにファイル数だけを示し、
+# 1フォルダあたりの件数と全体の行数にも上限を設ける。
+# 結果は表示したフォルダの mtime が変わらない限りキャッシュを返す。
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Tuple
+from config.settings import TREE_MAX_DEPTH, TREE_MAX_ENTRIES, TREE_MAX_CHILDREN, TREE_COUNT_LIMIT
+from utils.gitignore import GitIgnoreMatcher, get_gitignore_matcher
+
+STYLES = ("box", "icons")
+
+# .gitignore に書かれていなくても展開しないフォルダ
+COLLAPSED_DIRS = {"node_modules", ".git", "__pycache__", ".next", "dist", "build", ".venv", "venv"}
+
+# ツリーのキャッシュ件数の上限
+TREE_CACHE_SIZE = 32
+
+@dataclass
+class _Entry:
+    kind: str  # "dir" / "file" / "collapsed"（展開しないフォルダ）/ "more"（上限を超えた残りの件数）
+    name: str
+    path: str = ""
+    rel_path: str = ""
+    count: int = 0
+
+@dataclass
+class _CachedTree:
+    matcher: GitIgnoreMatcher
+    # 表示したフォルダと mtime の組（1つでも変わっていれば作り直す）
+    signature: List[Tuple[str, int]]
+    text: str
+
+_cache: "OrderedDict[tuple, _CachedTree]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _matcher_root(directory: str) -> str:
+    # 親フォルダの .gitignore も効くよう、.git のあるフォルダ（なければ directory 自身）を基準にする
+    current = directory
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return directory
+        current = parent
+
+def count_files(directory: str, limit: int = TREE_COUNT_LIMIT) -> int:
+    """
+    フォルダ配下のファイル数を数える関数（limit に達した時点で打ち切る）
+    """
+    count = 0
+    stack = [directory]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        count += 1
+                        if count >= limit:
+                            return count
+        except OSError:
+            continue
+    return count
+
+def _format_count(count: int, limit: int) -> str:
+    return f"（+{count:,}ファイル以上）" if count >= limit else f"（+{count:,}ファイル）"
+
+class _Renderer:
+    def __init__(self, directory: str, style: str, max_depth: int, max_entries: int, max_children: int, count_limit: int):
+        self.directory = directory
+        self.style = style
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self.max_children = max_children
+        self.count_limit = count_limit
+        root = _matcher_root(directory)
+        self.matcher = get_gitignore_matcher(root)
+        prefix = os.path.relpath(directory, root).replace(os.sep, "/")
+        self.prefix = "" if prefix == "." else prefix + "/"
+        self.signature: List[Tuple[str, int]] = []
+
+    def _children(self, path: str, rel_path: str, depth: int) -> List[_Entry]:
+        try:
+            self.signature.append((path, os.stat(path).st_mtime_ns))
+            with os.scandir(path) as scanner:
+                entries = sorted(scanner, key=lambda entry: entry.name)
+        except OSError:
+            return []
+        children = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            child_rel = f"{rel_path}{entry.name}"
+            ignored = self.matcher.match(self.prefix + child_rel, is_dir)
+            if not is_dir:
+                if not ignored:
+                    children.append(_Entry("file", entry.name))
+                continue
+            if ignored or entry.name in COLLAPSED_DIRS or depth >= self.max_depth:
+                # 展開しないフォルダはファイル数だけを示す（配下の変更は mtime に表れないため、数は多少古い場合がある）
+                try:
+                    self.signature.append((entry.path, entry.stat().st_mtime_ns))
+                except OSError:
+                    continue
+                children.append(_Entry("collapsed", entry.name, entry.path, count=count_files(entry.path, self.count_limit)))
+            else:
+                children.append(_Entry("dir", entry.name, entry.path, child_rel + "/"))
+        if len(children) > self.max_children:
+            rest = len(children) - self.max_children
+            children = children[:self.max_children] + [_Entry("more", "", count=rest)]
+        return children
+
+    def _line(self, entry: _Entry, prefix: str, depth: int, is_last: bool) -> str:
+        if self.style == "box":
+            head = prefix + ("└── " if is_last else "├── ")
+            if entry.kind == "more":
+                return f"{head}… 他{entry.count:,}件"
+            if entry.kind == "collapsed":
+                return f"{head}{entry.name} {_format_count(entry.count, self.count_limit)}"
+            return head + entry.name
+        indent = "    " * (depth - 1)
+        if entry.kind == "more":
+            return f"{indent}… 他{entry.count:,}件"
+        if entry.kind == "collapsed":
+            return f"{indent}📁 {entry.name}/ {_format_count(entry.count, self.count_limit)}"
+        if entry.kind == "dir":
+            return f"{indent}📁 {entry.name}/"
+        return f"{indent}📄 {entry.name}"
+
+    def render(self) -> str:
+        lines: List[str] = []
+        # [子のリスト, 次に表示する位置, 接頭辞, 深さ]
+        stack = [[self._children(self.directory, "", 1), 0, "", 1]]
+        while stack:
+            frame = stack[-1]
+            children, position, prefix, depth = frame
+            if position >= len(children):
+                stack.pop()
+                continue
+            if len(lines) >= self.max_entries:
+                lines.append(f"…（表示の上限 {self.max_entries:,} 行に達したため以降を省略）")
+                break
+            entry = children[position]
+            frame[1] += 1
+            is_last = frame[1] == len(children)
+            lines.append(self._line(entry, prefix, depth, is_last))
+            if entry.kind == "dir":
+                child_prefix = prefix + ("    " if is_last else "│   ")
+                stack.append([self._children(entry.path, entry.rel_path, depth + 1), 0, child_prefix, depth + 1])
+        return "\n".join(lines)
+
+def _changed_dirs(cached: _CachedTree) -> List[str]:
+    changed = []
+    for path, mtime_ns in cached.signature:
+        try:
+            if os.stat(path).st_mtime_ns != mtime_ns:
+                changed.append(path)
+        except OSError:
+            changed.append(path)
+    return changed
+
+def render_tree(directory: str, style: str = "box", max_depth: int = TREE_MAX_DEPTH,
+                max_entries: int = TREE_MAX_ENTRIES, max_children: int = TREE_MAX_CHILDREN,
+                count_limit: int = TREE_COUNT_LIMIT) -> str:
+    """
+    ディレクトリのツリー表示を返す関数（ブロッキング）
+
+    style:
+        box:   ├── / └── の罫線で表す（ファイル読み取りAPI用）
+        icons: 📁 / 📄 と4文字の字下げで表す（プロンプト用）
+    .gitignore で無視されるフォルダと max_depth より深いフォルダは展開せず、配下のファイル数（count_limit まで）を示す。
+    無視されるファイルは表示しない。1フォルダあたり max_children 件、全体で max_entries 行を超える分は省略する。
+    表示したフォルダの mtime と .gitignore が変わっていなければ、前回の結果を返す。
+    """
+    if style not in STYLES:
+        raise ValueError(f"不明な表示形式です: {style}")
+    directory = os.path.abspath(directory)
+    key = (directory, style, max_depth, max_entries, max_children, count_limit)
+    matcher = get_gitignore_matcher(_matcher_root(directory))
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        if cached.matcher is matcher and not _changed_dirs(cached):
+            with _cache_lock:
+                if key in _cache:
+                    _cache.move_to_end(key)
+            return cached.text
+    renderer = _Renderer(directory, style, max_depth, max_entries, max_children, count_limit)
+    text = renderer.render()
+    with _cache_lock:
+        _cache[key] = _CachedTree(renderer.matcher, renderer.signature, text)
+        _cache.move_to_end(key)
+        while len(_cache) > TREE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return text
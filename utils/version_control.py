@@ -1,21 +1,157 @@
 import asyncio
-from services.git_service import git_add, git_commit
+import logging
+import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from config.settings import VERSION_CONTROL_BATCH_WINDOW
+from services.git_service import GitRepositoryNotFound, get_repo_root, git_add, git_commit, git_has_staged_changes
+from utils.file_operations import run_io
+
+logger = logging.getLogger(__name__)
+
+# 相対パスが作業ディレクトリに存在しない場合の基準ディレクトリ（ai_service が扱うパスの基準と同じ）
+GENERATED_ROOT = os.path.join(os.path.expanduser("~"), "babel_generated")
+
+# リポジトリごとのロック（git add と git commit を同時に実行しない）
+_repo_locks: Dict[str, asyncio.Lock] = {}
+# 実行中の commit_batch（multi_ai_* などの複数ファイル操作の間だけ設定される）
+_current_batch: ContextVar[Optional["CommitBatch"]] = ContextVar("current_commit_batch", default=None)
+# 時間でまとめている途中のバッチとコミット完了を通知するFuture
+_window: Optional[Tuple["CommitBatch", asyncio.Future]] = None
+_flush_tasks = set()
+
+def _repo_lock(repo_root: str) -> asyncio.Lock:
+    lock = _repo_locks.get(repo_root)
+    if lock is None:
+        lock = asyncio.Lock()
+        _repo_locks[repo_root] = lock
+    return lock
+
+def _resolve_file(file_path: str) -> str:
+    if os.path.isabs(file_path) or os.path.lexists(file_path):
+        return os.path.abspath(file_path)
+    return os.path.join(GENERATED_ROOT, file_path)
+
+def _group_by_repo(file_paths: List[str]) -> Dict[str, List[str]]:
+    """
+    ファイルをリポジトリごとに分ける（リポジトリに属さないファイルは除外する）
+    """
+    groups: Dict[str, List[str]] = {}
+    for file_path in file_paths:
+        full_path = _resolve_file(file_path)
+        try:
+            groups.setdefault(get_repo_root(full_path), []).append(file_path)
+        except GitRepositoryNotFound:
+            logger.warning(f"Gitリポジトリに含まれないためバージョン管理をスキップします: {file_path}")
+    return groups
+
+class CommitBatch:
+    """
+    1つのコミットにまとめるファイル変更の集まり
+
+    異なるリポジトリのファイルが含まれる場合は、リポジトリごとに1つずつコミットする。
+    """
+
+    def __init__(self):
+        # ファイルパス -> 実行された操作（記録順）
+        self.changes: Dict[str, List[str]] = {}
+
+    def add(self, file_path: str, operation: str):
+        operations = self.changes.setdefault(file_path, [])
+        if operation not in operations:
+            operations.append(operation)
+
+    def message(self, file_paths: List[str]) -> str:
+        operations = list(dict.fromkeys(op for path in file_paths for op in self.changes[path]))
+        if len(file_paths) == 1:
+            return f"AI {', '.join(operations)} on {file_paths[0]}"
+        lines = [f"AI {', '.join(operations)} on {len(file_paths)} files", ""]
+        lines += [f"- {file_path}" for file_path in file_paths]
+        return "\n".join(lines)
+
+    async def commit(self):
+        """
+        まとめた変更をリポジトリごとに1回のインデックス更新と1回のコミットで記録する（リポジトリごとに直列化）
+        """
+        if not self.changes:
+            return
+        groups = await run_io(_group_by_repo, list(self.changes))
+        for repo_root, file_paths in groups.items():
+            full_paths = [_resolve_file(file_path) for file_path in file_paths]
+            async with _repo_lock(repo_root):
+                await git_add(repo_root, full_paths)
+                if not await git_has_staged_changes(repo_root, full_paths):
+                    logger.info(f"コミットする変更がないためスキップします: {repo_root}")
+                    continue
+                message = self.message(file_paths)
+                await git_commit(repo_root, message)
+                logger.info(f"Version control: {message.splitlines()[0]}")
+
+@asynccontextmanager
+async def commit_batch():
+    """
+    ブロック内で記録された変更を、ブロックを抜けるときに1つのコミットにまとめる
+
+    使い方:
+        async with commit_batch():
+            await asyncio.gather(*(ai_analyze(path, True, ...) for path in paths))
+    入れ子にした場合は外側のバッチにまとめる。
+    """
+    batch = _current_batch.get()
+    if batch is not None:
+        yield batch
+        return
+    batch = CommitBatch()
+    token = _current_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _current_batch.reset(token)
+        try:
+            await batch.commit()
+        except Exception as e:
+            logger.error(f"Error in version control: {str(e)}")
+
+async def _flush_window():
+    global _window
+    (batch, future), _window = _window, None
+    try:
+        await batch.commit()
+        future.set_result(None)
+    except Exception as e:
+        future.set_exception(e)
+
+def _schedule_flush():
+    task = asyncio.get_running_loop().create_task(_flush_window())
+    _flush_tasks.add(task)
+    task.add_done_callback(_flush_tasks.discard)
 
 async def version_control(file_path: str, operation: str):
     """
     ファイルの変更をバージョン管理システム（Git）に記録します。
-    
+
+    commit_batch の中で呼ばれた場合はそのバッチに追加するだけで、コミットはバッチの終了時に行います。
+    それ以外の場合は VERSION_CONTROL_BATCH_WINDOW 秒の間に記録された変更をまとめてコミットし、
+    コミットが終わるまで待ちます。
+
     :param file_path: バージョン管理対象のファイルパス
     :param operation: 実行された操作の説明
     """
+    batch = _current_batch.get()
+    if batch is not None:
+        batch.add(file_path, operation)
+        return
+
+    global _window
     try:
-        repo_path = '.'  # リポジトリのルートパスを指定。必要に応じて変更してください。
-        await git_add(repo_path, file_path)
-        commit_message = f"AI {operation} on {file_path}"
-        await git_commit(repo_path, commit_message)
-        print(f"Version control: {commit_message}")
+        window = _window
+        if window is None:
+            loop = asyncio.get_running_loop()
+            window = _window = (CommitBatch(), loop.create_future())
+            loop.call_later(VERSION_CONTROL_BATCH_WINDOW, _schedule_flush)
+        window[0].add(file_path, operation)
+        await asyncio.shield(window[1])
     except Exception as e:
-        print(f"Error in version control: {str(e)}")
+        logger.error(f"Error in version control: {str(e)}")
         # エラーが発生しても処理を続行するため、例外は再発生させません
-
-# 必要に応じて、他のバージョン管理関連の関数をここに追加できます
\ No newline at end of file
@@ -0,0 +1,179 @@
+# WebSocketクライアントごとの送信キューと購読を管理するユーティリティ
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from fastapi import WebSocket
+from config.settings import WS_CLIENT_QUEUE_SIZE, WS_SEND_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# (キュー内の古いメッセージ, 新しいメッセージ) -> まとめたメッセージ（まとめられない場合は None）
+MergeFunc = Callable[[Dict[str, Any], Dict[str, Any]], Optional[Dict[str, Any]]]
+
+class ClientConnection:
+    """
+    1つのWebSocket接続
+
+    送信はキューに積むだけで、実際の送信は接続ごとの書き込みタスクが行う。
+    キューがいっぱいの場合は、まとめられるメッセージはまとめ、まとめられなければ最も古いメッセージを捨てる。
+    捨てた件数は次の送信の前に {"type": "dropped", "count": n} で通知する。
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, send_timeout: float):
+        self.websocket = websocket
+        self.max_queue = max(1, max_queue)
+        self.send_timeout = send_timeout
+        self.projects: set = set()
+        self.path_prefixes: List[str] = []
+        self.dropped = 0
+        self.closed = False
+        self._queue: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def wants(self, project: Optional[str] = None, path: Optional[str] = None) -> bool:
+        """
+        購読条件に一致するかを判定する（購読していない場合はすべて受け取る）
+        """
+        if self.projects and project is not None and project not in self.projects:
+            return False
+        if self.path_prefixes and path is not None:
+            return any(path == prefix or path.startswith(prefix.rstrip('/') + '/') for prefix in self.path_prefixes)
+        return True
+
+    def subscribe(self, projects: Iterable[str] = (), paths: Iterable[str] = ()):
+        self.projects.update(projects)
+        self.path_prefixes.extend(path.strip('/') for path in paths if path.strip('/'))
+
+    def unsubscribe(self):
+        self.projects.clear()
+        self.path_prefixes.clear()
+
+    def enqueue(self, message: Dict[str, Any], merge: Optional[MergeFunc] = None):
+        if self.closed:
+            return
+        if len(self._queue) >= self.max_queue:
+            merged = merge(self._queue[-1], message) if merge else None
+            if merged is not None:
+                self._queue[-1] = merged
+                return
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(message)
+        self._wakeup.set()
+
+    async def _send(self, message: Dict[str, Any]):
+        await asyncio.wait_for(self.websocket.send_json(message), timeout=self.send_timeout)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._queue:
+                    if self.dropped:
+                        dropped, self.dropped = self.dropped, 0
+                        await self._send({"type": "dropped", "count": dropped})
+                    await self._send(self._queue.popleft())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"クライアントへの送信に失敗したため切断します: {self.websocket.client} - {type(e).__name__}: {str(e)}")
+            self.closed = True
+            try:
+                await self.websocket.close()
+            except Exception:
+                pass
+
+    async def close(self):
+        self.closed = True
+        self._queue.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+
+class ConnectionManager:
+    """
+    WebSocket接続の一覧を管理し、購読条件に合う接続にだけメッセージを配信するクラス
+
+    クライアントは次のメッセージで購読するプロジェクトやパスを指定できる。
+      {"action": "subscribe", "projects": ["my-app"], "paths": ["src/components"]}
+      {"action": "unsubscribe"}
+    """
+
+    def __init__(self, max_queue: int = WS_CLIENT_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.connections: set = set()
+
+    def __len__(self):
+        return len(self.connections)
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(websocket, self.max_queue, self.send_timeout)
+        connection.start()
+        self.connections.add(connection)
+        return connection
+
+    async def disconnect(self, connection: ClientConnection):
+        self.connections.discard(connection)
+        await connection.close()
+
+    def handle_message(self, connection: ClientConnection, text: str) -> bool:
+        """
+        クライアントからの購読メッセージを処理する（購読メッセージでなければ False）
+        """
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return False
+        if not isinstance(data, dict):
+            return False
+        action = data.get("action")
+        if action == "subscribe":
+            projects, paths = data.get("projects") or [], data.get("paths") or []
+            if not all(isinstance(value, list) and all(isinstance(item, str) for item in value)
+                       for value in (projects, paths)):
+                # 不正な購読メッセージでは接続を切らず、エラーを返して現在の購読を維持する
+                connection.enqueue({"type": "error", "message": "projects と paths は文字列のリストで指定してください"})
+                return True
+            connection.subscribe(projects, paths)
+        elif action == "unsubscribe":
+            connection.unsubscribe()
+        else:
+            return False
+        connection.enqueue({
+            "type": "subscription",
+            "projects": sorted(connection.projects),
+            "paths": list(connection.path_prefixes),
+        })
+        return True
+
+    def broadcast(self, message: Dict[str, Any], project: Optional[str] = None, path: Optional[str] = None,
+                  merge: Optional[MergeFunc] = None, exclude: Optional[ClientConnection] = None) -> int:
+        """
+        購読条件に合う接続の送信キューにメッセージを積む（送信の完了は待たない）
+
+        exclude を指定した場合、その接続（メッセージの送信元など）には送らない。
+
+        Returns:
+            int: キューに積んだ接続数
+        """
+        count = 0
+        for connection in list(self.connections):
+            if connection.closed:
+                self.connections.discard(connection)
+                continue
+            if connection is not exclude and connection.wants(project, path):
+                connection.enqueue(message, merge)
+                count += 1
+        return count